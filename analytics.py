@@ -0,0 +1,245 @@
+import logging
+import os
+import tempfile
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+ANALYTICS_DIR = "analytics"
+# Past this many small append files the admin panel suggests compacting
+COMPACT_AFTER_PARTS = 200
+# Rows per part file when rebuilding from a full history
+REBUILD_BATCH_ROWS = 50000
+
+FACT_COLUMNS = ["inspection_id", "version", "building", "inspection_type", "inspection_date",
+                "category", "item", "level"]
+
+if PYARROW_AVAILABLE:
+    FACT_SCHEMA = pa.schema([
+        ("inspection_id", pa.string()),
+        ("version", pa.int32()),
+        ("building", pa.string()),
+        ("inspection_type", pa.string()),
+        ("inspection_date", pa.date32()),
+        ("category", pa.string()),
+        ("item", pa.string()),
+        ("level", pa.int8()),
+    ])
+
+
+def parse_level(rating):
+    """1-5 for a "Level N" rating, None when unrated"""
+    if isinstance(rating, str) and rating.startswith("Level "):
+        try:
+            level = int(rating.split(" ")[1])
+        except (ValueError, IndexError):
+            return None
+        return level if 1 <= level <= 5 else None
+    return None
+
+
+def _as_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    try:
+        return date.fromisoformat(str(value)[:10])
+    except ValueError:
+        return None
+
+
+TERMS = ["Spring", "Summer", "Fall"]
+
+
+def semesters(dates):
+    """Academic term ("Spring 2025", "Summer 2025", "Fall 2025") for a Series of dates.
+
+    The result is an ordered categorical in calendar order, so groupbys and
+    pivots list terms chronologically rather than alphabetically.
+    """
+    dates = pd.to_datetime(dates)
+    term = pd.Series(np.select([dates.dt.month <= 5, dates.dt.month <= 7], [0, 1], 2), index=dates.index)
+    year = dates.dt.year.astype("Int64")
+    labels = term.map(dict(enumerate(TERMS))) + " " + year.astype(str)
+    order = (pd.DataFrame({"label": labels, "key": year * len(TERMS) + term})
+               .dropna().drop_duplicates("label").sort_values("key")["label"])
+    return pd.Series(pd.Categorical(labels, categories=list(order), ordered=True), index=dates.index)
+
+
+class ItemFacts:
+    """Append-only Parquet fact table with one row per rated checklist item.
+
+    Every save appends the inspection's full item list as a new version, so
+    edits and removed items need no rewrite; readers keep only the latest
+    version of each inspection. Appends are written as small part files on
+    a background thread, off the save path; compact() merges them and is
+    run from the admin panel, never from a save.
+    """
+
+    def __init__(self, root=ANALYTICS_DIR):
+        self.root = root
+        self.lock = threading.Lock()
+        os.makedirs(self.root, exist_ok=True)
+        # One writer keeps appends in save order
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="item-facts")
+        self._stats_lock = threading.Lock()
+        self._stats = {'appended': 0, 'failed': 0, 'last_error': None}
+
+    def parts(self):
+        return sorted(entry.name for entry in os.scandir(self.root)
+                      if entry.name.endswith(".parquet") and not entry.name.startswith("."))
+
+    def _write_part(self, rows):
+        """Write rows (tuples in FACT_COLUMNS order) as one part file, atomically"""
+        columns = list(zip(*rows))
+        table = pa.Table.from_arrays([pa.array(list(values), type=field.type) for values, field in zip(columns, FACT_SCHEMA)],
+                                     schema=FACT_SCHEMA)
+        name = f"part-{datetime.now().strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:12]}.parquet"
+        # Dot-prefixed while being written so readers skip it
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, prefix=".", suffix=".tmp")
+        os.close(fd)
+        try:
+            pq.write_table(table, tmp_path)
+            os.replace(tmp_path, os.path.join(self.root, name))
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return name
+
+    def append(self, inspection_id, version, building, inspection_type, inspection_date, items):
+        """Queue one saved inspection for the table; items are (category, item, rating, ...) tuples.
+
+        Returns at once. A failed write is logged and counted in stats(), and
+        rebuilding the table fills the gap. Returns False when pyarrow is missing.
+        """
+        if not PYARROW_AVAILABLE:
+            return False
+        items = [tuple(entry[:3]) for entry in items]
+        self.executor.submit(self._append, inspection_id, version, building, inspection_type, inspection_date, items)
+        return True
+
+    def _append(self, inspection_id, version, building, inspection_type, inspection_date, items):
+        try:
+            inspection_date = _as_date(inspection_date)
+            rows = [(str(inspection_id), int(version), building, inspection_type, inspection_date,
+                     category or "", item, parse_level(rating)) for category, item, rating in items]
+            if rows:
+                self._write_part(rows)
+            with self._stats_lock:
+                self._stats['appended'] += 1
+        except Exception as e:
+            logger.exception("Could not append inspection %s to the item fact table", inspection_id)
+            with self._stats_lock:
+                self._stats['failed'] += 1
+                self._stats['last_error'] = f"{inspection_id}: {e}"
+
+    def stats(self):
+        """Append counts and last failure for this process, plus the current number of part files"""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats['parts'] = len(self.parts())
+        stats['needs_compaction'] = stats['parts'] > COMPACT_AFTER_PARTS
+        return stats
+
+    def compact(self):
+        """Merge all part files into one, dropping superseded versions"""
+        if not PYARROW_AVAILABLE:
+            return 0
+        with self.lock:
+            parts = self.parts()
+            if len(parts) < 2:
+                return len(parts)
+            df = _latest(pq.read_table([os.path.join(self.root, p) for p in parts], schema=FACT_SCHEMA).to_pandas())
+            # Nullable so unrated items survive the round trip through pandas
+            df["level"] = df["level"].astype("Int8")
+            table = pa.Table.from_pandas(df[FACT_COLUMNS], schema=FACT_SCHEMA, preserve_index=False)
+            fd, tmp_path = tempfile.mkstemp(dir=self.root, prefix=".", suffix=".tmp")
+            os.close(fd)
+            pq.write_table(table, tmp_path)
+            os.replace(tmp_path, os.path.join(self.root, f"compacted-{uuid.uuid4().hex[:12]}.parquet"))
+            for part in parts:
+                os.remove(os.path.join(self.root, part))
+            return 1
+
+    def rebuild(self, rows):
+        """Replace the table with rows from a full history, written in bounded batches.
+
+        rows yields tuples in FACT_COLUMNS order with the raw rating in place
+        of the level. Returns the number of rows written.
+        """
+        if not PYARROW_AVAILABLE:
+            return 0
+        with self.lock:
+            old_parts = self.parts()
+            batch, count = [], 0
+            for row in rows:
+                batch.append(tuple(row[:4]) + (_as_date(row[4]), row[5] or "", row[6], parse_level(row[7])))
+                if len(batch) >= REBUILD_BATCH_ROWS:
+                    self._write_part(batch)
+                    count += len(batch)
+                    batch = []
+            if batch:
+                self._write_part(batch)
+                count += len(batch)
+            for part in old_parts:
+                os.remove(os.path.join(self.root, part))
+        return count
+
+    def facts(self):
+        """Current item facts as a DataFrame (latest version of each inspection only)"""
+        if not PYARROW_AVAILABLE:
+            return pd.DataFrame(columns=FACT_COLUMNS)
+        # The part list changes on every append, so it doubles as the cache key
+        return _cached_facts(self.root, tuple(self.parts()))
+
+    def average_level(self, by=("building", "item", "semester"), building=None, inspection_type=None):
+        """Mean level and number of rated items per group, e.g. per item per hall per semester"""
+        df = self.facts()
+        if building:
+            df = df[df["building"] == building]
+        if inspection_type:
+            df = df[df["inspection_type"] == inspection_type]
+        df = df[df["level"].notna()]
+        if "semester" in by:
+            df = df.assign(semester=semesters(df["inspection_date"]))
+        return (df.groupby(list(by), observed=True)["level"]
+                  .agg(average_level="mean", rated_items="count")
+                  .reset_index())
+
+
+def _latest(df):
+    # Part files can overlap after an interrupted compaction, hence the de-duplication
+    df = df.drop_duplicates(["inspection_id", "version", "category", "item"])
+    return df[df["version"] == df.groupby("inspection_id")["version"].transform("max")]
+
+
+@st.cache_data(max_entries=4, show_spinner=False)
+def _cached_facts(root, parts):
+    if not parts:
+        return pd.DataFrame(columns=FACT_COLUMNS)
+    df = pq.read_table([os.path.join(root, p) for p in parts], schema=FACT_SCHEMA).to_pandas()
+    df = _latest(df).reset_index(drop=True)
+    for column in ("building", "inspection_type", "category", "item"):
+        df[column] = df[column].astype("category")
+    return df
+
+
+@st.cache_resource(show_spinner=False)
+def get_item_facts(root=ANALYTICS_DIR):
+    return ItemFacts(root)
@@ -1,49 +1,358 @@
+# --- Database connection ---
+import os
+from datetime import date
+from itertools import islice
+from psycopg2.extras import execute_values
+from analytics import get_item_facts
+from checklists import get_checklist, get_checklists
+from db_pool import CountingCursor, get_conn, pool_stats
+from report_utils import BUNDLE_DIR, PYPDF_AVAILABLE, bundle_pdfs, export_pdfs, format_items_table, prune_bundles
+from inspection_search import count_inspections, search_inspections
+from inspection_stats import StatsDelta, TOTAL, get_stats, refresh_stats
+from jobs import DONE, FAILED, QUEUED, RUNNING, job_handler, job_result, job_status, recent_jobs, submit_job
+from photo_store import get_photo_store, prune_unreferenced, read_photo, store_photos
+from report_cache import cache_metrics, findings_key, lookup_report, store_report
+from reference_data import get_buildings, get_inspectors, invalidate_reference_data, record_reference_data
+from schema import ensure_schema
+from widget_registry import clear_form_state, widget_key
+
+# Ensure Streamlit is imported before any usage
+import streamlit as st
+
+ensure_schema()
+
 # --- Load Inspection Details ---
-def load_inspection(inspection_id):
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT id, building, inspector, inspection_type, inspection_date FROM inspections WHERE id = %s", (inspection_id,))
-    row = cur.fetchone()
+def load_inspection(inspection_id, include_photos=True):
+    """Load an inspection with its items and photos in two set-based queries.
+
+    With include_photos=False only photo ids are returned (item["photo_ids"]),
+    so callers that don't display photos never pull the blobs; use
+    load_photos() to fetch them on demand.
+    """
+    with get_conn() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT i.id, i.building, i.inspector, i.inspection_type, i.inspection_date, i.ai_report, i.version,
+                   i.checklist_version, ii.id, ii.category, ii.item, ii.rating, ii.notes, ii.checklist_item_id
+            FROM inspections i
+            LEFT JOIN inspection_items ii ON ii.inspection_id = i.id
+            WHERE i.id = %s
+            ORDER BY ii.id
+        """, (inspection_id,))
+        rows = cur.fetchall()
+        item_ids = [r[8] for r in rows if r[8] is not None]
+        photos_by_item = {}
+        if item_ids:
+            # Legacy rows keep their bytes in the photo column; newer ones only a blob store hash
+            photo_column = "photo" if include_photos else "NULL"
+            cur.execute(
+                f"SELECT id, inspection_item_id, sha256, {photo_column} FROM inspection_item_photos "
+                "WHERE inspection_item_id = ANY(%s) AND (sha256 IS NOT NULL OR photo IS NOT NULL) ORDER BY id",
+                (item_ids,))
+            for photo_id, item_id, digest, photo in cur.fetchall():
+                photos_by_item.setdefault(item_id, []).append((photo_id, digest, photo))
+        cur.close()
+    if not rows:
+        return {}, []
+    row = rows[0]
     inspection = {
         "id": row[0],
         "building": row[1],
         "inspector": row[2],
         "inspection_type": row[3],
-        "inspection_date": row[4]
-    } if row else {}
-    cur.execute("SELECT id, category, item, rating, notes FROM inspection_items WHERE inspection_id = %s", (inspection_id,))
+        "inspection_date": row[4],
+        "ai_report": row[5],
+        "version": row[6],
+        "checklist_version": row[7]
+    }
     items = []
-    for r in cur.fetchall():
-        item_id, category, item, rating, notes = r
-        # Fetch all photos for this item
-        cur.execute("SELECT photo FROM inspection_item_photos WHERE inspection_item_id = %s", (item_id,))
-        photos = [p[0] for p in cur.fetchall() if p[0]]
+    for r in rows:
+        item_id, category, item, rating, notes, checklist_item_id = r[8:]
+        if item_id is None:
+            continue
+        item_photos = photos_by_item.get(item_id, [])
         items.append({
+            "id": item_id,
+            "checklist_item_id": checklist_item_id,
             "category": category,
             "item": item,
             "rating": rating,
             "notes": notes,
-            "photos": photos
+            "photo_ids": [photo_id for photo_id, _, _ in item_photos],
+            "photos": [read_photo(digest) if digest else bytes(photo) for _, digest, photo in item_photos] if include_photos else []
         })
-    cur.close()
-    conn.close()
     return inspection, items
-# --- Database connection ---
-import psycopg2
-from datetime import date
-from report_utils import format_items_table, generate_pdf_report
-def get_conn():
-    db = st.secrets["database"]
-    return psycopg2.connect(
-        dbname=db["NEON_DB_NAME"],
-        user=db["NEON_DB_USER"],
-        password=db["NEON_DB_PASSWORD"],
-        host=db["NEON_DB_HOST"],
-        port=db["NEON_DB_PORT"]
-    )
 
-# Ensure Streamlit is imported before any usage
-import streamlit as st
+def search_page(page_key, container=st, **filters):
+    """Current page of inspections for one search UI, with Newer/Older buttons.
+
+    The stack of keyset cursors is kept in session state under page_key
+    and resets to the first page whenever the filters change.
+    """
+    cursors_key = f"_{page_key}_cursors"
+    filters_key = f"_{page_key}_filters"
+    if st.session_state.get(filters_key) != filters or cursors_key not in st.session_state:
+        st.session_state[filters_key] = filters
+        st.session_state[cursors_key] = [None]
+    cursors = st.session_state[cursors_key]
+    rows, next_cursor = search_inspections(after=cursors[-1], **filters)
+    container.caption(f"Page {len(cursors)} of results · {count_inspections(**filters)} matching inspection(s)")
+    col_newer, col_older = container.columns(2)
+    if col_newer.button("Newer", key=f"{page_key}_newer", disabled=len(cursors) == 1):
+        cursors.pop()
+        st.rerun()
+    if col_older.button("Older", key=f"{page_key}_older", disabled=next_cursor is None):
+        cursors.append(next_cursor)
+        st.rerun()
+    return rows
+
+def load_photos(photo_ids, variant="full"):
+    """Fetch photo bytes for the given ids in one query, keyed by id.
+
+    variant="thumb" returns thumbnails where one was generated.
+    """
+    if not photo_ids:
+        return {}
+    digest_column = "COALESCE(thumb_sha256, sha256)" if variant == "thumb" else "sha256"
+    with get_conn() as conn:
+        cur = conn.cursor()
+        cur.execute(f"SELECT id, {digest_column}, CASE WHEN sha256 IS NULL THEN photo END FROM inspection_item_photos WHERE id = ANY(%s)", (list(photo_ids),))
+        rows = cur.fetchall()
+        cur.close()
+    return {photo_id: read_photo(digest) if digest else bytes(photo) for photo_id, digest, photo in rows if digest or photo}
+
+def load_inspections_for_export(inspection_ids=None, building=None, date_from=None, date_to=None):
+    """Inspections with their items for PDF export, in two queries, oldest first"""
+    clauses, params = [], []
+    if inspection_ids is not None:
+        clauses.append("id = ANY(%s)")
+        params.append(list(inspection_ids))
+    if building:
+        clauses.append("building = %s")
+        params.append(building)
+    if date_from:
+        clauses.append("inspection_date >= %s")
+        params.append(date_from)
+    if date_to:
+        clauses.append("inspection_date <= %s")
+        params.append(date_to)
+    query = "SELECT id, version, building, inspection_date, inspector, inspection_type, ai_report FROM inspections"
+    if clauses:
+        query += " WHERE " + " AND ".join(clauses)
+    with get_conn() as conn:
+        cur = conn.cursor()
+        cur.execute(query + " ORDER BY inspection_date, id", params)
+        keys = ("id", "version", "building", "inspection_date", "inspector", "inspection_type", "ai_report")
+        inspections = [dict(zip(keys, row), items=[]) for row in cur.fetchall()]
+        by_id = {i["id"]: i for i in inspections}
+        if by_id:
+            cur.execute("""
+                SELECT inspection_id, category, item, rating, notes FROM inspection_items
+                WHERE inspection_id = ANY(%s) ORDER BY id
+            """, (list(by_id),))
+            for inspection_id, category, item, rating, notes in cur.fetchall():
+                by_id[inspection_id]["items"].append((category, item, rating, notes))
+        cur.close()
+    return inspections
+
+# --- Background jobs ---
+def job_findings(findings):
+    """Findings made JSON-safe for a job: saved photo ids stay ids, new captures go to the blob store by hash"""
+    store = get_photo_store()
+    refs = []
+    for category, item, rating, notes, photos in findings:
+        if not isinstance(photos, (list, tuple)):
+            photos = [photos] if photos else []
+        refs.append([category, item, rating, notes, [
+            photo if isinstance(photo, (int, str)) else store.put(photo.getvalue()) for photo in photos if photo
+        ]])
+    return refs
+
+MAX_PHOTOS_PER_ITEM = 5
+
+def item_photo_controls(checklist_item, widget_suffix, saved_ids=()):
+    """Photo controls for one checklist item inside a form.
+
+    A camera widget exists only for the item the inspector is adding a
+    photo to. Captures are parked in the blob store and tracked by hash in
+    session state, so the form carries no camera widgets otherwise.
+    Returns the saved photo ids followed by the new photo hashes.
+    """
+    item_id, item = checklist_item.id, checklist_item.name
+    attached = st.session_state.setdefault(widget_key(widget_suffix, f"_attached_photos{widget_suffix}"), {})
+    target_key = widget_key(widget_suffix, f"_photo_target{widget_suffix}")
+    digests = attached.get(item_id, [])
+    camera_key = f"item{item_id}_camera{widget_suffix}_{len(digests)}"
+    captured = st.session_state.get(camera_key)
+    if captured:
+        digests = attached.setdefault(item_id, digests)
+        digests.append(get_photo_store().put(captured.getvalue()))
+        st.session_state[target_key] = None
+    count = len(saved_ids) + len(digests)
+    col_add, col_remove = st.columns([1, 1])
+    adding = st.session_state.get(target_key) == item_id
+    if not adding and count < MAX_PHOTOS_PER_ITEM:
+        with col_add:
+            adding = st.form_submit_button("📷 Add photo", key=f"item{item_id}_add_photo{widget_suffix}")
+        if adding:
+            st.session_state[target_key] = item_id
+    if digests:
+        with col_remove:
+            if st.form_submit_button("Remove new photos", key=f"item{item_id}_remove_photos{widget_suffix}"):
+                attached.pop(item_id, None)
+                count = len(saved_ids)
+                digests = []
+    if count:
+        st.caption(f"{count} of {MAX_PHOTOS_PER_ITEM} photo(s) attached" + (f" ({len(saved_ids)} saved)" if saved_ids else ""))
+    if adding:
+        st.camera_input(f"Photo for {item}", key=widget_key(widget_suffix, f"item{item_id}_camera{widget_suffix}_{len(digests)}"))
+        st.form_submit_button("Attach photo", key=f"item{item_id}_attach_photo{widget_suffix}")
+    return list(saved_ids) + list(digests)
+
+@job_handler("ai_report")
+def run_ai_report_job(params, progress):
+    """Caption photos and stream an AI report into the job output"""
+    findings = [
+        (category, item, rating, notes, [ref if isinstance(ref, int) else read_photo(ref) for ref in refs])
+        for category, item, rating, notes, refs in params["findings"]
+    ]
+    progress(0.1, "Captioning photos and analysing findings")
+    chunks = []
+    for chunk in stream_ai_report(params["inspection_type"], params["building"], findings):
+        if not chunks:
+            progress(0.5, "Writing report")
+        chunks.append(chunk)
+        progress(0.5, output="".join(chunks))
+    return "".join(chunks)
+
+@job_handler("inspection_pdf")
+def run_pdf_job(params, progress):
+    """Render one saved inspection as a PDF (served from the export cache when unchanged)"""
+    inspections = load_inspections_for_export([params["inspection_id"]])
+    if not inspections:
+        raise ValueError("Inspection not found.")
+    progress(0.3, "Rendering PDF")
+    with open(export_pdfs(inspections)[0], 'rb') as f:
+        return f.read()
+
+@job_handler("pdf_batch")
+def run_pdf_batch_job(params, progress):
+    """Export every matching inspection to PDF and bundle them into one zip (or merged PDF) on disk"""
+    inspections = load_inspections_for_export(
+        building=params.get("building"), date_from=params.get("date_from"), date_to=params.get("date_to"))
+    if not inspections:
+        raise ValueError("No inspections match the selected filters.")
+    paths = export_pdfs(inspections, progress=lambda done, total: progress(
+        0.9 * done / total, f"Rendered {done} of {total} report(s)"))
+    progress(0.95, "Bundling")
+    prune_bundles()
+    names = [
+        f"{i['inspection_date'] or 'undated'}_{i['building']}_{i['inspection_type']}_{i['id']}.pdf".replace(" ", "_").replace("/", "-")
+        for i in inspections
+    ]
+    label = "_".join(str(params.get(k) or "all") for k in ("building", "date_from", "date_to")).replace(" ", "_").replace("/", "-")
+    merge = bool(params.get("merge"))
+    dest = bundle_pdfs(list(zip(paths, names)), os.path.join(BUNDLE_DIR, f"inspections_{label}.{'pdf' if merge else 'zip'}"),
+                       merge=merge)
+    return {"path": dest, "count": len(inspections), "merge": merge}
+
+# How often a fragment checks on a queued or running job
+JOB_POLL_SECONDS = 1
+
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def job_progress(job_id, show_output=False):
+    """Poll a queued or running job; reruns the page once it finishes so the result renders without polling"""
+    status = job_status(job_id)
+    if status is None or status["status"] not in (QUEUED, RUNNING):
+        st.rerun()
+    st.progress(status["progress"], text=status["message"] or "Waiting for a worker...")
+    if show_output and status["output"]:
+        st.markdown(status["output"])
+
+@job_handler("compact_item_facts")
+def run_compact_item_facts_job(params, progress):
+    """Merge the analytics table's small part files into one"""
+    progress(0.1, "Compacting analytics")
+    get_item_facts().compact()
+    return get_item_facts().stats()
+
+def render_ai_report_job():
+    """Show the form's AI report once its job has finished; never waits on a running job"""
+    job_id = st.session_state.get("ai_report_job")
+    if not job_id:
+        return
+    status = job_status(job_id)
+    if status is None or status["status"] == FAILED:
+        st.error(f"AI report failed: {status['error']}" if status else "The AI report job no longer exists.")
+        del st.session_state["ai_report_job"]
+    elif status["status"] == DONE:
+        st.markdown('<div class="ai-report-area">', unsafe_allow_html=True)
+        st.markdown(status["output"] or "")
+        st.markdown('</div>', unsafe_allow_html=True)
+    else:
+        st.caption("The AI report is being written below the form.")
+
+def ai_report_job_progress():
+    """Stream a running AI report from a fragment (outside the form, which can't host one)"""
+    job_id = st.session_state.get("ai_report_job")
+    status = job_status(job_id) if job_id else None
+    if status and status["status"] in (QUEUED, RUNNING):
+        job_progress(job_id, show_output=True)
+
+def pdf_job_panel(inspection_id):
+    """Prepare a PDF in the background and offer it for download once ready"""
+    key = f"pdf_job_{inspection_id}"
+    job_id = st.session_state.get(key)
+    pdf = st.session_state.get(f"{key}_pdf")
+    if pdf is None and job_id:
+        status = job_status(job_id)
+        if status and status["status"] in (QUEUED, RUNNING):
+            job_progress(job_id)
+            return
+        if status and status["status"] == DONE:
+            # Fetched once; later reruns reuse the bytes instead of reading the job row again
+            pdf = st.session_state[f"{key}_pdf"] = job_result(job_id)
+        elif status:
+            st.error(f"PDF generation failed: {status['error']}")
+    if pdf is not None:
+        st.download_button("Download PDF", pdf, file_name=f"inspection_{inspection_id}.pdf",
+                           mime="application/pdf", key=f"download_pdf_{inspection_id}")
+    elif st.button("Prepare PDF", key=f"prepare_pdf_{inspection_id}"):
+        st.session_state[key] = submit_job("inspection_pdf", {"inspection_id": inspection_id},
+                                           owner=st.session_state.get("user_email"))
+        st.rerun()
+
+def pdf_batch_panel(buildings):
+    """Month-end export: every inspection in a date range as one zip of PDFs (or one merged PDF)"""
+    building = st.selectbox("Building", ["All"] + buildings, key="pdf_batch_building")
+    today = date.today()
+    date_range = st.date_input("Inspection dates", value=(today.replace(day=1), today), key="pdf_batch_dates")
+    merge = st.checkbox("Merge into a single PDF", key="pdf_batch_merge", disabled=not PYPDF_AVAILABLE,
+                        help=None if PYPDF_AVAILABLE else "Requires pypdf")
+    job_id = st.session_state.get("pdf_batch_job")
+    status = job_status(job_id) if job_id else None
+    if status and status["status"] in (QUEUED, RUNNING):
+        job_progress(job_id)
+        return
+    if status and status["status"] == FAILED:
+        st.error(f"Export failed: {status['error']}")
+    if status and status["status"] == DONE:
+        result = job_result(job_id)
+        if os.path.exists(result["path"]):
+            with open(result["path"], 'rb') as f:
+                st.download_button(f"Download {result['count']} report(s)", f, file_name=os.path.basename(result["path"]),
+                                   mime="application/pdf" if result.get("merge") else "application/zip",
+                                   key="download_pdf_batch")
+        else:
+            st.caption("The last export has expired; run it again to download it.")
+    if st.button("Export PDFs", key="start_pdf_batch") and len(date_range) == 2:
+        st.session_state["pdf_batch_job"] = submit_job("pdf_batch", {
+            "building": building if building != "All" else None,
+            "date_from": date_range[0].isoformat(),
+            "date_to": date_range[1].isoformat(),
+            "merge": merge,
+        }, owner=st.session_state.get("user_email"))
+        st.rerun()
 
 def inject_custom_css():
     st.markdown(
@@ -82,13 +391,12 @@ if "app_state" not in st.session_state or st.session_state.get("app_state") == "
             # Replace with your authentication logic
             if email and password:
                 # Check if user is admin
-                conn = get_conn()
-                cur = conn.cursor()
-                cur.execute("SELECT is_admin FROM users WHERE email = %s", (email,))
-                row = cur.fetchone()
-                is_admin = bool(row[0]) if row else False
-                cur.close()
-                conn.close()
+                with get_conn() as conn:
+                    cur = conn.cursor()
+                    cur.execute("SELECT is_admin FROM users WHERE email = %s", (email,))
+                    row = cur.fetchone()
+                    is_admin = bool(row[0]) if row else False
+                    cur.close()
                 st.session_state["user_email"] = email
                 st.session_state["is_admin"] = is_admin
                 st.session_state["app_state"] = "home"
@@ -112,37 +420,23 @@ if st.session_state.get("app_state") == "view_reports":
     )
     inject_custom_css()
     # Show filters and list of reports
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT DISTINCT building FROM inspections ORDER BY building")
-    buildings = [row[0] for row in cur.fetchall() if row[0]]
-    cur.execute("SELECT DISTINCT inspector FROM inspections WHERE inspector IS NOT NULL AND inspector <> '' ORDER BY inspector")
-    inspectors = [row[0] for row in cur.fetchall() if row[0]]
+    buildings = get_buildings()
+    with st.expander("Batch PDF export"):
+        pdf_batch_panel(buildings)
+    inspectors = get_inspectors()
     building_filter = st.selectbox("Building", ["All"] + buildings)
     inspector_filter = st.selectbox("Inspector", ["All"] + inspectors)
     inspection_types = ["All", "Custodial", "Maintenance", "Grounds"]
     inspection_type_filter = st.selectbox("Inspection Type", inspection_types)
     date_filter = st.date_input("Date", value=None)
-    # Query inspections with filters
-    query = "SELECT id, building, inspection_date, inspector, inspection_type FROM inspections WHERE 1=1"
-    params = []
-    if building_filter != "All":
-        query += " AND building = %s"
-        params.append(building_filter)
-    if inspector_filter != "All":
-        query += " AND inspector ILIKE %s"
-        params.append(inspector_filter)
-    if inspection_type_filter != "All":
-        query += " AND inspection_type = %s"
-        params.append(inspection_type_filter)
-    if date_filter:
-        query += " AND inspection_date = %s"
-        params.append(date_filter)
-    query += " ORDER BY inspection_date DESC LIMIT 20"
-    cur.execute(query, params)
-    rows = cur.fetchall()
-    cur.close()
-    conn.close()
+    # Query inspections with filters, one keyset page at a time
+    rows = search_page(
+        "view_reports",
+        building=building_filter if building_filter != "All" else None,
+        inspector=inspector_filter if inspector_filter != "All" else None,
+        inspection_type=inspection_type_filter if inspection_type_filter != "All" else None,
+        date_filter=date_filter
+    )
     if not rows:
         st.info("No inspections found for selected filters.")
     else:
@@ -151,84 +445,76 @@ if st.session_state.get("app_state") == "view_reports":
         selected_report_id = report_options[selected_label]
         st.session_state["selected_report_id"] = selected_report_id
         # Show inspection items table before AI summary
-        inspection, items = load_inspection(selected_report_id)
+        inspection, items = load_inspection(selected_report_id, include_photos=False)
         items_table = [(i['category'], i['item'], i['rating'], i['notes']) for i in items]
         if items_table:
             st.markdown("#### Inspection Items Table:")
-            st.markdown(format_items_table(items_table), unsafe_allow_html=True)
+            format_items_table(items_table, version_key=(selected_report_id, inspection["version"]))
         else:
             st.info("No inspection items found for this report.")
+        photo_ids = [photo_id for i in items for photo_id in i['photo_ids']]
+        if photo_ids and st.checkbox(f"Show photos ({len(photo_ids)})", key=f"show_photos_{selected_report_id}"):
+            photos = load_photos(photo_ids, variant="thumb")
+            for i in items:
+                for photo_id in i['photo_ids']:
+                    if photo_id in photos:
+                        st.image(photos[photo_id], caption=f"{i['category']} - {i['item']}")
         # Show report details
-        conn = get_conn()
-        cur = conn.cursor()
-        ai_report = None
-        try:
-            cur.execute("SELECT ai_report FROM inspections WHERE id = %s", (selected_report_id,))
-            ai_row = cur.fetchone()
-            if ai_row and ai_row[0] is not None:
-                ai_report = ai_row[0]
-        except Exception:
-            ai_report = None
+        ai_report = inspection.get("ai_report")
         st.markdown("#### AI Summary:")
         if ai_report:
             st.markdown(ai_report)
         else:
             st.info("No AI summary available for this inspection.")
         st.markdown("---")
+        pdf_job_panel(selected_report_id)
         st.info("To print or save this report, use your browser's Print function (Ctrl+P or File > Print). All details including the AI summary and tables will be included.")
-        cur.close()
-        conn.close()
-import requests
 
 # Gemini Pro Vision image analysis
 import base64
 import streamlit as st
-import requests
-import io
+from concurrent.futures import ThreadPoolExecutor, wait
+from image_pipeline import process_photo
+from gemini_client import DEFAULT_BASE_URL, GeminiClient, GeminiError, extract_text
 
 # Load Gemini API key from Streamlit secrets
 GEMINI_API_KEY = st.secrets["api"]["gemini_api_key"] if "api" in st.secrets and "gemini_api_key" in st.secrets["api"] else None
 
-def call_gemini_vision_api(image_bytes, model_name="models/gemini-1.5-pro-vision-latest"):
-    if not GEMINI_API_KEY:
-        return "Gemini Vision API key not configured."
-    url = f"https://generativelanguage.googleapis.com/v1beta/{model_name}:generateContent?key={GEMINI_API_KEY}"
+@st.cache_resource(show_spinner=False)
+def get_gemini_client():
+    """Gemini client shared by every session; [api] secrets can point it at the local stub"""
+    config = st.secrets.get("api", {})
+    return GeminiClient(
+        GEMINI_API_KEY,
+        base_url=config.get("gemini_base_url", DEFAULT_BASE_URL),
+        requests_per_minute=int(config.get("gemini_requests_per_minute", 60)),
+        burst=int(config.get("gemini_burst", 5)),
+        max_retries=int(config.get("gemini_max_retries", 3)),
+    )
+
+def call_gemini_vision_api(image_bytes, model_name="models/gemini-1.5-pro-vision-latest", mime_type=None, timeout=30):
+    """Caption a photo; raw captures are downscaled first so the upload stays small"""
+    if mime_type is None:
+        image_bytes, mime_type, _, _ = process_photo(image_bytes)["full"]
     # Encode image as base64
     b64_image = base64.b64encode(image_bytes).decode("utf-8")
     payload = {
         "contents": [
             {
                 "parts": [
-                    {"inline_data": {"mime_type": "image/png", "data": b64_image}}
+                    {"text": "Briefly describe the condition of the facility shown in this inspection photo."},
+                    {"inline_data": {"mime_type": mime_type, "data": b64_image}}
                 ]
             }
         ]
     }
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT DISTINCT building FROM inspections ORDER BY building")
-    buildings = [row[0] for row in cur.fetchall() if row[0]]
-    cur.close()
-    conn.close()
-    return buildings
-
-def get_inspectors():
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT DISTINCT inspector FROM inspections WHERE inspector IS NOT NULL AND inspector <> '' ORDER BY inspector")
-    inspectors = [row[0] for row in cur.fetchall() if row[0]]
-    cur.close()
-    conn.close()
-    return inspectors
-
-def call_gemini_api(prompt, model_name=None):
-    """Call Gemini API for AI analysis"""
-    if not GEMINI_API_KEY:
-        return "Gemini API key not configured."
-    if not model_name:
-        model_name = "models/gemini-2.5-flash"
-    url = f"https://generativelanguage.googleapis.com/v1beta/{model_name}:generateContent?key={GEMINI_API_KEY}"
-    payload = {
+    result = get_gemini_client().generate_content(model_name, payload, timeout=timeout)
+    return extract_text(result) or "No caption returned."
+
+GEMINI_MODEL = "models/gemini-2.5-flash"
+
+def _report_payload(prompt):
+    return {
         "contents": [{"parts": [{"text": prompt}]}],
         "generationConfig": {
             "temperature": 0.7,
@@ -236,23 +522,39 @@ def call_gemini_api(prompt, model_name=None):
             "topP": 0.9
         }
     }
-    try:
-        response = requests.post(url, json=payload, timeout=30)
-        if response.ok:
-            result = response.json()
-            candidate = result.get('candidates', [{}])[0]
-            if candidate.get('finishReason') == 'SAFETY':
-                return "Response was blocked for safety reasons. Please try rephrasing your request."
-            content = candidate.get('content', {}).get('parts', [{}])[0].get('text', '')
-            if candidate.get('finishReason') == 'MAX_TOKENS' and content:
-                content += "\n\n[Note: Response was truncated. Consider running analysis again.]"
-            return content or "Could not generate response."
+
+def stream_gemini_api(prompt, model_name=None):
+    """Call Gemini API for AI analysis, yielding the response text as it is generated"""
+    return get_gemini_client().stream_content(model_name or GEMINI_MODEL, _report_payload(prompt), timeout=30)
+
+# Captioning runs on a bounded thread pool; the deadline caps the whole stage
+CAPTION_CONCURRENCY = 4
+CAPTION_TIMEOUT_SECONDS = 30
+CAPTION_DEADLINE_SECONDS = 45
+
+def caption_photos(photos, max_workers=CAPTION_CONCURRENCY, deadline=CAPTION_DEADLINE_SECONDS):
+    """Caption photos concurrently, returning captions in input order.
+
+    Each call gets CAPTION_TIMEOUT_SECONDS; anything that fails or is still
+    running when the overall deadline passes comes back as None, so the
+    stage takes as long as the slowest caption rather than the sum.
+    """
+    if not photos:
+        return []
+    executor = ThreadPoolExecutor(max_workers=min(max_workers, len(photos)), thread_name_prefix="caption")
+    futures = [
+        executor.submit(call_gemini_vision_api, photo, timeout=CAPTION_TIMEOUT_SECONDS) if photo else None
+        for photo in photos
+    ]
+    wait([f for f in futures if f], timeout=deadline)
+    captions = []
+    for future in futures:
+        if future is None or not future.done() or future.exception():
+            captions.append(None)
         else:
-            return f"API Error: {response.status_code} - {response.text}"
-    except requests.exceptions.Timeout:
-        return "Request timed out. Please try again."
-    except Exception as e:
-        return f"Error calling AI service: {str(e)}"
+            captions.append(future.result())
+    executor.shutdown(wait=False, cancel_futures=True)
+    return captions
 
 def generate_comprehensive_report(inspection_type, building, findings):
     """Generate comprehensive APPA report prompt"""
@@ -260,6 +562,7 @@ def generate_comprehensive_report(inspection_type, building, findings):
         return "Please complete some checklist items before generating a report."
     level_counts = {1: 0, 2: 0, 3: 0, 4: 0, 5: 0}
     all_findings_text = []
+    caption_slots = []
     for category, item, rating, notes, photo in findings:
         if rating and rating != "Select":
             try:
@@ -271,19 +574,54 @@ def generate_comprehensive_report(inspection_type, building, findings):
                 finding_text = f"- {item}: Level {rating_num}"
                 if notes.strip():
                     finding_text += f" (Inspector Notes: {notes})"
+                # Items may carry a list of photos; the first one is captioned
+                if isinstance(photo, (list, tuple)):
+                    photo = photo[0] if photo else None
+                if isinstance(photo, str):
+                    photo = read_photo(photo)
                 if photo:
-                    # Get image caption from Gemini Vision
-                    try:
-                        photo_bytes = photo.getvalue()
-                        caption = call_gemini_vision_api(photo_bytes)
-                        finding_text += f" (Photo: {caption})"
-                    except Exception as e:
-                        finding_text += " (Photo attached, caption error)"
+                    caption_slots.append((len(all_findings_text), photo))
                 all_findings_text.append(finding_text)
+    # Get image captions from Gemini Vision concurrently, then attach them in order
+    saved = load_photos([photo for _, photo in caption_slots if isinstance(photo, int)])
+    captions = caption_photos([
+        saved.get(photo) if isinstance(photo, int) else photo if isinstance(photo, bytes) else photo.getvalue()
+        for _, photo in caption_slots
+    ])
+    for (index, _), caption in zip(caption_slots, captions):
+        if caption:
+            all_findings_text[index] += f" (Photo: {caption})"
+        else:
+            all_findings_text[index] += " (Photo attached, caption error)"
     findings_text = "\n".join(all_findings_text)
     prompt = f"""You are a facilities management expert analyzing {inspection_type.lower()} inspection data for {building} using APPA standards.\n\n**INSPECTION SUMMARY:**\n• Level 1: {level_counts[1]} items\n• Level 2: {level_counts[2]} items\n• Level 3: {level_counts[3]} items\n• Level 4: {level_counts[4]} items\n• Level 5: {level_counts[5]} items\n\n**DETAILED FINDINGS:**\n{findings_text}\n\n**PROVIDE CONCISE ANALYSIS:**\n\n**OVERALL APPA LEVEL:** [Assign 1-5 with 2-sentence justification]\n\n**STRENGTHS:** [List 2-3 key Level 1-2 achievements]\n\n**URGENT ISSUES:** [List Level 4-5 items requiring immediate action]\n\n**ACTION PLAN:** [3-4 specific, prioritized recommendations]\n\n**MANAGEMENT ASSESSMENT:** [Brief comment on facility management effectiveness]\n\nKeep response under 400 words. Focus on actionable insights and APPA compliance."""
     return prompt
 
+def stream_ai_report(inspection_type, building, findings):
+    """AI report for a set of findings, yielded in chunks as it is generated.
+
+    Served whole from the report cache when unchanged; a newly generated report
+    is cached once complete. Failures raise GeminiError and are never cached.
+    """
+    key = findings_key(inspection_type, building, findings, GEMINI_MODEL)
+    report = lookup_report(key)
+    if report is not None:
+        yield report
+        return
+    prompt = generate_comprehensive_report(inspection_type, building, findings)
+    chunks = []
+    for chunk in stream_gemini_api(prompt, model_name=GEMINI_MODEL):
+        chunks.append(chunk)
+        yield chunk
+    report = "".join(chunks)
+    if not report:
+        raise GeminiError("Could not generate response.")
+    store_report(key, inspection_type, GEMINI_MODEL, report)
+
+def cached_ai_report(inspection_type, building, findings):
+    """Report already generated for exactly these findings, if any (no API call)"""
+    return lookup_report(findings_key(inspection_type, building, findings, GEMINI_MODEL), record_hit=False)
+
 def convert_markdown_to_html(text):
     """Convert basic markdown formatting to HTML for emails"""
     if not text:
@@ -300,166 +638,97 @@ def convert_markdown_to_html(text):
     return text
 import streamlit as st
 edit_id = st.session_state.get("edit_id")
-def clear_checklist_widget_state(checklist_data):
-    for category, items in checklist_data.items():
-        for item in items:
-            rating_key = f"{category}_{item}_rating"
-            notes_key = f"{category}_{item}_notes"
-            if rating_key in st.session_state:
-                del st.session_state[rating_key]
-            if notes_key in st.session_state:
-                del st.session_state[notes_key]
-
-import psycopg2
-from datetime import date
-
-# --- Database connection ---
-def get_conn():
-    db = st.secrets["database"]
-    return psycopg2.connect(
-        dbname=db["NEON_DB_NAME"],
-        user=db["NEON_DB_USER"],
-        password=db["NEON_DB_PASSWORD"],
-        host=db["NEON_DB_HOST"],
-        port=db["NEON_DB_PORT"]
-    )
-
 # --- Data Model ---
-def get_buildings():
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT DISTINCT building FROM inspections ORDER BY building")
-    buildings = [row[0] for row in cur.fetchall() if row[0]]
-    cur.close()
-    conn.close()
-    return buildings
-
-def get_inspectors():
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT DISTINCT inspector FROM inspections WHERE inspector IS NOT NULL AND inspector <> '' ORDER BY inspector")
-    inspectors = [row[0] for row in cur.fetchall() if row[0]]
-    cur.close()
-    conn.close()
-    return inspectors
-    cur = conn.cursor()
-    cur.execute("SELECT DISTINCT inspector FROM inspections WHERE inspector IS NOT NULL AND inspector <> '' ORDER BY inspector")
-    inspectors = [row[0] for row in cur.fetchall() if row[0]]
-    cur.close()
-    conn.close()
-    return inspectors
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT DISTINCT building FROM inspections ORDER BY building")
-    buildings = [row[0] for row in cur.fetchall() if row[0]]
-    cur.close()
-    conn.close()
-    return buildings
-
 BUILDINGS = get_buildings()
-INSPECTION_TYPES = ["Custodial", "Maintenance", "Grounds"]
-CUSTODIAL_DATA = {
-    "Common Areas (Lobbies, Hallways, Lounges)": [
-        "Flooring (Hard Surface)", "Flooring (Carpet/Rugs)", "Walls & Baseboards",
-        "Entrances & Glass", "Furniture & Upholstery", "Lighting Fixtures",
-        "Trash & Recycling Bins", "Drinking Fountains", "Odor Control"
-    ],
-    "Restrooms (Common/Public)": [
-        "Floors & Drains", "Toilets & Urinals", "Sinks & Countertops",
-        "Mirrors & Dispensers", "Stall Partitions", "Trash Receptacles", "Ventilation & Odor"
-    ],
-    "Ancillary Spaces (Kitchens, Laundry, Study Rooms)": [
-        "Flooring", "Countertops & Sinks", "Appliances (Exterior)",
-        "Laundry Machines (Exterior)", "Furniture (Tables/Chairs)", "Trash & Recycling Bins"
-    ]
-}
-MAINTENANCE_DATA = {
-    "Building Exterior & Envelope": [
-        "Foundation & Walls", "Windows & Seals", "Doors & Hardware", "Roof & Gutters", "Walkways & Stairs", "Exterior Lighting"
-    ],
-    "Interior Common Areas (Lobbies, Hallways, Stairs)": [
-        "Flooring Condition", "Wall & Ceiling Condition", "Paint Condition", "Doors & Hardware", "Handrails & Guardrails", "Lighting (Functionality)", "HVAC Vents & Grilles", "Fire & Life Safety"
-    ],
-    "Building Systems (General Observations)": [
-        "HVAC Operation", "Plumbing (Public Areas)", "Electrical (Outlets/Switches)", "Elevator Operation"
-    ],
-    "Apartments/Dorms (Sample Inspection)": [
-        "Door & Lockset", "Paint & Wall Condition", "Flooring Condition", "Windows & Blinds", "Plumbing Fixtures", "Appliances (If applicable)", "Lighting & Electrical"
-    ]
-}
-GROUNDS_DATA = {
-    "Landscaping (Seasonal)": [
-        "Turf & Lawn Health", "Edging (Walks, Curbs)", "Plant Beds & Mulch", "Trees & Shrubs Pruning", "Weed Control", "Litter & Debris Removal"
-    ],
-    "Hardscapes & Site Amenities": [
-        "Walkways & Patios Condition", "Benches & Site Furniture", "Trash & Ash Receptacles", "Bike Racks", "Signage"
-    ],
-    "Snow & Ice Removal (Seasonal)": [
-        "Walkway & Sidewalk Clarity", "Entrances & ADA Ramps", "Stairs & Landings", "De-Icing Application", "Snow Pile Placement"
-    ]
-}
-
-# --- Load Inspections ---
-def fetch_inspections(building=None, inspector=None, date_filter=None):
-    conn = get_conn()
-    cur = conn.cursor()
-    query = "SELECT id, building, inspection_date, inspector FROM inspections WHERE 1=1"
-    params = []
-    query += " ORDER BY inspection_date DESC LIMIT 20"
-    cur.execute(query, params)
-    rows = cur.fetchall()
-    cur.close()
-    conn.close()
-    return rows
+INSPECTION_TYPES = list(get_checklists())
 
 
 
 
 
-# --- Load Inspection Details ---
-def load_inspection(inspection_id):
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT id, building, inspector, inspection_type, inspection_date FROM inspections WHERE id = %s", (inspection_id,))
-    row = cur.fetchone()
-    inspection = {
-        "id": row[0],
-        "building": row[1],
-        "inspector": row[2],
-        "inspection_type": row[3],
-        "inspection_date": row[4]
-    } if row else {}
-    cur.execute("SELECT id, category, item, rating, notes FROM inspection_items WHERE inspection_id = %s", (inspection_id,))
-    items = []
-    for r in cur.fetchall():
-        item_id, category, item, rating, notes = r
-        # Fetch all photos for this item
-        cur.execute("SELECT photo FROM inspection_item_photos WHERE inspection_item_id = %s", (item_id,))
-        photos = [p[0] for p in cur.fetchall() if p[0]]
-        items.append({
-            "category": category,
-            "item": item,
-            "rating": rating,
-            "notes": notes,
-            "photos": photos
-        })
-    cur.close()
-    conn.close()
-    return inspection, items
 
 # --- Save/Update Inspection ---
+def migrate_photos_to_store(batch_size=50):
+    """Move legacy bytea photos into the blob store; returns how many rows were moved"""
+    moved = 0
+    while True:
+        with get_conn() as conn:
+            cur = conn.cursor()
+            cur.execute("SELECT id, photo FROM inspection_item_photos WHERE sha256 IS NULL AND photo IS NOT NULL ORDER BY id LIMIT %s", (batch_size,))
+            rows = cur.fetchall()
+            cur.close()
+        if not rows:
+            return moved
+        # Processed with no connection held; the update only claims rows nobody migrated meanwhile
+        stored_photos = store_photos([bytes(photo) for _, photo in rows])
+        with get_conn() as conn:
+            cur = conn.cursor()
+            execute_values(cur, """
+                UPDATE inspection_item_photos AS t
+                SET sha256 = v.sha256, size_bytes = v.size_bytes, width = v.width, height = v.height,
+                    mime_type = v.mime_type, thumb_sha256 = v.thumb_sha256, photo = NULL
+                FROM (VALUES %s) AS v(id, sha256, size_bytes, width, height, mime_type, thumb_sha256)
+                WHERE t.id = v.id AND t.sha256 IS NULL
+            """, [(photo_id,) + meta for (photo_id, _), meta in zip(rows, stored_photos)])
+            moved += cur.rowcount
+            cur.close()
+
+def rebuild_item_facts():
+    """Rewrite the analytics fact table from the database; returns how many item rows it holds"""
+    with get_conn() as conn:
+        # Named cursor so the history is streamed rather than fetched at once
+        cur = conn.cursor(name="item_facts_rebuild")
+        cur.itersize = 5000
+        cur.execute("""
+            SELECT i.id::text, i.version, i.building, i.inspection_type, i.inspection_date, ii.category, ii.item, ii.rating
+            FROM inspections i JOIN inspection_items ii ON ii.inspection_id = i.id
+        """)
+        count = get_item_facts().rebuild(cur)
+        cur.close()
+    return count
+
+def prune_photo_store():
+    """Remove blobs that no photo row references any more"""
+    with get_conn() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT sha256 FROM inspection_item_photos WHERE sha256 IS NOT NULL
+            UNION SELECT thumb_sha256 FROM inspection_item_photos WHERE thumb_sha256 IS NOT NULL
+        """)
+        referenced = [row[0] for row in cur.fetchall()]
+        cur.close()
+    return prune_unreferenced(referenced)
+
+def _split_photos(photo_list):
+    """Separate ids of already-saved photos from newly captured uploads"""
+    kept_ids, new_photos = [], []
+    for photo in photo_list or []:
+        if isinstance(photo, int):
+            kept_ids.append(photo)
+        elif isinstance(photo, str):
+            # Attached in the form and parked in the blob store by hash
+            new_photos.append(read_photo(photo))
+        elif photo:
+            new_photos.append(photo.getvalue())
+    return kept_ids, new_photos
+
+def _item_key(checklist_item_id, category, item):
+    """Diff key for an inspection item: its checklist item id, or its names for legacy rows without one"""
+    return ("id", checklist_item_id) if checklist_item_id else ("name", category or "", item)
+
 def save_inspection(data, items, edit_id=None):
-    conn = get_conn()
-    cur = conn.cursor()
-    if edit_id:
-        cur.execute("UPDATE inspections SET building=%s, inspection_date=%s, inspector=%s, inspection_type=%s WHERE id=%s",
-            (data["building"], data["inspection_date"], data["inspector"], data["inspection_type"], edit_id))
-        cur.execute("DELETE FROM inspection_items WHERE inspection_id=%s", (edit_id,))
-        inspection_id = edit_id
-    else:
-        cur.execute("INSERT INTO inspections (building, inspection_date, inspector, inspection_type) VALUES (%s, %s, %s, %s) RETURNING id",
-            (data["building"], data["inspection_date"], data["inspector"], data["inspection_type"]))
-        inspection_id = cur.fetchone()[0]
+    """Save an inspection in one transaction, writing only what changed.
+
+    Each entry of items is (category, item, rating, notes[, photos]) where
+    photos may mix saved photo ids (kept as-is) and new camera captures.
+    On edit the stored items are diffed against the submitted ones, matched
+    by checklist item id (names only for legacy rows without one), so
+    unchanged rows and existing photos are left alone; inserts, updates
+    and deletes are each sent as a single batched statement.
+    """
+    # An edit keeps the checklist version the inspection was recorded with
+    checklist = get_checklist(data["inspection_type"], data.get("checklist_version"))
+    parsed, new_photos = [], []
     for item_tuple in items:
         # Support multiple photos (last element is a list)
         if len(item_tuple) == 5:
@@ -467,28 +736,126 @@ def save_inspection(data, items, edit_id=None):
         else:
             category, item, rating, notes = item_tuple
             photo_list = []
-        # Always save category, even if blank
-        cur.execute("INSERT INTO inspection_items (inspection_id, category, item, rating, notes) VALUES (%s, %s, %s, %s, %s) RETURNING id",
-            (inspection_id, category if category else "", item, rating, notes))
-        item_id = cur.fetchone()[0]
-        # Save each photo in inspection_item_photos
-        for photo in photo_list:
-            if photo:
-                cur.execute("INSERT INTO inspection_item_photos (inspection_item_id, photo) VALUES (%s, %s)", (item_id, photo.getvalue()))
-    conn.commit()
-    cur.close()
-    conn.close()
+        kept_ids, photos = _split_photos(photo_list)
+        parsed.append((category, item, rating, notes, kept_ids, len(photos)))
+        new_photos.extend(photos)
+    # Photos are resized and thumbnailed in the ingest process pool and written to the blob
+    # store before the transaction opens, so no row lock or pooled connection waits on them
+    stored_photos = iter(store_photos(new_photos))
+    with get_conn() as conn:
+        cur = conn.cursor(cursor_factory=CountingCursor)
+        stored = {}
+        stats = StatsDelta()
+        if edit_id:
+            # Self-join so RETURNING sees the pre-update building and type for the counters
+            # A missing ai_report keeps the stored one here; it is cleared below if the items changed
+            cur.execute("""
+                UPDATE inspections i SET building=%s, inspection_date=%s, inspector=%s, inspection_type=%s,
+                    ai_report=COALESCE(%s, old.ai_report), version=old.version + 1, checklist_version=%s
+                FROM inspections old WHERE i.id=%s AND old.id = i.id
+                RETURNING old.building, old.inspection_type, i.version
+            """, (data["building"], data["inspection_date"], data["inspector"], data["inspection_type"], data.get("ai_report"), checklist.version, edit_id))
+            row = cur.fetchone()
+            if row is None:
+                # Deleted since the form was opened; leaving the block rolls the transaction back
+                raise ValueError(f"Inspection {edit_id} was not found; it may have been deleted.")
+            old_building, old_type, version = row
+            cur.execute("""
+                SELECT ii.id, ii.checklist_item_id, ii.category, ii.item, ii.rating, ii.notes,
+                       COALESCE(array_agg(p.id) FILTER (WHERE p.id IS NOT NULL), '{}')
+                FROM inspection_items ii
+                LEFT JOIN inspection_item_photos p ON p.inspection_item_id = ii.id
+                WHERE ii.inspection_id = %s
+                GROUP BY ii.id
+            """, (edit_id,))
+            for item_id, checklist_item_id, category, item, rating, notes, photo_ids in cur.fetchall():
+                stored[_item_key(checklist_item_id, category, item)] = (item_id, checklist_item_id, rating, notes, set(photo_ids))
+            inspection_id = edit_id
+        else:
+            cur.execute("INSERT INTO inspections (building, inspection_date, inspector, inspection_type, ai_report, checklist_version) VALUES (%s, %s, %s, %s, %s, %s) RETURNING id",
+                (data["building"], data["inspection_date"], data["inspector"], data["inspection_type"], data.get("ai_report"), checklist.version))
+            inspection_id = cur.fetchone()[0]
+            version = 1
+        old_item_count = len(stored)
+
+        to_insert, to_update, new_photos_by_key = [], [], {}
+        removed_photo_ids, new_photo_rows = [], []
+        for category, item, rating, notes, kept_ids, photo_count in parsed:
+            photo_meta = list(islice(stored_photos, photo_count))
+            # Always save category, even if blank
+            category = category if category else ""
+            checklist_item_id = checklist.item_id(category, item)
+            key = _item_key(checklist_item_id, category, item)
+            if key not in stored and _item_key(None, category, item) in stored:
+                # Legacy rows saved without an id are matched by name and get the id in the update
+                key = _item_key(None, category, item)
+            if key in stored:
+                item_id, old_checklist_item_id, old_rating, old_notes, old_photo_ids = stored.pop(key)
+                if (rating, notes, checklist_item_id) != (old_rating, old_notes, old_checklist_item_id):
+                    to_update.append((item_id, rating, notes, checklist_item_id))
+                removed_photo_ids.extend(old_photo_ids - set(kept_ids))
+                new_photo_rows.extend((item_id,) + meta for meta in photo_meta)
+            else:
+                to_insert.append((inspection_id, category, item, checklist_item_id, rating, notes))
+                new_photos_by_key[key] = photo_meta
+        removed_item_ids = [entry[0] for entry in stored.values()]
+        removed_photo_count = len(removed_photo_ids) + sum(len(entry[4]) for entry in stored.values())
+        if edit_id and data.get("ai_report") is None and (to_insert or to_update or removed_item_ids or removed_photo_count or new_photo_rows):
+            # The stored report describes findings that no longer exist
+            cur.execute("UPDATE inspections SET ai_report = NULL WHERE id = %s", (edit_id,))
+
+        if removed_item_ids or removed_photo_ids:
+            cur.execute("""
+                WITH removed_photos AS (
+                    DELETE FROM inspection_item_photos
+                    WHERE inspection_item_id = ANY(%(items)s) OR id = ANY(%(photos)s)
+                )
+                DELETE FROM inspection_items WHERE id = ANY(%(items)s)
+            """, {"items": removed_item_ids, "photos": removed_photo_ids})
+        if to_update:
+            execute_values(cur, """
+                UPDATE inspection_items AS t SET rating = v.rating, notes = v.notes, checklist_item_id = v.checklist_item_id::integer
+                FROM (VALUES %s) AS v(id, rating, notes, checklist_item_id) WHERE t.id = v.id
+            """, to_update)
+        if to_insert:
+            inserted = execute_values(cur,
+                "INSERT INTO inspection_items (inspection_id, category, item, checklist_item_id, rating, notes) VALUES %s RETURNING id, checklist_item_id, category, item",
+                to_insert, fetch=True)
+            for item_id, checklist_item_id, category, item in inserted:
+                new_photo_rows.extend((item_id,) + meta for meta in new_photos_by_key.get(_item_key(checklist_item_id, category, item), []))
+        if new_photo_rows:
+            execute_values(cur, "INSERT INTO inspection_item_photos (inspection_item_id, sha256, size_bytes, width, height, mime_type, thumb_sha256) VALUES %s", new_photo_rows)
+        reference_changed = record_reference_data(cur, data["building"], data["inspector"])
+        new_item_count = old_item_count - len(removed_item_ids) + len(to_insert)
+        if edit_id:
+            stats.inspection_moved(old_type, old_building, old_item_count, data["inspection_type"], data["building"], new_item_count)
+        else:
+            stats.inspection_added(data["inspection_type"], data["building"], new_item_count)
+        stats.add(TOTAL, "photos", len(new_photo_rows) - removed_photo_count)
+        stats.apply(cur)
+        conn.commit()
+        st.session_state["last_save_stats"] = {
+            "round_trips": cur.round_trips,
+            "items_inserted": len(to_insert),
+            "items_updated": len(to_update),
+            "items_deleted": len(removed_item_ids),
+            "photos_inserted": len(new_photo_rows),
+            "photos_deleted": removed_photo_count,
+        }
+        cur.close()
+    if reference_changed:
+        invalidate_reference_data()
+    get_stats.clear()
+    count_inspections.clear()
+    # Written on the fact table's own thread; failures show up in the Item Analytics panel
+    get_item_facts().append(inspection_id, version, data["building"], data["inspection_type"], data["inspection_date"], items)
     return inspection_id
 
 # --- Sidebar: Lookup ---
 st.sidebar.header("Inspection Workflow")
 try:
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT COUNT(*) FROM inspection_item_photos")
-    photo_count = cur.fetchone()[0]
-    cur.close()
-    conn.close()
+    photo_count = get_stats().get(TOTAL, {}).get("photos", 0)
+    st.sidebar.caption(f"{photo_count} photos on file")
 except Exception as e:
     pass
 if st.sidebar.button("New Inspection"):
@@ -502,7 +869,7 @@ if st.session_state.get('_new_form_triggered', False) and st.session_state.get("
     st.sidebar.markdown("---")
     st.sidebar.subheader("Select Inspection Type")
     # Always initialize selectbox from session state
-    valid_types = ["Custodial", "Maintenance", "Grounds"]
+    valid_types = INSPECTION_TYPES
     current_type = st.session_state.get("new_inspection_type")
     if current_type not in valid_types:
         st.session_state["new_inspection_type"] = "Custodial"
@@ -515,15 +882,7 @@ if st.session_state.get('_new_form_triggered', False) and st.session_state.get("
     # Update type in session state and rerun only if changed
     if st.session_state["new_inspection_type"] != selected_type:
         st.session_state["new_inspection_type"] = selected_type
-        for checklist_data in [CUSTODIAL_DATA, MAINTENANCE_DATA, GROUNDS_DATA]:
-            for category, items in checklist_data.items():
-                for item in items:
-                    rating_key = f"{category}_{item}_rating"
-                    notes_key = f"{category}_{item}_notes"
-                    if rating_key in st.session_state:
-                        del st.session_state[rating_key]
-                    if notes_key in st.session_state:
-                        del st.session_state[notes_key]
+        clear_form_state("_new")
         st.rerun()
 if st.sidebar.button("Edit Previous Inspection"):
     st.session_state._edit_form_triggered = True
@@ -539,35 +898,16 @@ if st.session_state.get('_edit_form_triggered', False):
     photo_filter = st.sidebar.checkbox("Only show inspections with photos")
     # Store search results in session state to persist across reruns
     if st.sidebar.button("Search") or st.session_state.get("_search_triggered"):
-        if not st.session_state.get("_search_triggered"):
-            st.session_state["_search_triggered"] = True
-            # Custom query for photo filter
-            conn = get_conn()
-            cur = conn.cursor()
-            query = "SELECT i.id, i.building, i.inspection_date, i.inspector FROM inspections i"
-            params = []
-            if photo_filter:
-                query = "SELECT DISTINCT i.id, i.building, i.inspection_date, i.inspector, i.inspection_type FROM inspections i "
-                query += "INNER JOIN inspection_items ii ON ii.inspection_id = i.id "
-                query += "INNER JOIN inspection_item_photos p ON p.inspection_item_id = ii.id WHERE 1=1 "
-            else:
-                query = "SELECT i.id, i.building, i.inspection_date, i.inspector, i.inspection_type FROM inspections i WHERE 1=1 "
-            if building_filter != "All":
-                query += " AND i.building = %s"
-                params.append(building_filter)
-            if inspector_filter != "All":
-                query += " AND i.inspector ILIKE %s"
-                params.append(inspector_filter)
-            if date_filter:
-                query += " AND i.inspection_date = %s"
-                params.append(date_filter)
-            query += " ORDER BY i.inspection_date DESC LIMIT 20"
-            cur.execute(query, params)
-            rows = cur.fetchall()
-            cur.close()
-            conn.close()
-            st.session_state["_search_results"] = rows
-        results = st.session_state.get("_search_results", [])
+        st.session_state["_search_triggered"] = True
+        results = search_page(
+            "sidebar_search",
+            container=st.sidebar,
+            building=building_filter if building_filter != "All" else None,
+            inspector=inspector_filter if inspector_filter != "All" else None,
+            date_filter=date_filter,
+            photos_only=photo_filter
+        )
+        st.session_state["_search_results"] = results
         st.sidebar.write("Results:")
         for result in results:
             if len(result) == 5:
@@ -584,15 +924,7 @@ if st.session_state.get('_edit_form_triggered', False):
                 st.session_state._new_form_triggered = False
                 st.session_state["_search_triggered"] = False
                 # Clear widget keys for checklist before rerun
-                for checklist_data in [CUSTODIAL_DATA, MAINTENANCE_DATA, GROUNDS_DATA]:
-                    for category, items in checklist_data.items():
-                        for item in items:
-                            rating_key = f"{category}_{item}_rating"
-                            notes_key = f"{category}_{item}_notes"
-                            if rating_key in st.session_state:
-                                del st.session_state[rating_key]
-                            if notes_key in st.session_state:
-                                del st.session_state[notes_key]
+                clear_form_state()
                 st.rerun()
     else:
         # Clear previous search results if not searching
@@ -644,30 +976,28 @@ if st.session_state.get("app_state") == "admin_page" and st.session_state.get("i
             if email and first_name and last_name and password:
                 import bcrypt
                 password_hash = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
-                conn = get_conn()
-                cur = conn.cursor()
-                try:
-                    cur.execute("INSERT INTO users (email, first_name, last_name, position, password_hash, is_admin) VALUES (%s, %s, %s, %s, %s, %s)",
-                                (email, first_name, last_name, position, password_hash, is_admin))
-                    conn.commit()
-                    st.success(f"User '{email}' added successfully.")
-                except Exception as e:
-                    st.error(f"Error adding user: {e}")
-                finally:
-                    cur.close()
-                    conn.close()
+                with get_conn() as conn:
+                    cur = conn.cursor()
+                    try:
+                        cur.execute("INSERT INTO users (email, first_name, last_name, position, password_hash, is_admin) VALUES (%s, %s, %s, %s, %s, %s)",
+                                    (email, first_name, last_name, position, password_hash, is_admin))
+                        conn.commit()
+                        st.success(f"User '{email}' added successfully.")
+                    except Exception as e:
+                        st.error(f"Error adding user: {e}")
+                    finally:
+                        cur.close()
             else:
                 st.error("All fields except position are required.")
 
     # Reset password now part of manage users form below
 
     st.subheader("Manage Users")
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT email, first_name, last_name, position, is_admin FROM users ORDER BY email")
-    users = cur.fetchall()
-    cur.close()
-    conn.close()
+    with get_conn() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT email, first_name, last_name, position, is_admin FROM users ORDER BY email")
+        users = cur.fetchall()
+        cur.close()
     user_emails = [u[0] for u in users]
     selected_user_email = st.selectbox("Select User to Manage", user_emails)
     selected_user = next((u for u in users if u[0] == selected_user_email), None)
@@ -684,36 +1014,74 @@ if st.session_state.get("app_state") == "admin_page" and st.session_state.get("i
             delete_submitted = st.form_submit_button("Delete User")
             if update_submitted:
                 import bcrypt
-                conn = get_conn()
-                cur = conn.cursor()
-                try:
-                    # Always preserve is_admin value
-                    if new_password:
-                        password_hash = bcrypt.hashpw(new_password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
-                        cur.execute("UPDATE users SET first_name = %s, last_name = %s, position = %s, is_admin = %s, password_hash = %s WHERE email = %s",
-                                    (new_first_name, new_last_name, new_position, int(new_is_admin), password_hash, email))
-                    else:
-                        cur.execute("UPDATE users SET first_name = %s, last_name = %s, position = %s, is_admin = %s WHERE email = %s",
-                                    (new_first_name, new_last_name, new_position, int(new_is_admin), email))
-                    conn.commit()
-                    st.success(f"User '{email}' updated.")
-                except Exception as e:
-                    st.error(f"Error updating user: {e}")
-                finally:
-                    cur.close()
-                    conn.close()
+                with get_conn() as conn:
+                    cur = conn.cursor()
+                    try:
+                        # Always preserve is_admin value
+                        if new_password:
+                            password_hash = bcrypt.hashpw(new_password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+                            cur.execute("UPDATE users SET first_name = %s, last_name = %s, position = %s, is_admin = %s, password_hash = %s WHERE email = %s",
+                                        (new_first_name, new_last_name, new_position, int(new_is_admin), password_hash, email))
+                        else:
+                            cur.execute("UPDATE users SET first_name = %s, last_name = %s, position = %s, is_admin = %s WHERE email = %s",
+                                        (new_first_name, new_last_name, new_position, int(new_is_admin), email))
+                        conn.commit()
+                        st.success(f"User '{email}' updated.")
+                    except Exception as e:
+                        st.error(f"Error updating user: {e}")
+                    finally:
+                        cur.close()
             if delete_submitted:
-                conn = get_conn()
-                cur = conn.cursor()
-                try:
-                    cur.execute("DELETE FROM users WHERE email = %s", (email,))
-                    conn.commit()
-                    st.success(f"User '{email}' deleted.")
-                except Exception as e:
-                    st.error(f"Error deleting user: {e}")
-                finally:
-                    cur.close()
-                    conn.close()
+                with get_conn() as conn:
+                    cur = conn.cursor()
+                    try:
+                        cur.execute("DELETE FROM users WHERE email = %s", (email,))
+                        conn.commit()
+                        st.success(f"User '{email}' deleted.")
+                    except Exception as e:
+                        st.error(f"Error deleting user: {e}")
+                    finally:
+                        cur.close()
+
+    with st.expander("Database Connection Pool"):
+        st.json(pool_stats())
+    with st.expander("Inspection Statistics"):
+        st.json(get_stats())
+        if st.button("Recompute Statistics"):
+            refresh_stats()
+            st.rerun()
+    with st.expander("Item Analytics"):
+        facts = get_item_facts()
+        analytics_type = st.selectbox("Inspection type", ["All"] + INSPECTION_TYPES, key="analytics_type")
+        averages = facts.average_level(inspection_type=None if analytics_type == "All" else analytics_type)
+        if averages.empty:
+            st.caption("No rated items recorded yet.")
+        else:
+            st.dataframe(averages.pivot_table(index=["building", "item"], columns="semester",
+                                              values="average_level", observed=True).round(2))
+        facts_stats = facts.stats()
+        if facts_stats["failed"]:
+            st.warning(f"{facts_stats['failed']} save(s) could not be added to analytics "
+                       f"(last: {facts_stats['last_error']}). Rebuild to fill the gap.")
+        st.caption(f"{facts_stats['parts']} part file(s)"
+                   + (" - compaction recommended" if facts_stats["needs_compaction"] else ""))
+        if st.button("Compact analytics", disabled=facts_stats["parts"] < 2):
+            submit_job("compact_item_facts", {}, owner=st.session_state.get("user_email"))
+            st.success("Compaction queued; see Background Jobs.")
+        if st.button("Rebuild analytics from database"):
+            st.success(f"Rebuilt analytics with {rebuild_item_facts()} item row(s).")
+    with st.expander("Background Jobs"):
+        columns = ("ID", "Kind", "Status", "Progress", "Message", "Error", "Owner", "Created", "Finished")
+        st.dataframe([dict(zip(columns, row)) for row in recent_jobs()])
+    with st.expander("Gemini Client"):
+        st.json(get_gemini_client().metrics())
+    with st.expander("AI Report Cache"):
+        st.json(cache_metrics())
+    with st.expander("Photo Storage"):
+        if st.button("Move database photos to blob store"):
+            st.success(f"Moved {migrate_photos_to_store()} photo(s) out of the database.")
+        if st.button("Remove unreferenced photo blobs"):
+            st.success(f"Removed {prune_photo_store()} unreferenced blob(s).")
 
     colA, colB = st.columns([1,1])
     with colA:
@@ -743,31 +1111,14 @@ elif st.session_state["app_state"] == "edit":
     date_filter = st.date_input("Date", value=None)
     photo_filter = st.checkbox("Only show inspections with photos")
     if st.button("Search") or st.session_state.get("_search_triggered"):
-        if not st.session_state.get("_search_triggered"):
-            st.session_state["_search_triggered"] = True
-        conn = get_conn()
-        cur = conn.cursor()
-        params = []
-        if photo_filter:
-            query = "SELECT DISTINCT i.id, i.building, i.inspection_date, i.inspector, i.inspection_type FROM inspections i "
-            query += "INNER JOIN inspection_items ii ON ii.inspection_id = i.id "
-            query += "INNER JOIN inspection_item_photos p ON p.inspection_item_id = ii.id WHERE 1=1 "
-        else:
-            query = "SELECT i.id, i.building, i.inspection_date, i.inspector, i.inspection_type FROM inspections i WHERE 1=1 "
-        if building_filter != "All":
-            query += " AND i.building = %s"
-            params.append(building_filter)
-        if inspector_filter != "All":
-            query += " AND i.inspector ILIKE %s"
-            params.append(inspector_filter)
-        if date_filter:
-            query += " AND i.inspection_date = %s"
-            params.append(date_filter)
-        query += " ORDER BY i.inspection_date DESC LIMIT 20"
-        cur.execute(query, params)
-        rows = cur.fetchall()
-        cur.close()
-        conn.close()
+        st.session_state["_search_triggered"] = True
+        rows = search_page(
+            "edit_search",
+            building=building_filter if building_filter != "All" else None,
+            inspector=inspector_filter if inspector_filter != "All" else None,
+            date_filter=date_filter,
+            photos_only=photo_filter
+        )
         st.session_state["_search_results"] = rows
     results = st.session_state.get("_search_results", [])
     st.write("Results:")
@@ -786,15 +1137,7 @@ elif st.session_state["app_state"] == "edit":
             st.session_state._new_form_triggered = False
             st.session_state["_search_triggered"] = False
             # Clear widget keys for checklist before rerun
-            for checklist_data in [CUSTODIAL_DATA, MAINTENANCE_DATA, GROUNDS_DATA]:
-                for category, items in checklist_data.items():
-                    for item in items:
-                        rating_key = f"{category}_{item}_rating"
-                        notes_key = f"{category}_{item}_notes"
-                        if rating_key in st.session_state:
-                            del st.session_state[rating_key]
-                        if notes_key in st.session_state:
-                            del st.session_state[notes_key]
+            clear_form_state()
             st.rerun()
 if st.session_state.get('_new_form_triggered', False):
     # Show inspection type selector before form
@@ -802,7 +1145,7 @@ if st.session_state.get('_new_form_triggered', False):
     st.session_state["edit_id"] = None
 if st.session_state.get("app_state") == "select_type":
     st.markdown("# Start New Inspection")
-    valid_types = ["Custodial", "Maintenance", "Grounds"]
+    valid_types = INSPECTION_TYPES
     selected_type = st.selectbox("Select Inspection Type", valid_types, key="new_type_select")
     if st.button("Begin Inspection"):
         st.session_state["new_inspection_type"] = selected_type
@@ -810,28 +1153,16 @@ if st.session_state.get("app_state") == "select_type":
         st.rerun()
 elif st.session_state.get("app_state") == "new_form":
     selected_type = st.session_state.get("new_inspection_type", "Custodial")
+    checklist = get_checklist(selected_type)
     # Add inspection-type-specific help text
-    if selected_type == "Custodial":
-        st.info("Custodial APPA Levels: Rate cleanliness, orderliness, and maintenance of all surfaces and fixtures. Level 1 is 'Orderly Spotlessness', Level 5 is 'Unkempt Neglect'.")
-    elif selected_type == "Maintenance":
-        st.info("Maintenance APPA Levels: Rate physical condition, safety, and functionality of building systems and spaces. Level 1 is 'Like-New Condition', Level 5 is 'Critical/Failed Condition'.")
-    elif selected_type == "Grounds":
-        st.info("Grounds APPA Levels: Rate landscaping, hardscapes, and site amenities. Level 1 is 'Excellent Condition', Level 5 is 'Neglected/Unsafe'.")
+    if checklist.summary:
+        st.info(checklist.summary)
     prefill = {
         "building": "",
         "inspection_date": None,
         "inspector": "",
         "inspection_type": selected_type
     }
-    # Set checklist_data based on selected_type
-    if selected_type == "Custodial":
-        checklist_data = CUSTODIAL_DATA
-    elif selected_type == "Maintenance":
-        checklist_data = MAINTENANCE_DATA
-    elif selected_type == "Grounds":
-        checklist_data = GROUNDS_DATA
-    else:
-        checklist_data = CUSTODIAL_DATA
     item_prefill = {}  # Fix: define item_prefill before the form
     # Add navigation button above the form
     if st.button("Return to Main Page", key="return_home_new_form_top"):
@@ -860,15 +1191,16 @@ elif st.session_state.get("app_state") == "new_form":
             inspection_date = st.date_input("Inspection Date", value=prefill.get("inspection_date", None), key="form_inspection_date_new")
         st.markdown("---")
         items_out = []
-        for category, items in checklist_data.items():
+        for category, items in checklist.categories.items():
             st.markdown(f"<div class='inspection-category' style='background: #f7f9fa; border-radius: 10px; padding: 18px 16px 8px 16px; margin-bottom: 18px; box-shadow: 0 2px 8px #e0e6ed;'>", unsafe_allow_html=True)
             st.markdown(f"<h4 style='margin-bottom: 8px; color: #2a3b4d;'>{category}</h4>", unsafe_allow_html=True)
-            for item in items:
+            for checklist_item in items:
+                item = checklist_item.name
                 st.markdown(f"<div class='inspection-item' style='background: #fff; border-radius: 8px; padding: 14px 12px; margin-bottom: 10px; box-shadow: 0 1px 4px #e0e6ed;'>", unsafe_allow_html=True)
                 st.markdown(f"<span style='font-weight:600; font-size:1.08em; color:#1a2633;'>{item}</span>", unsafe_allow_html=True)
-                rating, notes = item_prefill.get((category, item), ("Select", ""))
+                rating, notes = item_prefill.get(checklist_item.id, ("Select", ""))
                 widget_suffix = "_new"
-                help_key = f"{category}_{item}_help{widget_suffix}"
+                help_key = f"item{checklist_item.id}_help{widget_suffix}"
                 col_rating, col_help = st.columns([5,1])
                 with col_rating:
                     rating_options = ["Select", "Level 1", "Level 2", "Level 3", "Level 4", "Level 5"]
@@ -880,56 +1212,23 @@ elif st.session_state.get("app_state") == "new_form":
                         f"Rating for {item}",
                         rating_options,
                         index=rating_index,
-                        key=f"{category}_{item}_rating{widget_suffix}"
+                        key=widget_key(widget_suffix, f"item{checklist_item.id}_rating{widget_suffix}")
                     )
                 with col_help:
                     show_help = st.form_submit_button(f"Show Help for {item}", key=help_key)
-                # Define appa_guidance inside the item loop
-                if selected_type == "Custodial":
-                    appa_guidance = {
-                        1: "Level 1: Orderly Spotlessness - Highest level, clean and well-maintained, no dust, dirt, or clutter.",
-                        2: "Level 2: Ordinary Tidiness - Clean, but may have minor dust or dirt in corners, overall tidy.",
-                        3: "Level 3: Casual Inattention - Acceptable, but more visible dust, dirt, or wear. Some clutter or minor issues.",
-                        4: "Level 4: Moderate Dinginess - Noticeable dirt, wear, or neglect. Needs attention to restore standards.",
-                        5: "Level 5: Unkempt Neglect - Major cleanliness or maintenance issues, significant dirt, damage, or clutter. Immediate action required."
-                    }
-                elif selected_type == "Maintenance":
-                    appa_guidance = {
-                        1: "Level 1: Like-New Condition - No visible wear, damage, or safety issues. All systems fully functional.",
-                        2: "Level 2: Good Condition - Minor wear, all systems functional, no major repairs needed.",
-                        3: "Level 3: Fair Condition - Noticeable wear, some minor repairs needed, but safe and usable.",
-                        4: "Level 4: Poor Condition - Significant wear, repairs needed, may impact safety or usability.",
-                        5: "Level 5: Critical/Failed Condition - Major damage, systems not functional, unsafe or unusable. Immediate action required."
-                    }
-                elif selected_type == "Grounds":
-                    appa_guidance = {
-                        1: "Level 1: Excellent Condition - Well-maintained, healthy landscaping, clean hardscapes, no litter or hazards.",
-                        2: "Level 2: Good Condition - Minor issues, overall tidy and safe.",
-                        3: "Level 3: Fair Condition - Some neglect, visible weeds, litter, or minor hazards.",
-                        4: "Level 4: Poor Condition - Significant neglect, safety concerns, major repairs needed.",
-                        5: "Level 5: Neglected/Unsafe - Major hazards, unsafe or unusable areas, immediate action required."
-                    }
                 if show_help:
                     with st.expander(f"APPA Scoring Guidance for {item}", expanded=True):
-                        for lvl in range(1,6):
-                            st.markdown(f"**Level {lvl}:** {appa_guidance[lvl]}")
+                        st.markdown(checklist.guidance_markdown)
                 st.markdown("<div style='height:8px;'></div>", unsafe_allow_html=True)
                 notes_val = st.text_area(
                     f"Notes for {item}",
                     value=notes,
-                    key=f"{category}_{item}_notes{widget_suffix}",
+                    key=widget_key(widget_suffix, f"item{checklist_item.id}_notes{widget_suffix}"),
                     height=60,
                     placeholder="Add any specific observations or action items..."
                 )
                 st.markdown("<div style='height:8px;'></div>", unsafe_allow_html=True)
-                photo_vals = []
-                with st.expander("Attach photos (max 5, only for items of concern)"):
-                    for i in range(1, 6):
-                        photo_key = f"{category}_{item}_photo{i}{widget_suffix}"
-                        photo_label = f"Photo {i} for {item} (optional)"
-                        photo = st.camera_input(photo_label, key=photo_key)
-                        if photo:
-                            photo_vals.append(photo)
+                photo_vals = item_photo_controls(checklist_item, widget_suffix)
                 st.markdown("</div>", unsafe_allow_html=True)
                 items_out.append((category, item, rating_val, notes_val, photo_vals))
             st.markdown("</div>", unsafe_allow_html=True)
@@ -941,30 +1240,33 @@ elif st.session_state.get("app_state") == "new_form":
             if not items_out:
                 st.error("Please complete some checklist items before generating a report.")
             else:
-                with st.spinner("Generating comprehensive APPA analysis..."):
-                    prompt = f"Generate a comprehensive APPA analysis for {building} with findings: {items_out}"
-                    ai_report = call_gemini_api(prompt)
-                    st.session_state["ai_report"] = ai_report
-        if "ai_report" in st.session_state and st.session_state["ai_report"]:
-            st.markdown('<div class="ai-report-area">', unsafe_allow_html=True)
-            st.markdown(st.session_state["ai_report"])
-            st.markdown('</div>', unsafe_allow_html=True)
+                # Generation runs as a job; a fragment below the form streams it and the form shows the finished report
+                st.session_state["ai_report_job"] = submit_job(
+                    "ai_report",
+                    {"inspection_type": selected_type, "building": building, "findings": job_findings(items_out)},
+                    owner=st.session_state.get("user_email"))
+        render_ai_report_job()
         if submitted:
             data = {}
             data["building"] = building
             data["inspection_date"] = inspection_date
             data["inspector"] = inspector
             data["inspection_type"] = selected_type
+            # Only a report generated for exactly these findings is saved with them
+            data["ai_report"] = cached_ai_report(selected_type, building, items_out)
             save_inspection(data, items_out, edit_id=None)
+            clear_form_state(widget_suffix)
             st.success("Inspection saved!")
+            st.session_state.pop("ai_report_job", None)
             st.session_state["edit_id"] = None
             st.session_state["app_state"] = "home"
             st.rerun()
+    ai_report_job_progress()
     st.markdown('</div>', unsafe_allow_html=True)
 
 if st.session_state.get("app_state") == "edit_form" and edit_id is not None:
     # Removed blank header divs for cleaner layout
-    inspection_data, loaded_items = load_inspection(edit_id)
+    inspection_data, loaded_items = load_inspection(edit_id, include_photos=False)
     prefill = inspection_data if inspection_data else {
         "building": "",
         "inspection_date": None,
@@ -977,23 +1279,16 @@ if st.session_state.get("app_state") == "edit_form" and edit_id is not None:
     if st.button("Return to Main Screen", key="return_home_edit_form_top"):
         st.session_state["app_state"] = "home"
         st.rerun()
-    # Define item_prefill for edit form
-    # loaded_items is a list of tuples: (category, item, rating, notes, ...)
+    # The form shows the checklist version the inspection was recorded with, so items dropped
+    # from later versions are kept; prefill is keyed by checklist item id, legacy rows by name
+    checklist = get_checklist(prefill.get("inspection_type"), prefill.get("checklist_version"))
     item_prefill = {}
-    if loaded_items:
-        for entry in loaded_items:
-            # Handle dict or tuple/list
-            if isinstance(entry, dict):
-                category = entry.get('category')
-                item = entry.get('item')
-                rating = entry.get('rating', "Select")
-                notes = entry.get('notes', "")
-            elif isinstance(entry, (list, tuple)) and len(entry) >= 4:
-                category, item, rating, notes = entry[:4]
-            else:
-                continue
-            if category and item:
-                item_prefill[(category, item)] = (rating, notes)
+    photo_prefill = {}
+    for entry in loaded_items or []:
+        checklist_item_id = entry.get('checklist_item_id') or checklist.item_id(entry.get('category'), entry.get('item'))
+        if checklist_item_id:
+            item_prefill[checklist_item_id] = (entry.get('rating', "Select"), entry.get('notes', ""))
+            photo_prefill[checklist_item_id] = entry.get('photo_ids', [])
     with st.form("inspection_form_edit2"):
         st.markdown(f"# {prefill.get('inspection_type', 'Custodial')} Inspection Form")
         col1, col2, col3 = st.columns([2,2,2])
@@ -1014,26 +1309,18 @@ if st.session_state.get("app_state") == "edit_form" and edit_id is not None:
                     st.markdown("**Inspector Name:** _(Not logged in)_")
                 inspector = user_name if user_name else ""
         inspection_date = st.date_input("Inspection Date", value=prefill.get("inspection_date", None), key="form_inspection_date_edit")
-        # Define checklist_data based on inspection_type
         inspection_type = prefill.get("inspection_type", "Custodial")
         if inspection_type:
             inspection_type = str(inspection_type).strip().capitalize()
-        if inspection_type == "Custodial":
-            checklist_data = CUSTODIAL_DATA
-        elif inspection_type == "Maintenance":
-            checklist_data = MAINTENANCE_DATA
-        elif inspection_type == "Grounds":
-            checklist_data = GROUNDS_DATA
-        else:
-            checklist_data = CUSTODIAL_DATA
         items_out = []
-        for category, items in checklist_data.items():
+        for category, items in checklist.categories.items():
             st.markdown(f"<div class='inspection-category' style='background: #f7f9fa; border-radius: 10px; padding: 18px 16px 8px 16px; margin-bottom: 18px; box-shadow: 0 2px 8px #e0e6ed;'>", unsafe_allow_html=True)
             st.markdown(f"<h4 style='margin-bottom: 8px; color: #2a3b4d;'>{category}</h4>", unsafe_allow_html=True)
-            for item in items:
+            for checklist_item in items:
+                item = checklist_item.name
                 st.markdown(f"<div class='inspection-item' style='background: #fff; border-radius: 8px; padding: 14px 12px; margin-bottom: 10px; box-shadow: 0 1px 4px #e0e6ed;'>", unsafe_allow_html=True)
                 st.markdown(f"<span style='font-weight:600; font-size:1.08em; color:#1a2633;'>{item}</span>", unsafe_allow_html=True)
-                rating, notes = item_prefill.get((category, item), ("Select", ""))
+                rating, notes = item_prefill.get(checklist_item.id, ("Select", ""))
                 widget_suffix = f"_{edit_id}" if edit_id is not None else ""
                 col_rating, col_expander = st.columns([5,1])
                 with col_rating:
@@ -1041,73 +1328,22 @@ if st.session_state.get("app_state") == "edit_form" and edit_id is not None:
                         f"Rating for {item}",
                         ["Select", "Level 1", "Level 2", "Level 3", "Level 4", "Level 5"],
                         index=["Select", "Level 1", "Level 2", "Level 3", "Level 4", "Level 5"].index(rating),
-                        key=f"{category}_{item}_rating{widget_suffix}"
+                        key=widget_key(widget_suffix, f"item{checklist_item.id}_rating{widget_suffix}")
                     )
                 with col_expander:
                     with st.expander("APPA Guidance"):
-                        if inspection_type == "Custodial":
-                            guidance = {
-                                1: "Level 1: Orderly Spotlessness - Highest level, clean and well-maintained, no dust, dirt, or clutter.",
-                                2: "Level 2: Ordinary Tidiness - Clean, but may have minor dust or dirt in corners, overall tidy.",
-                                3: "Level 3: Casual Inattention - Acceptable, but more visible dust, dirt, or wear. Some clutter or minor issues.",
-                                4: "Level 4: Moderate Dinginess - Noticeable dirt, wear, or neglect. Needs attention to restore standards.",
-                                5: "Level 5: Unkempt Neglect - Major cleanliness or maintenance issues, significant dirt, damage, or clutter. Immediate action required."
-                            }
-                        elif inspection_type == "Maintenance":
-                            guidance = {
-                                1: "Level 1: Like-New Condition - No visible wear, damage, or safety issues. All systems fully functional.",
-                                2: "Level 2: Good Condition - Minor wear, all systems functional, no major repairs needed.",
-                                3: "Level 3: Fair Condition - Noticeable wear, some minor repairs needed, but safe and usable.",
-                                4: "Level 4: Poor Condition - Significant wear, repairs needed, may impact safety or usability.",
-                                5: "Level 5: Critical/Failed Condition - Major damage, systems not functional, unsafe or unusable. Immediate action required."
-                            }
-                        elif inspection_type == "Grounds":
-                            guidance = {
-                                1: "Level 1: Excellent Condition - Well-maintained, healthy landscaping, clean hardscapes, no litter or hazards.",
-                                2: "Level 2: Good Condition - Minor issues, overall tidy and safe.",
-                                3: "Level 3: Fair Condition - Some neglect, visible weeds, litter, or minor hazards.",
-                                4: "Level 4: Poor Condition - Significant neglect, safety concerns, major repairs needed.",
-                                5: "Level 5: Neglected/Unsafe - Major hazards, unsafe or unusable areas, immediate action required."
-                            }
-                        else:
-                            guidance = {
-                                1: "Level 1: Orderly Spotlessness - Highest level, clean and well-maintained, no dust, dirt, or clutter.",
-                                2: "Level 2: Ordinary Tidiness - Clean, but may have minor dust or dirt in corners, overall tidy.",
-                                3: "Level 3: Casual Inattention - Acceptable, but more visible dust, dirt, or wear. Some clutter or minor issues.",
-                                4: "Level 4: Moderate Dinginess - Noticeable dirt, wear, or neglect. Needs attention to restore standards.",
-                                5: "Level 5: Unkempt Neglect - Major cleanliness or maintenance issues, significant dirt, damage, or clutter. Immediate action required."
-                            }
-                        for lvl in range(1,6):
-                            st.markdown(f"**Level {lvl}:** {guidance[lvl]}")
+                        st.markdown(checklist.guidance_markdown)
                 st.markdown("<div style='height:8px;'></div>", unsafe_allow_html=True)
                 notes_val = st.text_area(
                     f"Notes for {item}",
                     value=notes,
-                    key=f"{category}_{item}_notes{widget_suffix}",
+                    key=widget_key(widget_suffix, f"item{checklist_item.id}_notes{widget_suffix}"),
                     height=60,
                     placeholder="Add any specific observations or action items..."
                 )
                 st.markdown("<div style='height:8px;'></div>", unsafe_allow_html=True)
-                # Prefill photo_vals with existing photos for this item
-                photo_vals = []
-                existing_photos = []
-                if edit_id is not None and loaded_items:
-                    for loaded_item in loaded_items:
-                        if (
-                            isinstance(loaded_item, dict)
-                            and str(loaded_item.get("category")) == str(category)
-                            and str(loaded_item.get("item")) == str(item)
-                        ):
-                            existing_photos = loaded_item.get("photos", [])
-                            break
-                photo_vals = existing_photos.copy() if existing_photos else []
-                with st.expander("Attach photos (max 5, only for items of concern)"):
-                    for i in range(1, 6):
-                        photo_key = f"{category}_{item}_photo{i}{widget_suffix}"
-                        photo_label = f"Photo {i} for {item} (optional)"
-                        photo = st.camera_input(photo_label, key=photo_key)
-                        if photo:
-                            photo_vals.append(photo)
+                # Saved photos are carried by id; their bytes are never loaded into the form
+                photo_vals = item_photo_controls(checklist_item, widget_suffix, photo_prefill.get(checklist_item.id, []))
                 st.markdown("</div>", unsafe_allow_html=True)
                 items_out.append((category, item, rating_val, notes_val, photo_vals))
             st.markdown("</div>", unsafe_allow_html=True)
@@ -1119,14 +1355,12 @@ if st.session_state.get("app_state") == "edit_form" and edit_id is not None:
             if not items_out:
                 st.error("Please complete some checklist items before generating a report.")
             else:
-                with st.spinner("Generating comprehensive APPA analysis..."):
-                    prompt = f"Generate a comprehensive APPA analysis for {building} with findings: {items_out}"
-                    ai_report = call_gemini_api(prompt)
-                    st.session_state["ai_report"] = ai_report
-        if "ai_report" in st.session_state and st.session_state["ai_report"]:
-            st.markdown('<div class="ai-report-area">', unsafe_allow_html=True)
-            st.markdown(st.session_state["ai_report"])
-            st.markdown('</div>', unsafe_allow_html=True)
+                # Generation runs as a job; a fragment below the form streams it and the form shows the finished report
+                st.session_state["ai_report_job"] = submit_job(
+                    "ai_report",
+                    {"inspection_type": inspection_type, "building": building, "findings": job_findings(items_out)},
+                    owner=st.session_state.get("user_email"))
+        render_ai_report_job()
         submitted = st.form_submit_button("Save Inspection")
         if submitted:
             data = {}
@@ -1134,9 +1368,22 @@ if st.session_state.get("app_state") == "edit_form" and edit_id is not None:
             data["inspection_date"] = inspection_date
             data["inspector"] = inspector
             data["inspection_type"] = prefill.get("inspection_type", "Custodial")
-            save_inspection(data, items_out, edit_id=edit_id)
+            data["checklist_version"] = checklist.version
+            # Only a report generated for exactly these findings is saved with them
+            data["ai_report"] = cached_ai_report(inspection_type, building, items_out)
+            try:
+                save_inspection(data, items_out, edit_id=edit_id)
+            except ValueError as e:
+                st.error(str(e))
+                st.stop()
+            clear_form_state(widget_suffix)
             st.success("Inspection saved!")
+            st.session_state.pop("ai_report_job", None)
+            # A PDF fetched before the edit no longer matches the inspection
+            st.session_state.pop(f"pdf_job_{edit_id}_pdf", None)
+            st.session_state.pop(f"pdf_job_{edit_id}", None)
             st.session_state["edit_id"] = None
             st.session_state["app_state"] = "home"
             st.rerun()
+    ai_report_job_progress()
     st.markdown('</div>', unsafe_allow_html=True)
@@ -0,0 +1,223 @@
+from collections import namedtuple
+
+import streamlit as st
+from psycopg2.extras import execute_values
+
+from db_pool import get_conn
+
+ChecklistItem = namedtuple("ChecklistItem", ["id", "category", "name"])
+
+# Definitions seeded as version 1 of each checklist; later versions live in the database
+DEFAULT_CHECKLISTS = {
+    "Custodial": {
+        "Common Areas (Lobbies, Hallways, Lounges)": [
+            "Flooring (Hard Surface)", "Flooring (Carpet/Rugs)", "Walls & Baseboards",
+            "Entrances & Glass", "Furniture & Upholstery", "Lighting Fixtures",
+            "Trash & Recycling Bins", "Drinking Fountains", "Odor Control"
+        ],
+        "Restrooms (Common/Public)": [
+            "Floors & Drains", "Toilets & Urinals", "Sinks & Countertops",
+            "Mirrors & Dispensers", "Stall Partitions", "Trash Receptacles", "Ventilation & Odor"
+        ],
+        "Ancillary Spaces (Kitchens, Laundry, Study Rooms)": [
+            "Flooring", "Countertops & Sinks", "Appliances (Exterior)",
+            "Laundry Machines (Exterior)", "Furniture (Tables/Chairs)", "Trash & Recycling Bins"
+        ]
+    },
+    "Maintenance": {
+        "Building Exterior & Envelope": [
+            "Foundation & Walls", "Windows & Seals", "Doors & Hardware", "Roof & Gutters", "Walkways & Stairs", "Exterior Lighting"
+        ],
+        "Interior Common Areas (Lobbies, Hallways, Stairs)": [
+            "Flooring Condition", "Wall & Ceiling Condition", "Paint Condition", "Doors & Hardware", "Handrails & Guardrails", "Lighting (Functionality)", "HVAC Vents & Grilles", "Fire & Life Safety"
+        ],
+        "Building Systems (General Observations)": [
+            "HVAC Operation", "Plumbing (Public Areas)", "Electrical (Outlets/Switches)", "Elevator Operation"
+        ],
+        "Apartments/Dorms (Sample Inspection)": [
+            "Door & Lockset", "Paint & Wall Condition", "Flooring Condition", "Windows & Blinds", "Plumbing Fixtures", "Appliances (If applicable)", "Lighting & Electrical"
+        ]
+    },
+    "Grounds": {
+        "Landscaping (Seasonal)": [
+            "Turf & Lawn Health", "Edging (Walks, Curbs)", "Plant Beds & Mulch", "Trees & Shrubs Pruning", "Weed Control", "Litter & Debris Removal"
+        ],
+        "Hardscapes & Site Amenities": [
+            "Walkways & Patios Condition", "Benches & Site Furniture", "Trash & Ash Receptacles", "Bike Racks", "Signage"
+        ],
+        "Snow & Ice Removal (Seasonal)": [
+            "Walkway & Sidewalk Clarity", "Entrances & ADA Ramps", "Stairs & Landings", "De-Icing Application", "Snow Pile Placement"
+        ]
+    },
+}
+
+APPA_GUIDANCE = {
+    "Custodial": {
+        1: "Level 1: Orderly Spotlessness - Highest level, clean and well-maintained, no dust, dirt, or clutter.",
+        2: "Level 2: Ordinary Tidiness - Clean, but may have minor dust or dirt in corners, overall tidy.",
+        3: "Level 3: Casual Inattention - Acceptable, but more visible dust, dirt, or wear. Some clutter or minor issues.",
+        4: "Level 4: Moderate Dinginess - Noticeable dirt, wear, or neglect. Needs attention to restore standards.",
+        5: "Level 5: Unkempt Neglect - Major cleanliness or maintenance issues, significant dirt, damage, or clutter. Immediate action required."
+    },
+    "Maintenance": {
+        1: "Level 1: Like-New Condition - No visible wear, damage, or safety issues. All systems fully functional.",
+        2: "Level 2: Good Condition - Minor wear, all systems functional, no major repairs needed.",
+        3: "Level 3: Fair Condition - Noticeable wear, some minor repairs needed, but safe and usable.",
+        4: "Level 4: Poor Condition - Significant wear, repairs needed, may impact safety or usability.",
+        5: "Level 5: Critical/Failed Condition - Major damage, systems not functional, unsafe or unusable. Immediate action required."
+    },
+    "Grounds": {
+        1: "Level 1: Excellent Condition - Well-maintained, healthy landscaping, clean hardscapes, no litter or hazards.",
+        2: "Level 2: Good Condition - Minor issues, overall tidy and safe.",
+        3: "Level 3: Fair Condition - Some neglect, visible weeds, litter, or minor hazards.",
+        4: "Level 4: Poor Condition - Significant neglect, safety concerns, major repairs needed.",
+        5: "Level 5: Neglected/Unsafe - Major hazards, unsafe or unusable areas, immediate action required."
+    },
+}
+
+TYPE_SUMMARIES = {
+    "Custodial": "Custodial APPA Levels: Rate cleanliness, orderliness, and maintenance of all surfaces and fixtures. Level 1 is 'Orderly Spotlessness', Level 5 is 'Unkempt Neglect'.",
+    "Maintenance": "Maintenance APPA Levels: Rate physical condition, safety, and functionality of building systems and spaces. Level 1 is 'Like-New Condition', Level 5 is 'Critical/Failed Condition'.",
+    "Grounds": "Grounds APPA Levels: Rate landscaping, hardscapes, and site amenities. Level 1 is 'Excellent Condition', Level 5 is 'Neglected/Unsafe'.",
+}
+
+DEFAULT_TYPE = "Custodial"
+# How long a process may keep serving a checklist after another process publishes a new version
+CHECKLIST_REFRESH_SECONDS = 30
+
+
+class Checklist:
+    """One version of an inspection type's checklist with everything the forms look up precomputed"""
+
+    def __init__(self, inspection_type, version, items):
+        self.inspection_type = inspection_type
+        self.version = version
+        self.items = tuple(items)
+        self.by_id = {item.id: item for item in self.items}
+        self.by_key = {(item.category, item.name): item for item in self.items}
+        self.categories = {}
+        for item in self.items:
+            self.categories.setdefault(item.category, []).append(item)
+        guidance = APPA_GUIDANCE.get(inspection_type, APPA_GUIDANCE[DEFAULT_TYPE])
+        self.guidance = guidance
+        self.guidance_markdown = "\n\n".join(f"**Level {level}:** {guidance[level]}" for level in range(1, 6))
+        self.summary = TYPE_SUMMARIES.get(inspection_type)
+
+    def item_id(self, category, name):
+        item = self.by_key.get((category or "", name))
+        return item.id if item else None
+
+
+def _item_ids(cur, inspection_type, categories):
+    """Ids for a definition's items, creating any the registry hasn't seen"""
+    rows = [(inspection_type, category, name) for category, names in categories.items() for name in names]
+    execute_values(cur, """
+        INSERT INTO checklist_items (inspection_type, category, name) VALUES %s
+        ON CONFLICT (inspection_type, category, name) DO NOTHING
+    """, rows)
+    cur.execute("SELECT id, category, name FROM checklist_items WHERE inspection_type = %s", (inspection_type,))
+    ids = {(category, name): item_id for item_id, category, name in cur.fetchall()}
+    return [ids[(category, name)] for _, category, name in rows]
+
+
+def seed_checklists(cur):
+    """Store the built-in definitions as version 1 of any type that has no versions yet"""
+    cur.execute("SELECT DISTINCT inspection_type FROM checklist_versions")
+    existing = {row[0] for row in cur.fetchall()}
+    for inspection_type, categories in DEFAULT_CHECKLISTS.items():
+        if inspection_type not in existing:
+            cur.execute("""
+                INSERT INTO checklist_versions (inspection_type, version, item_ids) VALUES (%s, 1, %s)
+                ON CONFLICT DO NOTHING
+            """, (inspection_type, _item_ids(cur, inspection_type, categories)))
+
+
+def publish_checklist(inspection_type, categories):
+    """Save {category: [item names]} as the next version of a checklist; returns the version number.
+
+    Items keep their ids across versions as long as their category and name are unchanged.
+    """
+    with get_conn() as conn:
+        cur = conn.cursor()
+        item_ids = _item_ids(cur, inspection_type, categories)
+        cur.execute("""
+            INSERT INTO checklist_versions (inspection_type, version, item_ids)
+            SELECT %s, COALESCE(MAX(version), 0) + 1, %s FROM checklist_versions WHERE inspection_type = %s
+            RETURNING version
+        """, (inspection_type, item_ids, inspection_type))
+        version = cur.fetchone()[0]
+        cur.close()
+    latest_versions.clear()
+    return version
+
+
+@st.cache_data(ttl=CHECKLIST_REFRESH_SECONDS, show_spinner=False)
+def latest_versions():
+    """((inspection_type, version), ...) for the newest version of every checklist"""
+    with get_conn() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT inspection_type, MAX(version) FROM checklist_versions GROUP BY inspection_type ORDER BY inspection_type")
+        rows = cur.fetchall()
+        cur.close()
+    return tuple(rows)
+
+
+def _load_checklists(versions):
+    """{inspection_type: Checklist} for the given (inspection_type, version) pairs, in one round of queries"""
+    if not versions:
+        return {}
+    with get_conn() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT inspection_type, version, item_ids FROM checklist_versions
+            WHERE (inspection_type, version) IN %s
+        """, (tuple(versions),))
+        rows = cur.fetchall()
+        cur.execute("SELECT id, category, name FROM checklist_items WHERE id = ANY(%s)",
+                    (sorted({i for _, _, item_ids in rows for i in item_ids}),))
+        items = {item_id: ChecklistItem(item_id, category, name) for item_id, category, name in cur.fetchall()}
+        cur.close()
+    return {t: Checklist(t, version, [items[i] for i in item_ids]) for t, version, item_ids in rows}
+
+
+@st.cache_resource(show_spinner=False, max_entries=8)
+def _compiled_checklists(versions):
+    checklists = _load_checklists(versions)
+    # Built-in types first, in their familiar order
+    order = list(DEFAULT_CHECKLISTS) + sorted(t for t in checklists if t not in DEFAULT_CHECKLISTS)
+    return {t: checklists[t] for t in order if t in checklists}
+
+
+def get_checklists():
+    """Latest version of every checklist, compiled once per process and version.
+
+    Keyed on latest_versions(), so a version published by another process is
+    picked up within CHECKLIST_REFRESH_SECONDS.
+    """
+    return _compiled_checklists(latest_versions())
+
+
+@st.cache_resource(show_spinner=False)
+def checklist_version(inspection_type, version):
+    """One published version of a checklist, or None; versions never change once published"""
+    return _load_checklists([(inspection_type, version)]).get(inspection_type)
+
+
+def get_checklist(inspection_type, version=None):
+    """Checklist for a type, falling back to the custodial one like the forms always have.
+
+    With a version, that published version of the type (e.g. the one an
+    inspection was recorded with); the latest one if it doesn't exist.
+    """
+    normalized = str(inspection_type or "").strip().capitalize()
+    if version is not None:
+        checklist = checklist_version(normalized, version)
+        if checklist is not None:
+            return checklist
+    checklists = get_checklists()
+    return checklists.get(normalized) or checklists[DEFAULT_TYPE]
+
+
+def checklist_items():
+    """Every item of every current checklist"""
+    return [item for checklist in get_checklists().values() for item in checklist.items]
@@ -5,12 +5,179 @@ except ImportError:
     PYODBC_AVAILABLE = False
     
 import json
-import pandas as pd
+import queue
+import threading
+import time
+from contextlib import contextmanager
 from datetime import datetime
 import streamlit as st
 
+# Inspections per bulk insert statement; 7 parameters each stays under SQL Server's 2100-parameter limit
+INSPECTION_CHUNK = 250
+
+# Bound sizes for InspectionDetails parameters under fast_executemany. Without them pyodbc
+# sizes the NVARCHAR(MAX) Notes buffer from the data (huge buffers or truncation errors);
+# size 0 makes it a MAX parameter
+DETAIL_INPUT_SIZES = None
+if PYODBC_AVAILABLE:
+    DETAIL_INPUT_SIZES = [
+        (pyodbc.SQL_INTEGER, 0, 0),     # InspectionID
+        (pyodbc.SQL_VARCHAR, 200, 0),   # Category
+        (pyodbc.SQL_VARCHAR, 200, 0),   # Item
+        (pyodbc.SQL_VARCHAR, 20, 0),    # Rating
+        (pyodbc.SQL_WVARCHAR, 0, 0),    # Notes NVARCHAR(MAX)
+    ]
+
+class CountingCursor:
+    """Wraps a pyodbc cursor and counts the statements sent through it (one per executemany)"""
+    
+    def __init__(self, cursor):
+        self.cursor = cursor
+        self.statements = 0
+    
+    def execute(self, *args):
+        self.statements += 1
+        return self.cursor.execute(*args)
+    
+    def executemany(self, *args):
+        self.statements += 1
+        return self.cursor.executemany(*args)
+    
+    def __getattr__(self, name):
+        return getattr(self.cursor, name)
+
+# Default size of each pooled connection string's pool
+POOL_MAX_CONN = 5
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class ConnectionPool:
+    """Thread-safe pool of pyodbc connections shared by every thread in the process.
+    
+    Connections are handed out one caller at a time and returned to a bounded
+    set of idle ones, so a Streamlit rerun (which runs on a fresh thread)
+    reuses a login made by an earlier one.
+    """
+    
+    def __init__(self, connection_string, maxconn=POOL_MAX_CONN, health_check_interval=30):
+        self.connection_string = connection_string
+        self.maxconn = maxconn
+        self.health_check_interval = health_check_interval
+        # Most recently used first, so surplus connections go idle long enough to be pinged
+        self._idle = queue.LifoQueue()
+        # Callers queue for a free slot rather than opening more than maxconn connections
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._lock = threading.Lock()
+        # Bumped by close(); connections checked out before it are closed when returned
+        self._generation = 0
+        self._checked_out = {}
+    
+    def _is_healthy(self, conn, last_used):
+        """Ping connections that have been idle longer than the health check interval"""
+        if time.monotonic() - last_used < self.health_check_interval:
+            return True
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1").fetchone()
+            cursor.close()
+            return True
+        except pyodbc.Error:
+            return False
+    
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except pyodbc.Error:
+            pass
+    
+    def checkout(self, timeout=None):
+        """Take a connection, waiting up to timeout seconds for a free slot; give it back with release()"""
+        if not self._slots.acquire(timeout=timeout):
+            raise ConnectionError("Timed out waiting for a database connection")
+        try:
+            while True:
+                try:
+                    conn, last_used, generation = self._idle.get_nowait()
+                except queue.Empty:
+                    conn = pyodbc.connect(self.connection_string)
+                    break
+                if generation == self._generation and self._is_healthy(conn, last_used):
+                    break
+                # Left over from before close(), or dropped by the server; try the next one or log in again
+                self._discard(conn)
+        except Exception:
+            self._slots.release()
+            raise
+        with self._lock:
+            self._checked_out[conn] = self._generation
+        return conn
+    
+    def release(self, conn):
+        """Return a connection taken with checkout()"""
+        with self._lock:
+            generation = self._checked_out.pop(conn, None)
+        try:
+            if generation != self._generation:
+                self._discard(conn)
+                return
+            try:
+                # Never leave a read's open transaction (and its locks) on an idle connection
+                conn.rollback()
+                self._idle.put((conn, time.monotonic(), generation))
+            except pyodbc.Error:
+                self._discard(conn)
+        finally:
+            self._slots.release()
+    
+    @contextmanager
+    def connection(self, timeout=None):
+        """Borrow a connection for the duration of the block"""
+        conn = self.checkout(timeout)
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+    
+    def close(self):
+        """Close idle connections now and checked-out ones as they are returned"""
+        with self._lock:
+            self._generation += 1
+        while True:
+            try:
+                conn, _, _ = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            self._discard(conn)
+
+
+def get_connection_pool(connection_string, maxconn=POOL_MAX_CONN, health_check_interval=30):
+    """The process-wide pool for a connection string, created on first use"""
+    with _pools_lock:
+        pool = _pools.get(connection_string)
+        if pool is None:
+            pool = _pools[connection_string] = ConnectionPool(connection_string, maxconn, health_check_interval)
+        return pool
+
+
+def _database_secrets():
+    """The [database] secrets, or {} when the app has no secrets file (e.g. from the command line)"""
+    try:
+        return st.secrets.get("database", {})
+    except FileNotFoundError:
+        return {}
+
+
+class _Borrowed(threading.local):
+    """The connection the calling thread has borrowed, and how many calls are sharing it"""
+    
+    def __init__(self):
+        self.conn = None
+        self.depth = 0
+
 class InspectionDatabase:
-    def __init__(self, connection_string=None):
+    def __init__(self, connection_string=None, pooled=None, health_check_interval=None, max_connections=None):
         """
         Initialize database connection
         
@@ -19,26 +186,84 @@ class InspectionDatabase:
         
         For Azure SQL:
         connection_string = "Driver={ODBC Driver 17 for SQL Server};Server=tcp:yourserver.database.windows.net,1433;Database=Inspections;Uid=username;Pwd=password;Encrypt=yes;TrustServerCertificate=no;Connection Timeout=30;"
+        
+        With pooled=True (or POOLED = true under [database]) connections come
+        from a process-wide pool of at most max_connections per connection
+        string instead of a fresh login per call; connections idle longer than
+        health_check_interval seconds are pinged and replaced if the ping fails.
+        Secrets are only read when no connection string is given.
         """
         if not PYODBC_AVAILABLE:
             raise ImportError("pyodbc is not available. Please install with: pip install pyodbc")
         
-        self.connection_string = connection_string or st.secrets.get("database", {}).get("connection_string", "")
-        self.conn = None
+        db = {} if connection_string else _database_secrets()
+        self.connection_string = connection_string or db.get("connection_string", "")
+        self.pooled = bool(db.get("POOLED", False)) if pooled is None else pooled
+        self.health_check_interval = (int(db.get("POOL_HEALTH_CHECK_SECONDS", 30))
+                                      if health_check_interval is None else health_check_interval)
+        self.max_connections = (int(db.get("ODBC_POOL_MAX_CONN", POOL_MAX_CONN))
+                                if max_connections is None else max_connections)
+        self._local = _Borrowed()
+        self.last_save_stats = {}
+    
+    @property
+    def conn(self):
+        return self._local.conn
+    
+    @property
+    def pool(self):
+        return get_connection_pool(self.connection_string, self.max_connections, self.health_check_interval)
     
     def connect(self):
-        """Establish database connection"""
-        try:
-            self.conn = pyodbc.connect(self.connection_string)
+        """Borrow a connection for this thread; calls inside a session() share the session's one"""
+        local = self._local
+        if local.conn is not None:
+            local.depth += 1
             return True
+        try:
+            local.conn = self.pool.checkout() if self.pooled else pyodbc.connect(self.connection_string)
         except Exception as e:
             st.error(f"Database connection failed: {e}")
             return False
+        local.depth = 1
+        return True
     
     def disconnect(self):
-        """Close database connection"""
-        if self.conn:
-            self.conn.close()
+        """Give the connection back (to the pool, or closed) once the outermost call is done"""
+        local = self._local
+        if local.conn is None:
+            return
+        local.depth -= 1
+        if local.depth:
+            return
+        conn, local.conn = local.conn, None
+        if self.pooled:
+            self.pool.release(conn)
+            return
+        try:
+            conn.close()
+        except pyodbc.Error:
+            pass
+    
+    @contextmanager
+    def session(self):
+        """Hold one connection across several calls on this thread, e.g. a whole dashboard load:
+        
+            with db.session():
+                stats = db.get_dashboard_data()
+                recent = db.get_inspections(limit=20)
+        """
+        if not self.connect():
+            raise ConnectionError("Database connection failed")
+        try:
+            yield self
+        finally:
+            self.disconnect()
+    
+    def close(self):
+        """Close the pooled connections for this connection string; later calls log in afresh"""
+        if self.pooled:
+            self.pool.close()
     
     def create_tables(self):
         """Create inspection tables if they don't exist"""
@@ -107,59 +332,100 @@ class InspectionDatabase:
     
     def save_inspection(self, inspection_data):
         """Save inspection data to database"""
+        ok, result = self.save_inspections([inspection_data])
+        if not ok:
+            return False, result
+        return True, f"Inspection saved with ID: {result[0]}"
+    
+    def _insert_headers(self, cursor, chunk):
+        """Insert a chunk of Inspections rows in one statement; returns their ids in input order.
+        
+        MERGE is used because its OUTPUT clause can carry the source row number,
+        and OUTPUT ... INTO a table variable keeps working when the table has triggers.
+        """
+        placeholders = ", ".join(["(?, ?, ?, ?, ?, ?, ?)"] * len(chunk))
+        params = []
+        for row_num, data in enumerate(chunk):
+            params.extend([
+                row_num,
+                data['type'],
+                data['building'],
+                data['date'],
+                data['inspector'],
+                data.get('aiReport', ''),
+                data.get('emailReportHTML', '')
+            ])
+        cursor.execute(f"""
+            SET NOCOUNT ON;
+            DECLARE @ids TABLE (RowNum INT, InspectionID INT);
+            MERGE Inspections AS t
+            USING (VALUES {placeholders}) AS s (RowNum, InspectionType, Building, InspectionDate, Inspector, AIReport, EmailReportHTML)
+            ON 1 = 0
+            WHEN NOT MATCHED THEN
+                INSERT (InspectionType, Building, InspectionDate, Inspector, AIReport, EmailReportHTML)
+                VALUES (s.InspectionType, s.Building, s.InspectionDate, s.Inspector, s.AIReport, s.EmailReportHTML)
+            OUTPUT s.RowNum, INSERTED.InspectionID INTO @ids;
+            SELECT RowNum, InspectionID FROM @ids;
+        """, params)
+        ids = dict(cursor.fetchall())
+        return [ids[row_num] for row_num in range(len(chunk))]
+    
+    def save_inspections(self, inspections, chunk_size=INSPECTION_CHUNK):
+        """Save many inspections in one transaction with a fixed number of statements per chunk.
+        
+        Each chunk costs one statement for the inspection rows, one array-bound
+        executemany for all of their details and one set-based insert for the
+        APPA level counts. Returns (True, [inspection ids]) or (False, error message);
+        self.last_save_stats records the statements the cursor actually executed.
+        """
         if not self.connect():
             return False, "Database connection failed"
         
-        cursor = self.conn.cursor()
+        raw_cursor = self.conn.cursor()
+        raw_cursor.fast_executemany = True
+        cursor = CountingCursor(raw_cursor)
         
         try:
-            # Insert main inspection record
-            cursor.execute("""
-                INSERT INTO Inspections (InspectionType, Building, InspectionDate, Inspector, AIReport, EmailReportHTML)
-                VALUES (?, ?, ?, ?, ?, ?)
-            """, (
-                inspection_data['type'],
-                inspection_data['building'],
-                inspection_data['date'],
-                inspection_data['inspector'],
-                inspection_data.get('aiReport', ''),
-                inspection_data.get('emailReportHTML', '')
-            ))
-            
-            # Get the inspection ID
-            cursor.execute("SELECT @@IDENTITY")
-            inspection_id = cursor.fetchone()[0]
-            
-            # Insert inspection details
-            level_counts = {1: 0, 2: 0, 3: 0, 4: 0, 5: 0}
-            
-            for detail in inspection_data.get('details', []):
-                cursor.execute("""
-                    INSERT INTO InspectionDetails (InspectionID, Item, Rating, Notes)
-                    VALUES (?, ?, ?, ?)
-                """, (
-                    inspection_id,
-                    detail['item'],
-                    detail['rating'],
-                    detail.get('notes', '')
-                ))
+            inspection_ids = []
+            for start in range(0, len(inspections), chunk_size):
+                chunk = inspections[start:start + chunk_size]
+                ids = self._insert_headers(cursor, chunk)
                 
-                # Count APPA levels
-                if detail['rating'].startswith('Level '):
-                    level = int(detail['rating'].split(' ')[1])
-                    level_counts[level] += 1
-            
-            # Insert APPA scores summary
-            cursor.execute("""
-                INSERT INTO APPAScores (InspectionID, Level1Count, Level2Count, Level3Count, Level4Count, Level5Count)
-                VALUES (?, ?, ?, ?, ?, ?)
-            """, (
-                inspection_id,
-                level_counts[1], level_counts[2], level_counts[3], level_counts[4], level_counts[5]
-            ))
+                details = [
+                    (inspection_id, detail.get('category'), detail['item'], detail.get('rating'), detail.get('notes', ''))
+                    for inspection_id, data in zip(ids, chunk)
+                    for detail in data.get('details', [])
+                ]
+                if details:
+                    cursor.setinputsizes(DETAIL_INPUT_SIZES)
+                    cursor.executemany("""
+                        INSERT INTO InspectionDetails (InspectionID, Category, Item, Rating, Notes)
+                        VALUES (?, ?, ?, ?, ?)
+                    """, details)
+                
+                # APPA level counts are tallied by the server from the rows just inserted
+                cursor.execute(f"""
+                    INSERT INTO APPAScores (InspectionID, Level1Count, Level2Count, Level3Count, Level4Count, Level5Count)
+                    SELECT i.InspectionID,
+                           COUNT(CASE WHEN d.Rating = 'Level 1' THEN 1 END),
+                           COUNT(CASE WHEN d.Rating = 'Level 2' THEN 1 END),
+                           COUNT(CASE WHEN d.Rating = 'Level 3' THEN 1 END),
+                           COUNT(CASE WHEN d.Rating = 'Level 4' THEN 1 END),
+                           COUNT(CASE WHEN d.Rating = 'Level 5' THEN 1 END)
+                    FROM Inspections i
+                    LEFT JOIN InspectionDetails d ON d.InspectionID = i.InspectionID
+                    WHERE i.InspectionID IN ({", ".join(["?"] * len(ids))})
+                    GROUP BY i.InspectionID
+                """, ids)
+                inspection_ids.extend(ids)
             
             self.conn.commit()
-            return True, f"Inspection saved with ID: {inspection_id}"
+            self.last_save_stats = {
+                'inspections': len(inspection_ids),
+                'statements': cursor.statements,
+                'statements_per_inspection': cursor.statements / len(inspection_ids) if inspection_ids else 0.0
+            }
+            return True, inspection_ids
             
         except Exception as e:
             self.conn.rollback()
@@ -318,4 +584,48 @@ class InspectionDatabase:
             return {}
         finally:
             cursor.close()
-            self.disconnect()
\ No newline at end of file
+            self.disconnect()
+
+
+if __name__ == "__main__":
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Measure bulk inspection inserts against a scratch database")
+    parser.add_argument("connection_string")
+    parser.add_argument("--inspections", type=int, default=500)
+    parser.add_argument("--items", type=int, default=30, help="details per inspection")
+    parser.add_argument("--batch", type=int, default=INSPECTION_CHUNK, help="inspections per save_inspections call")
+    args = parser.parse_args()
+    
+    # Pooled so the timings measure the inserts rather than repeated logins
+    db = InspectionDatabase(args.connection_string, pooled=True)
+    db.create_tables()
+    sample = [{
+        'type': 'custodial', 'building': f'Bench Hall {n % 10}', 'date': datetime.now().date(), 'inspector': 'bench',
+        'details': [{'category': 'Bench', 'item': f'Item {i}', 'rating': f'Level {i % 5 + 1}', 'notes': ''} for i in range(args.items)]
+    } for n in range(args.inspections)]
+    
+    def run(batch):
+        """Save the sample in batches of batch inspections; returns measured statements and time"""
+        statements = 0
+        started = time.monotonic()
+        for start in range(0, len(sample), batch):
+            ok, result = db.save_inspections(sample[start:start + batch])
+            if not ok:
+                raise SystemExit(result)
+            statements += db.last_save_stats['statements']
+        elapsed = time.monotonic() - started
+        return {
+            'batch': batch,
+            'statements': statements,
+            'statements_per_inspection': statements / len(sample),
+            'seconds': elapsed,
+            'inspections_per_second': len(sample) / elapsed if elapsed else None
+        }
+    
+    # One inspection per call is the old per-save behaviour; the batched run should approach 3 / batch
+    print(json.dumps({
+        'inspections': args.inspections,
+        'items_per_inspection': args.items,
+        'runs': [run(1), run(args.batch)]
+    }, indent=2, default=str))
@@ -0,0 +1,181 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import pool as pg_pool
+from psycopg2.extensions import cursor as pg_cursor
+import streamlit as st
+
+
+def _default_pool_size():
+    """Split the connection budget between the worker processes of this deployment"""
+    db = st.secrets.get("database", {})
+    budget = int(db.get("POOL_MAX_CONN", os.environ.get("DB_POOL_MAX_CONN", 10)))
+    workers = int(os.environ.get("WEB_CONCURRENCY", 1)) or 1
+    return max(1, budget // workers)
+
+
+class CountingCursor(pg_cursor):
+    """Cursor that counts statements sent to the server (execute_values pages included)"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.round_trips = 0
+
+    def execute(self, query, vars=None):
+        self.round_trips += 1
+        return super().execute(query, vars)
+
+    def executemany(self, query, vars_list):
+        vars_list = list(vars_list)
+        self.round_trips += len(vars_list)
+        return super().executemany(query, vars_list)
+
+
+class PostgresPool:
+    """Thread-safe pool of Postgres connections shared by every session in the process"""
+
+    def __init__(self, minconn=1, maxconn=5, health_check_interval=30, **connect_kwargs):
+        self.minconn = min(minconn, maxconn)
+        self.maxconn = maxconn
+        self.health_check_interval = health_check_interval
+        self._pool = pg_pool.ThreadedConnectionPool(self.minconn, maxconn, **connect_kwargs)
+        # ThreadedConnectionPool raises instead of waiting when exhausted,
+        # so the semaphore makes callers queue for a free slot
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._lock = threading.Lock()
+        self._last_used = {}
+        self._stats = {
+            'checkouts': 0,
+            'in_use': 0,
+            'peak_in_use': 0,
+            'wait_seconds_total': 0.0,
+            'wait_seconds_max': 0.0,
+            'health_checks': 0,
+            'discarded': 0,
+        }
+
+    def _is_healthy(self, conn):
+        """Ping connections that have been idle longer than the health check interval"""
+        if conn.closed:
+            return False
+        last_used = self._last_used.get(id(conn), 0)
+        if time.monotonic() - last_used < self.health_check_interval:
+            return True
+        with self._lock:
+            self._stats['health_checks'] += 1
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _checkout(self, timeout=None):
+        started = time.monotonic()
+        if not self._slots.acquire(timeout=timeout):
+            raise pg_pool.PoolError("Timed out waiting for a database connection")
+        waited = time.monotonic() - started
+        try:
+            conn = self._pool.getconn()
+            while not self._is_healthy(conn):
+                self._last_used.pop(id(conn), None)
+                self._pool.putconn(conn, close=True)
+                with self._lock:
+                    self._stats['discarded'] += 1
+                conn = self._pool.getconn()
+        except Exception:
+            self._slots.release()
+            raise
+        with self._lock:
+            self._stats['checkouts'] += 1
+            self._stats['in_use'] += 1
+            self._stats['peak_in_use'] = max(self._stats['peak_in_use'], self._stats['in_use'])
+            self._stats['wait_seconds_total'] += waited
+            self._stats['wait_seconds_max'] = max(self._stats['wait_seconds_max'], waited)
+        return conn
+
+    def _release(self, conn):
+        broken = bool(conn.closed)
+        if not broken:
+            try:
+                # Never hand an open transaction to the next borrower
+                conn.rollback()
+            except psycopg2.Error:
+                broken = True
+        if broken:
+            self._last_used.pop(id(conn), None)
+        else:
+            self._last_used[id(conn)] = time.monotonic()
+        self._pool.putconn(conn, close=broken)
+        with self._lock:
+            self._stats['in_use'] -= 1
+            if broken:
+                self._stats['discarded'] += 1
+        self._slots.release()
+
+    @contextmanager
+    def connection(self, timeout=None):
+        """Borrow a connection; commits on success and rolls back on error"""
+        conn = self._checkout(timeout)
+        try:
+            yield conn
+            if not conn.closed:
+                conn.commit()
+        except Exception:
+            if not conn.closed:
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    pass
+            raise
+        finally:
+            self._release(conn)
+
+    def stats(self):
+        """Snapshot of pool occupancy and wait times"""
+        with self._lock:
+            stats = dict(self._stats)
+        checkouts = stats['checkouts'] or 1
+        stats['size'] = self.maxconn
+        stats['idle'] = len(self._pool._pool)
+        stats['occupancy'] = stats['in_use'] / self.maxconn
+        stats['wait_seconds_avg'] = stats['wait_seconds_total'] / checkouts
+        return stats
+
+    def close(self):
+        self._pool.closeall()
+
+
+@st.cache_resource(show_spinner=False)
+def get_pool():
+    """Create the process-wide pool once, from the [database] secrets"""
+    db = st.secrets["database"]
+    return PostgresPool(
+        minconn=int(db.get("POOL_MIN_CONN", 1)),
+        maxconn=_default_pool_size(),
+        health_check_interval=int(db.get("POOL_HEALTH_CHECK_SECONDS", 30)),
+        dbname=db["NEON_DB_NAME"],
+        user=db["NEON_DB_USER"],
+        password=db["NEON_DB_PASSWORD"],
+        host=db["NEON_DB_HOST"],
+        port=db["NEON_DB_PORT"],
+        connect_timeout=10,
+        keepalives=1,
+        keepalives_idle=30,
+        keepalives_interval=10,
+        keepalives_count=3,
+    )
+
+
+def get_conn(timeout=None):
+    """Context manager yielding a pooled connection: ``with get_conn() as conn:``"""
+    return get_pool().connection(timeout)
+
+
+def pool_stats():
+    """Occupancy and wait statistics for the shared pool"""
+    return get_pool().stats()
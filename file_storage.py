@@ -1,15 +1,267 @@
+import csv
+import gzip
 import json
+import logging
 import os
-import pandas as pd
-from datetime import datetime
+import posixpath
+import re
+import sqlite3
+import tempfile
+import threading
+import uuid
+from contextlib import closing
+from datetime import datetime, timedelta
 import streamlit as st
 
+from analytics import ItemFacts
+
+logger = logging.getLogger(__name__)
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+# Kept in a subdirectory so SQLite's journal files don't touch the data directory's mtime
+MANIFEST_PATH = os.path.join(".index", "manifest.sqlite3")
+# Bump when the manifest tables change; an older manifest is dropped and rebuilt from the files
+MANIFEST_VERSION = 4
+# Days of per-day save counts summed for the "recent activity" figure
+RECENT_ACTIVITY_DAYS = 30
+INSPECTION_SUFFIXES = ('.json', '.json.gz')
+
+EXPORT_COLUMNS = [
+    'filename', 'building', 'inspection_type', 'inspector', 'inspection_date', 'saved_at', 'ai_report',
+    'total_items', 'level_1_count', 'level_2_count', 'level_3_count', 'level_4_count', 'level_5_count',
+]
+# Rows buffered per Parquet record batch; bounds memory whatever the archive size
+EXPORT_BATCH_ROWS = 5000
+
+def read_inspection_file(path):
+    """Parse an inspection file, plain or gzip-compressed"""
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt', encoding='utf-8') as f:
+        return json.load(f)
+
+def _saved_timestamp(data, stat):
+    """When the inspection was saved, from its saved_at field; mtime for files that lack one"""
+    try:
+        return datetime.fromisoformat(str(data['saved_at'])).timestamp()
+    except (KeyError, ValueError):
+        return stat.st_mtime
+
+def _safe_name(value):
+    return re.sub(r'[^A-Za-z0-9_.-]+', '_', str(value)).strip('._') or 'Unknown'
+
+# Adds sign to every counter a manifest row contributes to; used by the manifest triggers.
+# Names are coalesced because counters.name is NOT NULL and legacy files can hold nulls
+COUNT_ROW_SQL = """
+    INSERT INTO counters (scope, name, value) VALUES
+        ('total', 'inspections', {sign}),
+        ('by_type', COALESCE({row}.inspection_type, ''), {sign}),
+        ('by_building', COALESCE({row}.building, ''), {sign}),
+        ('by_day', date({row}.created, 'unixepoch', 'localtime'), {sign})
+    ON CONFLICT (scope, name) DO UPDATE SET value = value + excluded.value;"""
+
+COUNTERS_REBUILD_SQL = """
+    DELETE FROM counters;
+    INSERT INTO counters (scope, name, value)
+        SELECT 'total', 'inspections', COUNT(*) FROM manifest
+        UNION ALL SELECT 'by_type', COALESCE(inspection_type, ''), COUNT(*) FROM manifest GROUP BY 2
+        UNION ALL SELECT 'by_building', COALESCE(building, ''), COUNT(*) FROM manifest GROUP BY 2
+        UNION ALL SELECT 'by_day', date(created, 'unixepoch', 'localtime'), COUNT(*) FROM manifest GROUP BY 2;
+"""
+
+class ManifestIndex:
+    """SQLite manifest of the header fields of every inspection file.
+
+    Rows are keyed by the file's path relative to the storage directory and
+    carry its mtime and size, so the manifest can be brought up to date by
+    parsing only files that changed. The mtime of every directory is kept
+    too, so shards nobody touched are not even listed.
+
+    Triggers keep per-type, per-building and per-day counts in the counters
+    table in step with the manifest, so summary statistics never scan it.
+    """
+    
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with closing(self.connect()) as conn, conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            if conn.execute("PRAGMA user_version").fetchone()[0] != MANIFEST_VERSION:
+                # The manifest only mirrors the files, so an old layout is simply rebuilt
+                for table in ("manifest", "meta", "dirs", "counters"):
+                    conn.execute(f"DROP TABLE IF EXISTS {table}")
+                conn.execute(f"PRAGMA user_version = {MANIFEST_VERSION}")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS manifest (
+                    filename TEXT PRIMARY KEY,
+                    dir TEXT NOT NULL,
+                    mtime_ns INTEGER NOT NULL,
+                    size INTEGER NOT NULL,
+                    created REAL NOT NULL,
+                    building TEXT,
+                    inspection_type TEXT,
+                    inspector TEXT,
+                    date TEXT
+                )""")
+            conn.execute("CREATE INDEX IF NOT EXISTS manifest_dir ON manifest (dir)")
+            conn.execute("CREATE INDEX IF NOT EXISTS manifest_created ON manifest (created DESC)")
+            conn.execute("CREATE INDEX IF NOT EXISTS manifest_building ON manifest (building, created DESC)")
+            conn.execute("CREATE INDEX IF NOT EXISTS manifest_type ON manifest (inspection_type, created DESC)")
+            conn.execute("CREATE TABLE IF NOT EXISTS dirs (path TEXT PRIMARY KEY, mtime_ns INTEGER NOT NULL)")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS counters (
+                    scope TEXT NOT NULL,
+                    name TEXT NOT NULL,
+                    value INTEGER NOT NULL,
+                    PRIMARY KEY (scope, name)
+                )""")
+            for event, sign, row in (("INSERT", 1, "NEW"), ("DELETE", -1, "OLD")):
+                conn.execute(f"""
+                    CREATE TRIGGER IF NOT EXISTS manifest_count_{event.lower()} AFTER {event} ON manifest BEGIN
+                        {COUNT_ROW_SQL.format(sign=sign, row=row)}
+                    END""")
+            conn.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS manifest_count_update AFTER UPDATE ON manifest BEGIN
+                    {COUNT_ROW_SQL.format(sign=-1, row="OLD")}
+                    {COUNT_ROW_SQL.format(sign=1, row="NEW")}
+                END""")
+    
+    def connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+    
+    def upsert(self, conn, filename, stat, data):
+        conn.execute("""
+            INSERT INTO manifest (filename, dir, mtime_ns, size, created, building, inspection_type, inspector, date)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (filename) DO UPDATE SET mtime_ns = excluded.mtime_ns, size = excluded.size,
+                created = excluded.created, building = excluded.building, inspection_type = excluded.inspection_type,
+                inspector = excluded.inspector, date = excluded.date
+        """, (filename, posixpath.dirname(filename), stat.st_mtime_ns, stat.st_size, _saved_timestamp(data, stat),
+              data.get('building') or 'Unknown', data.get('type') or 'unknown',
+              data.get('inspector') or 'Unknown', str(data.get('date') or 'Unknown')))
+    
+    def record(self, storage_dir, filename, data, dirs_before):
+        """Add or refresh one file after it has been written.
+        
+        dirs_before maps each directory on the file's path to its mtime
+        before the write (None if the write created it). Directories that
+        were in sync are marked in sync again, so the next listing doesn't
+        rescan them.
+        """
+        stat = os.stat(os.path.join(storage_dir, filename))
+        with closing(self.connect()) as conn, conn:
+            self.upsert(conn, filename, stat, data)
+            for rel, before in dirs_before.items():
+                mtime_ns = os.stat(os.path.join(storage_dir, rel)).st_mtime_ns
+                if before is None:
+                    conn.execute("INSERT OR IGNORE INTO dirs (path, mtime_ns) VALUES (?, ?)", (rel, mtime_ns))
+                else:
+                    conn.execute("UPDATE dirs SET mtime_ns = ? WHERE path = ? AND mtime_ns = ?", (mtime_ns, rel, before))
+    
+    def _scan(self, conn, storage_dir, rel, pending):
+        """Reconcile one directory's files with the manifest and queue its subdirectories"""
+        known = {name: (mtime_ns, size) for name, mtime_ns, size in
+                 conn.execute("SELECT filename, mtime_ns, size FROM manifest WHERE dir = ?", (rel,))}
+        for entry in os.scandir(os.path.join(storage_dir, rel)):
+            name = posixpath.join(rel, entry.name)
+            if entry.is_dir():
+                if not entry.name.startswith('.'):
+                    pending.append(name)
+                continue
+            if not entry.name.endswith(INSPECTION_SUFFIXES) or not entry.is_file():
+                continue
+            stat = entry.stat()
+            if known.pop(name, None) == (stat.st_mtime_ns, stat.st_size):
+                continue
+            try:
+                data = read_inspection_file(entry.path)
+                self.upsert(conn, name, stat, data)
+            except Exception:
+                # One unreadable or unindexable file must not abort the whole sync
+                logger.exception("Skipping %s while indexing inspections", name)
+                continue
+        conn.executemany("DELETE FROM manifest WHERE filename = ?", [(name,) for name in known])
+    
+    def sync(self, storage_dir, full=False):
+        """Bring the manifest up to date with the directory tree.
+        
+        Unless full is set, a directory whose own mtime is unchanged is not
+        listed (files are only ever added or removed), so a sync touches
+        one stat per shard; a listed directory stats every file but only
+        parses new or modified ones.
+        """
+        with self.lock, closing(self.connect()) as conn, conn:
+            known_dirs = dict(conn.execute("SELECT path, mtime_ns FROM dirs"))
+            children = {}
+            for rel in known_dirs:
+                if rel:
+                    children.setdefault(posixpath.dirname(rel), []).append(rel)
+            seen = set()
+            pending = [""]
+            while pending:
+                rel = pending.pop()
+                try:
+                    # Taken before listing, so files added mid-scan trigger another scan next time
+                    mtime_ns = os.stat(os.path.join(storage_dir, rel)).st_mtime_ns
+                except FileNotFoundError:
+                    continue
+                seen.add(rel)
+                if not full and known_dirs.get(rel) == mtime_ns:
+                    pending.extend(children.get(rel, ()))
+                    continue
+                self._scan(conn, storage_dir, rel, pending)
+                conn.execute("INSERT OR REPLACE INTO dirs (path, mtime_ns) VALUES (?, ?)", (rel, mtime_ns))
+            for rel in set(known_dirs) - seen:
+                conn.execute("DELETE FROM dirs WHERE path = ?", (rel,))
+                conn.execute("DELETE FROM manifest WHERE dir = ?", (rel,))
+    
+    def counters(self, since_day):
+        """({scope: {name: count}}, saves since since_day) from the trigger-maintained counters"""
+        with closing(self.connect()) as conn:
+            counters = {}
+            for scope, name, value in conn.execute("SELECT scope, name, value FROM counters WHERE scope != 'by_day' AND value > 0"):
+                counters.setdefault(scope, {})[name] = value
+            recent = conn.execute("SELECT COALESCE(SUM(value), 0) FROM counters WHERE scope = 'by_day' AND name >= ?",
+                                  (since_day,)).fetchone()[0]
+        return counters, recent
+    
+    def rebuild_counters(self):
+        with self.lock, closing(self.connect()) as conn, conn:
+            conn.executescript(COUNTERS_REBUILD_SQL)
+    
+    def query(self, limit=100, building=None, inspection_type=None, inspector=None):
+        clauses, params = [], []
+        for column, value in (("building", building), ("inspection_type", inspection_type), ("inspector", inspector)):
+            if value:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        sql = "SELECT filename, created, building, inspection_type, inspector, date FROM manifest"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY created DESC"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        with closing(self.connect()) as conn:
+            return conn.execute(sql, params).fetchall()
+
 class FileStorage:
     """Simple file-based storage for inspections when database is not available"""
     
-    def __init__(self, storage_dir="inspection_data"):
+    def __init__(self, storage_dir="inspection_data", compact=False, compress=False):
         self.storage_dir = storage_dir
+        # compact drops the indentation; compress gzips each file (written as .json.gz)
+        self.compact = compact
+        self.compress = compress
         self.ensure_directory()
+        self.index = ManifestIndex(os.path.join(self.storage_dir, MANIFEST_PATH))
+        self.facts = ItemFacts(os.path.join(self.storage_dir, ".analytics"))
     
     def ensure_directory(self):
         """Create storage directory if it doesn't exist"""
@@ -17,160 +269,224 @@ class FileStorage:
             os.makedirs(self.storage_dir)
     
     def save_inspection(self, inspection_data):
-        """Save inspection data to JSON file"""
+        """Save inspection data to its own file under a year/month shard"""
         try:
-            # Generate filename with timestamp
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            building = inspection_data.get('building', 'Unknown').replace(' ', '_')
-            inspection_type = inspection_data.get('type', 'unknown')
-            
-            filename = f"{timestamp}_{inspection_type}_{building}.json"
-            filepath = os.path.join(self.storage_dir, filename)
+            now = datetime.now()
+            # The random part keeps saves within the same second from colliding
+            file_id = f"{now.strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:12]}"
+            building = _safe_name(inspection_data.get('building') or 'Unknown')
+            inspection_type = _safe_name(inspection_data.get('type') or 'unknown')
+            shard = now.strftime("%Y/%m")
+            suffix = '.json.gz' if self.compress else '.json'
+            filename = f"{shard}/{file_id}_{inspection_type}_{building}{suffix}"
             
-            # Add metadata
-            inspection_data['saved_at'] = datetime.now().isoformat()
-            inspection_data['file_id'] = timestamp
+            # Metadata goes on a copy so the caller's dict is left alone
+            record = dict(inspection_data, saved_at=now.isoformat(), file_id=file_id)
             
-            # Save to file
-            with open(filepath, 'w') as f:
-                json.dump(inspection_data, f, indent=2, default=str)
+            dirs_before = {}
+            for rel in ("", now.strftime("%Y"), shard):
+                try:
+                    dirs_before[rel] = os.stat(os.path.join(self.storage_dir, rel)).st_mtime_ns
+                except FileNotFoundError:
+                    dirs_before[rel] = None
+            self._write(filename, record)
+            try:
+                self.index.record(self.storage_dir, filename, record, dirs_before)
+            except Exception:
+                # The save is reported as failed, so don't leave a file the next sync would index
+                os.remove(os.path.join(self.storage_dir, filename))
+                raise
+            # Written on the fact table's own thread; failures are logged and counted in self.facts.stats()
+            self.facts.append(file_id, 1, record.get('building'), record.get('type'), record.get('date'),
+                              [(d.get('category'), d.get('item'), d.get('rating')) for d in record.get('details', [])])
             
             return True, f"Inspection saved as {filename}"
             
         except Exception as e:
             return False, f"Error saving inspection: {e}"
     
-    def get_inspections(self, limit=100):
-        """Get list of saved inspections"""
+    def _write(self, filename, record):
+        """Write through a temp file, fsync and rename so readers never see a partial file"""
+        path = os.path.join(self.storage_dir, filename)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if self.compact:
+            text = json.dumps(record, separators=(',', ':'), default=str)
+        else:
+            text = json.dumps(record, indent=2, default=str)
+        data = text.encode('utf-8')
+        if self.compress:
+            data = gzip.compress(data)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
         try:
-            files = []
-            for filename in os.listdir(self.storage_dir):
-                if filename.endswith('.json'):
-                    filepath = os.path.join(self.storage_dir, filename)
-                    
-                    # Get file info
-                    stat = os.stat(filepath)
-                    created = datetime.fromtimestamp(stat.st_ctime)
-                    
-                    # Try to load basic info
-                    try:
-                        with open(filepath, 'r') as f:
-                            data = json.load(f)
-                        
-                        files.append({
-                            'filename': filename,
-                            'created': created,
-                            'building': data.get('building', 'Unknown'),
-                            'inspection_type': data.get('type', 'unknown'),
-                            'inspector': data.get('inspector', 'Unknown'),
-                            'date': data.get('date', 'Unknown')
-                        })
-                    except:
-                        # Skip files that can't be read
-                        continue
-            
-            # Sort by creation date (newest first) and limit
-            files.sort(key=lambda x: x['created'], reverse=True)
-            return files[:limit]
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+    
+    def get_inspections(self, limit=100, building=None, inspection_type=None, inspector=None):
+        """Get list of saved inspections, newest first, from the manifest"""
+        try:
+            self.index.sync(self.storage_dir)
+            return [{
+                'filename': filename,
+                'created': datetime.fromtimestamp(created),
+                'building': building_name,
+                'inspection_type': itype,
+                'inspector': inspector_name,
+                'date': inspection_date
+            } for filename, created, building_name, itype, inspector_name, inspection_date
+                in self.index.query(limit, building, inspection_type, inspector)]
             
         except Exception as e:
             st.error(f"Error reading inspections: {e}")
             return []
     
+    def rebuild_index(self):
+        """Re-check every file against the manifest, e.g. after files were edited in place"""
+        self.index.sync(self.storage_dir, full=True)
+    
+    def rebuild_analytics(self):
+        """Rewrite the item fact table from every inspection file"""
+        def rows():
+            for filename, *_ in self.index.query(limit=None):
+                try:
+                    data = read_inspection_file(os.path.join(self.storage_dir, filename))
+                except Exception:
+                    continue
+                for detail in data.get('details', []):
+                    yield (data.get('file_id', filename), 1, data.get('building'), data.get('type'), data.get('date'),
+                           detail.get('category'), detail.get('item'), detail.get('rating'))
+        
+        self.index.sync(self.storage_dir)
+        return self.facts.rebuild(rows())
+    
     def get_inspection_data(self, filename):
         """Get full inspection data from file"""
         try:
-            filepath = os.path.join(self.storage_dir, filename)
-            with open(filepath, 'r') as f:
-                return json.load(f)
+            return read_inspection_file(os.path.join(self.storage_dir, filename))
         except Exception as e:
             st.error(f"Error reading inspection file: {e}")
             return None
     
+    def iter_export_rows(self):
+        """Yield one flattened export row per inspection, newest first, reading each file once"""
+        self.index.sync(self.storage_dir)
+        for filename, *_ in self.index.query(limit=None):
+            try:
+                data = read_inspection_file(os.path.join(self.storage_dir, filename))
+            except Exception:
+                # Skip files that disappeared or can't be read
+                continue
+            details = data.get('details', [])
+            row = {
+                'filename': filename,
+                'building': data.get('building'),
+                'inspection_type': data.get('type'),
+                'inspector': data.get('inspector'),
+                'inspection_date': data.get('date'),
+                'saved_at': data.get('saved_at'),
+                'ai_report': data.get('aiReport', ''),
+                'total_items': len(details)
+            }
+            
+            # Count APPA levels
+            level_counts = {1: 0, 2: 0, 3: 0, 4: 0, 5: 0}
+            for detail in details:
+                rating = detail.get('rating') or ''
+                if rating.startswith('Level '):
+                    try:
+                        level_counts[int(rating.split(' ')[1])] += 1
+                    except (ValueError, IndexError, KeyError):
+                        continue
+            for level, count in level_counts.items():
+                row[f'level_{level}_count'] = count
+            yield row
+    
     def export_to_csv(self, output_file="inspections_export.csv"):
-        """Export all inspections to CSV"""
+        """Export all inspections to CSV, streaming rows to disk as they are read"""
         try:
-            inspections = self.get_inspections(limit=None)
-            all_data = []
+            count = 0
+            with open(output_file, 'w', newline='', encoding='utf-8') as f:
+                writer = csv.DictWriter(f, fieldnames=EXPORT_COLUMNS)
+                writer.writeheader()
+                for row in self.iter_export_rows():
+                    writer.writerow(row)
+                    count += 1
             
-            for inspection_info in inspections:
-                data = self.get_inspection_data(inspection_info['filename'])
-                if data:
-                    # Flatten the data for CSV
-                    row = {
-                        'filename': inspection_info['filename'],
-                        'building': data.get('building'),
-                        'inspection_type': data.get('type'),
-                        'inspector': data.get('inspector'),
-                        'inspection_date': data.get('date'),
-                        'saved_at': data.get('saved_at'),
-                        'ai_report': data.get('aiReport', ''),
-                        'total_items': len(data.get('details', []))
-                    }
-                    
-                    # Count APPA levels
-                    level_counts = {1: 0, 2: 0, 3: 0, 4: 0, 5: 0}
-                    for detail in data.get('details', []):
-                        if detail.get('rating', '').startswith('Level '):
-                            try:
-                                level = int(detail['rating'].split(' ')[1])
-                                level_counts[level] += 1
-                            except:
-                                continue
-                    
-                    row.update({
-                        'level_1_count': level_counts[1],
-                        'level_2_count': level_counts[2],
-                        'level_3_count': level_counts[3],
-                        'level_4_count': level_counts[4],
-                        'level_5_count': level_counts[5]
-                    })
-                    
-                    all_data.append(row)
+            return True, f"Exported {count} inspections to {output_file}"
             
-            # Create DataFrame and save
-            df = pd.DataFrame(all_data)
-            df.to_csv(output_file, index=False)
+        except Exception as e:
+            return False, f"Error exporting to CSV: {e}"
+    
+    def export_to_parquet(self, output_file="inspections_export.parquet", batch_rows=EXPORT_BATCH_ROWS):
+        """Export all inspections to Parquet, one record batch per batch_rows inspections"""
+        if not PYARROW_AVAILABLE:
+            return False, "Parquet export requires pyarrow (pip install pyarrow)."
+        int_columns = {'total_items', 'level_1_count', 'level_2_count', 'level_3_count', 'level_4_count', 'level_5_count'}
+        schema = pa.schema([(name, pa.int64() if name in int_columns else pa.string()) for name in EXPORT_COLUMNS])
+        try:
+            count = 0
+            batch = {name: [] for name in EXPORT_COLUMNS}
+            with pq.ParquetWriter(output_file, schema) as writer:
+                for row in self.iter_export_rows():
+                    for name in EXPORT_COLUMNS:
+                        value = row[name]
+                        batch[name].append(value if value is None or name in int_columns else str(value))
+                    count += 1
+                    if count % batch_rows == 0:
+                        writer.write_batch(pa.record_batch(batch, schema=schema))
+                        batch = {name: [] for name in EXPORT_COLUMNS}
+                if batch['filename']:
+                    writer.write_batch(pa.record_batch(batch, schema=schema))
             
-            return True, f"Exported {len(all_data)} inspections to {output_file}"
+            return True, f"Exported {count} inspections to {output_file}"
             
         except Exception as e:
-            return False, f"Error exporting to CSV: {e}"
+            return False, f"Error exporting to Parquet: {e}"
     
     def get_summary_stats(self):
-        """Get summary statistics"""
+        """Get summary statistics from the manifest's running counters"""
         try:
-            inspections = self.get_inspections(limit=None)
+            self.index.sync(self.storage_dir)
+            since_day = (datetime.now() - timedelta(days=RECENT_ACTIVITY_DAYS)).date().isoformat()
+            counters, recent = self.index.counters(since_day)
+            total = counters.get('total', {}).get('inspections', 0)
             
-            if not inspections:
+            if not total:
                 return {}
             
-            # Basic stats
-            total = len(inspections)
-            by_type = {}
-            by_building = {}
-            
-            for inspection in inspections:
-                # Count by type
-                itype = inspection['inspection_type']
-                by_type[itype] = by_type.get(itype, 0) + 1
-                
-                # Count by building
-                building = inspection['building']
-                by_building[building] = by_building.get(building, 0) + 1
-            
-            # Recent activity (last 30 days)
-            recent_cutoff = datetime.now() - pd.Timedelta(days=30)
-            recent = sum(1 for i in inspections if i['created'] >= recent_cutoff)
-            
             return {
                 'total_inspections': total,
-                'by_type': by_type,
-                'by_building': by_building,
+                'by_type': counters.get('by_type', {}),
+                'by_building': counters.get('by_building', {}),
                 'recent_activity': recent,
                 'storage_type': 'File-based'
             }
             
         except Exception as e:
             st.error(f"Error getting summary stats: {e}")
-            return {}
\ No newline at end of file
+            return {}
+    
+    def rebuild_stats(self):
+        """Recount the summary statistics from the manifest (repair)"""
+        self.index.sync(self.storage_dir)
+        self.index.rebuild_counters()
+
+
+if __name__ == "__main__":
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Maintain a file-based inspection store")
+    parser.add_argument("command", choices=["rebuild"], help="re-index every file and recount statistics and analytics")
+    parser.add_argument("--storage-dir", default="inspection_data")
+    args = parser.parse_args()
+    storage = FileStorage(args.storage_dir)
+    storage.rebuild_index()
+    storage.rebuild_stats()
+    print(f"Indexed {storage.get_summary_stats().get('total_inspections', 0)} inspections, "
+          f"{storage.rebuild_analytics()} analytics rows")
@@ -0,0 +1,257 @@
+import json
+import random
+import threading
+import time
+from collections import deque
+
+import requests
+from requests.adapters import HTTPAdapter
+
+DEFAULT_BASE_URL = "https://generativelanguage.googleapis.com/v1beta"
+
+# Statuses worth retrying; everything else fails immediately
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+
+class GeminiError(Exception):
+    """A Gemini request failed; the message is safe to show to the user"""
+
+
+class GeminiUnavailable(GeminiError):
+    """The circuit breaker is open or the rate limiter could not admit the call in time"""
+
+
+class GeminiBlocked(GeminiError):
+    """The response was withheld for safety reasons"""
+
+
+class TokenBucket:
+    """Allows `rate` calls per second on average with bursts up to `capacity`"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, timeout=None):
+        """Take one token, waiting up to timeout seconds; returns False on timeout"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return True
+                wait = (1 - self.tokens) / self.rate
+            if deadline is not None and time.monotonic() + wait > deadline:
+                return False
+            time.sleep(wait)
+
+
+class CircuitBreaker:
+    """Opens after `threshold` consecutive failures and lets one trial call through after `cooldown`"""
+
+    def __init__(self, threshold=5, cooldown=30):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+        self.lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.cooldown:
+            return "half-open"
+        return "open"
+
+    def allow(self):
+        with self.lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half-open" and not self.trial_in_flight:
+                self.trial_in_flight = True
+                return True
+            return False
+
+    def cancel(self):
+        """Give back an admitted call that never reached the service"""
+        with self.lock:
+            self.trial_in_flight = False
+
+    def record(self, success):
+        with self.lock:
+            self.trial_in_flight = False
+            if success:
+                self.failures = 0
+                self.opened_at = None
+            else:
+                self.failures += 1
+                if self.failures >= self.threshold or self.opened_at is not None:
+                    self.opened_at = time.monotonic()
+
+
+class GeminiClient:
+    """Shared Gemini REST client with keep-alive, rate limiting, retries and a circuit breaker"""
+
+    def __init__(self, api_key, base_url=DEFAULT_BASE_URL, requests_per_minute=60, burst=5,
+                 max_retries=3, backoff_base=0.5, backoff_max=8.0, breaker_threshold=5,
+                 breaker_cooldown=30, pool_size=10):
+        self.api_key = api_key
+        self.base_url = base_url.rstrip("/")
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.bucket = TokenBucket(requests_per_minute / 60.0, burst)
+        self.breaker = CircuitBreaker(breaker_threshold, breaker_cooldown)
+        self.session = requests.Session()
+        # The key travels in a header rather than the URL so it stays out of logs
+        self.session.headers.update({"x-goog-api-key": api_key, "Content-Type": "application/json"})
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._metrics_lock = threading.Lock()
+        self._latencies = deque(maxlen=500)
+        self._first_token = deque(maxlen=500)
+        self._metrics = {'requests': 0, 'successes': 0, 'failures': 0, 'retries': 0,
+                         'rate_limited': 0, 'short_circuited': 0}
+
+    def _count(self, name, amount=1):
+        with self._metrics_lock:
+            self._metrics[name] += amount
+
+    def _backoff(self, attempt, retry_after=None):
+        """Full-jitter exponential backoff, honouring Retry-After when the server sends it"""
+        if retry_after:
+            try:
+                return min(float(retry_after), self.backoff_max)
+            except ValueError:
+                pass
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def post(self, model_name, method, payload, timeout=30, stream=False, params=None):
+        """POST to {model}:{method} with retries; returns the successful requests.Response"""
+        if not self.api_key:
+            raise GeminiError("Gemini API key not configured.")
+        if not self.breaker.allow():
+            self._count('short_circuited')
+            raise GeminiUnavailable("The AI service is temporarily unavailable. Please try again shortly.")
+        url = f"{self.base_url}/{model_name}:{method}"
+        last_error = None
+        # Set once the breaker has been told the outcome; anything else gives back the admission
+        resolved = False
+        try:
+            for attempt in range(self.max_retries + 1):
+                if not self.bucket.acquire(timeout=timeout):
+                    self._count('rate_limited')
+                    raise GeminiUnavailable("Too many AI requests right now. Please try again shortly.")
+                if attempt:
+                    self._count('retries')
+                self._count('requests')
+                started = time.monotonic()
+                retry_after = None
+                try:
+                    response = self.session.post(url, json=payload, timeout=timeout, stream=stream, params=params)
+                    if response.ok:
+                        with self._metrics_lock:
+                            self._latencies.append(time.monotonic() - started)
+                        self._count('successes')
+                        self.breaker.record(True)
+                        resolved = True
+                        return response
+                    last_error = GeminiError(f"API Error: {response.status_code} - {response.text[:500]}")
+                    if response.status_code not in RETRYABLE_STATUSES:
+                        self._count('failures')
+                        self.breaker.record(True)
+                        resolved = True
+                        raise last_error
+                    retry_after = response.headers.get("Retry-After")
+                except requests.exceptions.Timeout:
+                    last_error = GeminiError("Request timed out. Please try again.")
+                except requests.exceptions.ConnectionError as e:
+                    last_error = GeminiError(f"Could not reach the AI service: {e}")
+                except requests.exceptions.RequestException as e:
+                    last_error = GeminiError(f"The AI request failed: {e}")
+                self._count('failures')
+                if attempt < self.max_retries:
+                    time.sleep(self._backoff(attempt, retry_after))
+            self.breaker.record(False)
+            resolved = True
+            raise last_error
+        finally:
+            if not resolved:
+                # Never leave a half-open breaker waiting on a trial call that will not report back
+                self.breaker.cancel()
+
+    def generate_content(self, model_name, payload, timeout=30):
+        """Call generateContent and return the parsed JSON"""
+        return self.post(model_name, "generateContent", payload, timeout=timeout).json()
+
+    def stream_content(self, model_name, payload, timeout=30):
+        """Call streamGenerateContent and yield text chunks as they arrive.
+
+        Retries and the breaker only cover opening the stream; once text has
+        been yielded a broken connection surfaces as GeminiError.
+        """
+        started = time.monotonic()
+        response = self.post(model_name, "streamGenerateContent", payload, timeout=timeout,
+                             stream=True, params={"alt": "sse"})
+        first = True
+        truncated = False
+        try:
+            for line in response.iter_lines(decode_unicode=True):
+                if not line or not line.startswith("data:"):
+                    continue
+                chunk = json.loads(line[5:])
+                candidate = (chunk.get('candidates') or [{}])[0]
+                if candidate.get('finishReason') == 'SAFETY':
+                    raise GeminiBlocked("Response was blocked for safety reasons. Please try rephrasing your request.")
+                truncated = candidate.get('finishReason') == 'MAX_TOKENS'
+                text = "".join(part.get('text', '') for part in candidate.get('content', {}).get('parts') or [])
+                if text:
+                    if first:
+                        with self._metrics_lock:
+                            self._first_token.append(time.monotonic() - started)
+                        first = False
+                    yield text
+        except requests.exceptions.RequestException as e:
+            raise GeminiError(f"The AI response was interrupted: {e}")
+        finally:
+            response.close()
+        if truncated and not first:
+            yield "\n\n[Note: Response was truncated. Consider running analysis again.]"
+
+    def metrics(self):
+        """Request counts, latency percentiles and breaker state"""
+        with self._metrics_lock:
+            metrics = dict(self._metrics)
+            latencies = sorted(self._latencies)
+            first_token = sorted(self._first_token)
+        if latencies:
+            metrics['latency_avg'] = sum(latencies) / len(latencies)
+            metrics['latency_p50'] = latencies[len(latencies) // 2]
+            metrics['latency_p95'] = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        if first_token:
+            metrics['first_token_p50'] = first_token[len(first_token) // 2]
+            metrics['first_token_p95'] = first_token[min(len(first_token) - 1, int(len(first_token) * 0.95))]
+        metrics['circuit'] = self.breaker.state
+        return metrics
+
+
+def extract_text(result):
+    """Text of the first candidate; raises GeminiBlocked for safety stops"""
+    candidate = (result.get('candidates') or [{}])[0]
+    if candidate.get('finishReason') == 'SAFETY':
+        raise GeminiBlocked("Response was blocked for safety reasons. Please try rephrasing your request.")
+    parts = candidate.get('content', {}).get('parts') or [{}]
+    content = "".join(part.get('text', '') for part in parts)
+    if candidate.get('finishReason') == 'MAX_TOKENS' and content:
+        content += "\n\n[Note: Response was truncated. Consider running analysis again.]"
+    return content
@@ -0,0 +1,133 @@
+# Local stand-in for the Gemini generateContent and streamGenerateContent endpoints. Point the app at it
+# with gemini_base_url = "http://127.0.0.1:8787/v1beta" under [api], or run
+# `python gemini_stub.py --bench 200` to drive GeminiClient against it.
+import argparse
+import json
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from gemini_client import GeminiClient, GeminiError, extract_text
+
+STUB_REPORT = """**OVERALL APPA LEVEL:** 2 - Stub response for offline testing.
+
+**STRENGTHS:** Stub strength.
+
+**URGENT ISSUES:** None.
+
+**ACTION PLAN:** Nothing to do.
+
+**MANAGEMENT ASSESSMENT:** Generated by gemini_stub.py."""
+
+
+def _candidate(text, finish_reason):
+    candidate = {"content": {"parts": [{"text": text}], "role": "model"}}
+    if finish_reason:
+        candidate["finishReason"] = finish_reason
+    return {"candidates": [candidate]}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Answers generateContent with canned text after a configurable delay and failure rate.
+
+    streamGenerateContent sends the same text as server-sent events, a few
+    words per event.
+    """
+
+    latency = 0.2
+    error_rate = 0.0
+
+    def _send_json(self, status, body, headers=None):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        if not self.headers.get("x-goog-api-key"):
+            return self._send_json(401, {"error": {"code": 401, "message": "API key missing"}})
+        method = self.path.split("?", 1)[0].rsplit(":", 1)[-1]
+        if method not in ("generateContent", "streamGenerateContent"):
+            return self._send_json(404, {"error": {"code": 404, "message": "Unknown method"}})
+        time.sleep(random.uniform(0.5, 1.5) * self.latency)
+        if random.random() < self.error_rate:
+            status = random.choice([429, 503])
+            return self._send_json(status, {"error": {"code": status, "message": "Injected failure"}},
+                                   {"Retry-After": "1"} if status == 429 else None)
+        parts = payload.get("contents", [{}])[0].get("parts", [])
+        has_image = any("inline_data" in part for part in parts)
+        text = "Stub caption: surfaces appear clean and in good repair." if has_image else STUB_REPORT
+        if method == "generateContent":
+            return self._send_json(200, _candidate(text, "STOP"))
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        words = text.split(" ")
+        for start in range(0, len(words), 4):
+            chunk = " ".join(words[start:start + 4]) + (" " if start + 4 < len(words) else "")
+            done = start + 4 >= len(words)
+            self.wfile.write(b"data: " + json.dumps(_candidate(chunk, "STOP" if done else None)).encode("utf-8") + b"\r\n\r\n")
+            self.wfile.flush()
+            time.sleep(self.latency / 10)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(port=8787, latency=0.2, error_rate=0.0):
+    """Start the stub on a background thread and return the server"""
+    handler = type("ConfiguredStubHandler", (StubHandler,), {"latency": latency, "error_rate": error_rate})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def bench(base_url, requests_total, concurrency, requests_per_minute):
+    """Fire requests at base_url through GeminiClient and return its metrics"""
+    client = GeminiClient("stub-key", base_url=base_url, requests_per_minute=requests_per_minute,
+                          burst=concurrency, pool_size=concurrency)
+    payload = {"contents": [{"parts": [{"text": "ping"}]}]}
+
+    def one(_):
+        try:
+            return bool(extract_text(client.generate_content("models/stub", payload, timeout=10)))
+        except GeminiError:
+            return False
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        ok = sum(executor.map(one, range(requests_total)))
+    metrics = client.metrics()
+    metrics['completed'] = ok
+    metrics['elapsed_seconds'] = time.monotonic() - started
+    return metrics
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local Gemini generateContent stub")
+    parser.add_argument("--port", type=int, default=8787)
+    parser.add_argument("--latency", type=float, default=0.2, help="mean response delay in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of calls answered with 429/503")
+    parser.add_argument("--bench", type=int, default=0, help="run this many requests against the stub and exit")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--rpm", type=int, default=600, help="client rate limit used by --bench")
+    args = parser.parse_args()
+    server = serve(args.port, args.latency, args.error_rate)
+    base_url = f"http://127.0.0.1:{args.port}/v1beta"
+    if args.bench:
+        print(json.dumps(bench(base_url, args.bench, args.concurrency, args.rpm), indent=2))
+    else:
+        print(f"Gemini stub listening on {base_url}")
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            pass
+    server.shutdown()
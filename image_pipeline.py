@@ -0,0 +1,85 @@
+import io
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    from PIL import Image, ImageOps, UnidentifiedImageError
+    PIL_AVAILABLE = True
+except ImportError:
+    PIL_AVAILABLE = False
+
+# Longest edge of the stored photo and of its thumbnail, in pixels
+MAX_EDGE = 1600
+THUMBNAIL_EDGE = 320
+OUTPUT_FORMAT = "JPEG"  # or "WEBP"
+OUTPUT_QUALITY = 82
+
+MIME_TYPES = {"JPEG": "image/jpeg", "WEBP": "image/webp", "PNG": "image/png"}
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def sniff_mime_type(data):
+    """Guess an image MIME type from its magic bytes"""
+    if data[:8] == b'\x89PNG\r\n\x1a\n':
+        return "image/png"
+    if data[:2] == b'\xff\xd8':
+        return "image/jpeg"
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return "image/webp"
+    return "application/octet-stream"
+
+
+def _encode(image, max_edge):
+    image = image.copy()
+    image.thumbnail((max_edge, max_edge))
+    buffer = io.BytesIO()
+    image.save(buffer, format=OUTPUT_FORMAT, quality=OUTPUT_QUALITY, optimize=True)
+    return buffer.getvalue(), MIME_TYPES[OUTPUT_FORMAT], image.width, image.height
+
+
+def process_photo(data):
+    """Normalize one camera photo into size variants.
+
+    Returns {"full": (bytes, mime, width, height), "thumb": (...) or None}.
+    The full variant is bounded to MAX_EDGE and recompressed; without
+    Pillow, or for bytes Pillow cannot decode, the original bytes are
+    passed through and no thumbnail is made.
+    """
+    passthrough = {"full": (data, sniff_mime_type(data), None, None), "thumb": None}
+    if not PIL_AVAILABLE:
+        return passthrough
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            # Respect camera orientation, and drop alpha which JPEG can't hold
+            image = ImageOps.exif_transpose(image).convert("RGB")
+            return {"full": _encode(image, MAX_EDGE), "thumb": _encode(image, THUMBNAIL_EDGE)}
+    except (UnidentifiedImageError, OSError):
+        # Corrupt or truncated; keep it as uploaded rather than failing the whole batch
+        return passthrough
+
+
+def get_ingest_pool():
+    """Process pool shared by every session for photo ingest and PDF rendering, sized to the machine.
+
+    Workers are spawned rather than forked, since the pool is first used from
+    threads inside the already multi-threaded server process.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=max(1, min(4, os.cpu_count() or 1)),
+                                        mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def process_photos(photos):
+    """Process a batch of photos in parallel, preserving order"""
+    if not photos:
+        return []
+    if len(photos) == 1 or not PIL_AVAILABLE:
+        return [process_photo(data) for data in photos]
+    return list(get_ingest_pool().map(process_photo, photos))
@@ -0,0 +1,83 @@
+from datetime import date
+
+import streamlit as st
+
+from db_pool import get_conn
+from inspection_stats import INSPECTIONS_BY_BUILDING, INSPECTIONS_BY_TYPE, TOTAL, get_stats
+
+# Inspections are listed newest first by (sort date, id). Undated inspections
+# sort last; the same expression backs the seek indexes in schema.py.
+SORT_DATE = "COALESCE(i.inspection_date, DATE '0001-01-01')"
+PAGE_SIZE = 20
+
+
+def _where(building=None, inspector=None, inspection_type=None, date_filter=None, photos_only=False):
+    clauses, params = [], []
+    if building:
+        clauses.append("i.building = %s")
+        params.append(building)
+    if inspector:
+        # Case-insensitive equality (what the old ILIKE did) that can use the lower(inspector) index
+        clauses.append("lower(i.inspector) = lower(%s)")
+        params.append(inspector)
+    if inspection_type:
+        clauses.append("i.inspection_type = %s")
+        params.append(inspection_type)
+    if date_filter:
+        clauses.append(f"{SORT_DATE} = %s")
+        params.append(date_filter)
+    if photos_only:
+        clauses.append("""EXISTS (
+            SELECT 1 FROM inspection_items ii
+            JOIN inspection_item_photos p ON p.inspection_item_id = ii.id
+            WHERE ii.inspection_id = i.id)""")
+    return clauses, params
+
+
+def search_inspections(after=None, page_size=PAGE_SIZE, **filters):
+    """One page of inspections, newest first, using keyset (seek) pagination.
+
+    after is the cursor returned for the previous page. Returns
+    (rows, next_cursor) where rows are (id, building, inspection_date,
+    inspector, inspection_type) and next_cursor is None on the last page.
+    """
+    clauses, params = _where(**filters)
+    if after:
+        clauses.append(f"({SORT_DATE}, i.id) < (%s, %s)")
+        params.extend(after)
+    query = "SELECT i.id, i.building, i.inspection_date, i.inspector, i.inspection_type FROM inspections i"
+    if clauses:
+        query += " WHERE " + " AND ".join(clauses)
+    # Fetch one extra row to know whether another page exists
+    query += f" ORDER BY {SORT_DATE} DESC, i.id DESC LIMIT %s"
+    params.append(page_size + 1)
+    with get_conn() as conn:
+        cur = conn.cursor()
+        cur.execute(query, params)
+        rows = cur.fetchall()
+        cur.close()
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        last = rows[-1]
+        next_cursor = (last[2] or date.min, last[0])
+    return rows, next_cursor
+
+
+@st.cache_data(ttl=60, show_spinner=False)
+def count_inspections(**filters):
+    """Total matches for a filter set; single-dimension filters are read from the counters"""
+    active = {k: v for k, v in filters.items() if v}
+    if not active:
+        return get_stats().get(TOTAL, {}).get("inspections", 0)
+    if list(active) == ["building"]:
+        return get_stats().get(INSPECTIONS_BY_BUILDING, {}).get(active["building"], 0)
+    if list(active) == ["inspection_type"]:
+        return get_stats().get(INSPECTIONS_BY_TYPE, {}).get(active["inspection_type"], 0)
+    clauses, params = _where(**filters)
+    with get_conn() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT COUNT(*) FROM inspections i WHERE " + " AND ".join(clauses), params)
+        total = cur.fetchone()[0]
+        cur.close()
+    return total
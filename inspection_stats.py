@@ -0,0 +1,103 @@
+from collections import defaultdict
+
+import streamlit as st
+from psycopg2.extras import execute_values
+
+from db_pool import get_conn
+
+# Counter scopes kept in the inspection_counters table
+TOTAL = "total"
+INSPECTIONS_BY_TYPE = "inspections_by_type"
+INSPECTIONS_BY_BUILDING = "inspections_by_building"
+ITEMS_BY_TYPE = "items_by_type"
+ITEMS_BY_BUILDING = "items_by_building"
+
+COUNTERS_QUERY = """
+    SELECT 'total', 'inspections', COUNT(*) FROM inspections
+    UNION ALL SELECT 'total', 'items', COUNT(*) FROM inspection_items
+    UNION ALL SELECT 'total', 'photos', COUNT(*) FROM inspection_item_photos
+    UNION ALL SELECT 'inspections_by_type', COALESCE(inspection_type, ''), COUNT(*) FROM inspections GROUP BY 2
+    UNION ALL SELECT 'inspections_by_building', COALESCE(building, ''), COUNT(*) FROM inspections GROUP BY 2
+    UNION ALL SELECT 'items_by_type', COALESCE(i.inspection_type, ''), COUNT(*)
+        FROM inspection_items ii JOIN inspections i ON i.id = ii.inspection_id GROUP BY 2
+    UNION ALL SELECT 'items_by_building', COALESCE(i.building, ''), COUNT(*)
+        FROM inspection_items ii JOIN inspections i ON i.id = ii.inspection_id GROUP BY 2
+"""
+
+# Run by ensure_schema so counters exist before the first save adjusts them
+SEED_SQL = f"""
+    INSERT INTO inspection_counters (scope, name, value)
+    SELECT * FROM ({COUNTERS_QUERY}) AS counters
+    WHERE NOT EXISTS (SELECT 1 FROM inspection_counters)
+"""
+
+REFRESH_SQL = f"""
+    LOCK TABLE inspection_counters IN EXCLUSIVE MODE;
+    DELETE FROM inspection_counters;
+    INSERT INTO inspection_counters (scope, name, value) {COUNTERS_QUERY};
+"""
+
+
+class StatsDelta:
+    """Counter changes accumulated during one save, applied in a single statement"""
+
+    def __init__(self):
+        self.changes = defaultdict(int)
+
+    def add(self, scope, name, amount=1):
+        if amount:
+            self.changes[(scope, name or "")] += amount
+
+    def inspection_added(self, inspection_type, building, items):
+        self.add(TOTAL, "inspections", 1)
+        self.add(INSPECTIONS_BY_TYPE, inspection_type, 1)
+        self.add(INSPECTIONS_BY_BUILDING, building, 1)
+        self.add(ITEMS_BY_TYPE, inspection_type, items)
+        self.add(ITEMS_BY_BUILDING, building, items)
+        self.add(TOTAL, "items", items)
+
+    def inspection_moved(self, old_type, old_building, old_items, new_type, new_building, new_items):
+        """Record an edit: the inspection and its items leave the old type/building for the new one"""
+        self.add(INSPECTIONS_BY_TYPE, old_type, -1)
+        self.add(INSPECTIONS_BY_BUILDING, old_building, -1)
+        self.add(ITEMS_BY_TYPE, old_type, -old_items)
+        self.add(ITEMS_BY_BUILDING, old_building, -old_items)
+        self.add(INSPECTIONS_BY_TYPE, new_type, 1)
+        self.add(INSPECTIONS_BY_BUILDING, new_building, 1)
+        self.add(ITEMS_BY_TYPE, new_type, new_items)
+        self.add(ITEMS_BY_BUILDING, new_building, new_items)
+        self.add(TOTAL, "items", new_items - old_items)
+
+    def apply(self, cur):
+        """Upsert the accumulated deltas on the caller's cursor (same transaction)"""
+        rows = [(scope, name, amount) for (scope, name), amount in self.changes.items() if amount]
+        if not rows:
+            return False
+        execute_values(cur, """
+            INSERT INTO inspection_counters (scope, name, value) VALUES %s
+            ON CONFLICT (scope, name) DO UPDATE SET value = inspection_counters.value + EXCLUDED.value
+        """, rows)
+        return True
+
+
+def refresh_stats():
+    """Recompute every counter from the base tables (repair or scheduled refresh)"""
+    with get_conn() as conn:
+        cur = conn.cursor()
+        cur.execute(REFRESH_SQL)
+        cur.close()
+    get_stats.clear()
+
+
+@st.cache_data(ttl=60, show_spinner=False)
+def get_stats():
+    """Read all counters, e.g. get_stats()[TOTAL]["photos"] or get_stats()[ITEMS_BY_BUILDING]"""
+    with get_conn() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT scope, name, value FROM inspection_counters")
+        rows = cur.fetchall()
+        cur.close()
+    stats = defaultdict(dict)
+    for scope, name, value in rows:
+        stats[scope][name] = value
+    return dict(stats)
@@ -0,0 +1,245 @@
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import psycopg2
+import streamlit as st
+
+from db_pool import get_conn
+
+logger = logging.getLogger(__name__)
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+JOB_WORKERS = 4
+# Every process marks its running jobs alive this often and sweeps up orphaned ones
+HEARTBEAT_SECONDS = 30
+# A running job without a heartbeat for this long belongs to a dead process
+STALE_AFTER_SECONDS = 120
+INTERRUPTED = "Interrupted before it finished"
+# Finished jobs are kept this long so results can be picked up on a later visit
+KEEP_FINISHED_DAYS = 7
+# Partial output is written at most this often while a job streams
+OUTPUT_FLUSH_SECONDS = 0.5
+
+_handlers = {}
+
+
+class JobFailed(Exception):
+    """The job ended in the failed state; the message is the job's error"""
+
+
+def job_handler(kind):
+    """Register func(params, progress) as the handler for a job kind.
+
+    progress(fraction, message=None, output=None) records progress and
+    optionally the text produced so far. The return value becomes the
+    result: text is stored as the job output, bytes as the result file and
+    anything else as JSON.
+    """
+    def register(func):
+        _handlers[kind] = func
+        return func
+    return register
+
+
+class JobRunner:
+    """Runs jobs from the jobs table on a local thread pool"""
+
+    def __init__(self, max_workers=JOB_WORKERS):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._lock = threading.Lock()
+        # Ids handed to the executor but not yet started, and ids running here
+        self._pending = set()
+        self._running = set()
+        threading.Thread(target=self._heartbeat, name="job-heartbeat", daemon=True).start()
+
+    def _enqueue(self, job_id):
+        with self._lock:
+            if job_id in self._pending or job_id in self._running:
+                return
+            self._pending.add(job_id)
+        self.executor.submit(self._run, job_id)
+
+    def submit(self, kind, params, owner=None):
+        if kind not in _handlers:
+            raise ValueError(f"No handler registered for job kind {kind!r}")
+        with get_conn() as conn:
+            cur = conn.cursor()
+            cur.execute("INSERT INTO jobs (kind, params, owner) VALUES (%s, %s, %s) RETURNING id",
+                        (kind, json.dumps(params), owner))
+            job_id = cur.fetchone()[0]
+            cur.close()
+        self._enqueue(job_id)
+        return job_id
+
+    def _claim(self, job_id):
+        # Only one process wins the queued -> running transition
+        with get_conn() as conn:
+            cur = conn.cursor()
+            cur.execute("""
+                UPDATE jobs SET status = %s, started_at = now(), updated_at = now()
+                WHERE id = %s AND status = %s RETURNING kind, params
+            """, (RUNNING, job_id, QUEUED))
+            row = cur.fetchone()
+            cur.close()
+        return row
+
+    def _update(self, job_id, finished=False, **fields):
+        assignments = ", ".join(f"{name} = %s" for name in fields)
+        if finished:
+            assignments += ", finished_at = now()"
+        with get_conn() as conn:
+            cur = conn.cursor()
+            cur.execute(f"UPDATE jobs SET {assignments}, updated_at = now() WHERE id = %s",
+                        list(fields.values()) + [job_id])
+            cur.close()
+
+    def _run(self, job_id):
+        with self._lock:
+            self._pending.discard(job_id)
+            self._running.add(job_id)
+        try:
+            self._execute(job_id)
+        finally:
+            with self._lock:
+                self._running.discard(job_id)
+
+    def _execute(self, job_id):
+        claimed = self._claim(job_id)
+        if not claimed:
+            return
+        kind, params = claimed
+        last_flush = [0.0]
+
+        def progress(fraction, message=None, output=None):
+            now = time.monotonic()
+            if output is not None and message is None and now - last_flush[0] < OUTPUT_FLUSH_SECONDS:
+                return
+            last_flush[0] = now
+            fields = {"progress": fraction}
+            if message is not None:
+                fields["message"] = message
+            if output is not None:
+                fields["output"] = output
+            self._update(job_id, **fields)
+
+        try:
+            result = _handlers[kind](params, progress)
+        except Exception as e:
+            self._update(job_id, status=FAILED, error=str(e) or type(e).__name__, finished=True)
+            return
+        fields = {"status": DONE, "progress": 1.0}
+        if isinstance(result, str):
+            fields["output"] = result
+        elif isinstance(result, (bytes, bytearray)):
+            fields["result_file"] = psycopg2.Binary(bytes(result))
+        elif result is not None:
+            fields["result"] = json.dumps(result)
+        self._update(job_id, finished=True, **fields)
+
+    def recover(self):
+        """Fail jobs orphaned by a dead process, requeue the rest and purge old results.
+        
+        Runs at start-up and then every HEARTBEAT_SECONDS, so a worker that
+        dies later is noticed too; requeueing a job another process also
+        holds is harmless, since only one of them can claim it.
+        """
+        with self._lock:
+            running = list(self._running)
+        with get_conn() as conn:
+            cur = conn.cursor()
+            if running:
+                cur.execute("UPDATE jobs SET updated_at = now() WHERE id = ANY(%s) AND status = %s", (running, RUNNING))
+            cur.execute("""
+                UPDATE jobs SET status = %s, error = %s, finished_at = now()
+                WHERE status = %s AND updated_at < now() - make_interval(secs => %s)
+            """, (FAILED, INTERRUPTED, RUNNING, STALE_AFTER_SECONDS))
+            cur.execute("DELETE FROM jobs WHERE finished_at < now() - make_interval(days => %s)", (KEEP_FINISHED_DAYS,))
+            cur.execute("SELECT id FROM jobs WHERE status = %s ORDER BY id", (QUEUED,))
+            queued = [row[0] for row in cur.fetchall()]
+            cur.close()
+        for job_id in queued:
+            self._enqueue(job_id)
+
+    def _heartbeat(self):
+        while True:
+            time.sleep(HEARTBEAT_SECONDS)
+            try:
+                self.recover()
+            except Exception:
+                logger.exception("Job heartbeat failed")
+
+
+@st.cache_resource(show_spinner=False)
+def get_job_runner():
+    runner = JobRunner()
+    runner.recover()
+    return runner
+
+
+def submit_job(kind, params, owner=None):
+    """Queue a job and return its id; params must be JSON-serializable"""
+    return get_job_runner().submit(kind, params, owner)
+
+
+def job_status(job_id):
+    """Status dict for a job (without its result file), or None if it no longer exists.
+
+    A running job whose heartbeat has stopped is reported as failed straight
+    away, before the next sweep records it.
+    """
+    with get_conn() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT kind, status, progress, message, output, error, created_at, finished_at,
+                   updated_at < now() - make_interval(secs => %s)
+            FROM jobs WHERE id = %s
+        """, (STALE_AFTER_SECONDS, job_id))
+        row = cur.fetchone()
+        cur.close()
+    if not row:
+        return None
+    keys = ("kind", "status", "progress", "message", "output", "error", "created_at", "finished_at")
+    status = dict(zip(keys, row[:-1]), id=job_id)
+    if status["status"] == RUNNING and row[-1]:
+        status.update(status=FAILED, error=INTERRUPTED)
+    return status
+
+
+def job_result(job_id):
+    """Result of a finished job: its file bytes, JSON result or output text"""
+    with get_conn() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT status, error, result_file, result, output, updated_at < now() - make_interval(secs => %s)
+            FROM jobs WHERE id = %s
+        """, (STALE_AFTER_SECONDS, job_id))
+        row = cur.fetchone()
+        cur.close()
+    if not row:
+        return None
+    status, error, result_file, result, output, stale = row
+    if status == RUNNING and stale:
+        raise JobFailed(INTERRUPTED)
+    if status == FAILED:
+        raise JobFailed(error)
+    if status != DONE:
+        return None
+    if result_file is not None:
+        return bytes(result_file)
+    return result if result is not None else output
+
+
+def recent_jobs(limit=20):
+    with get_conn() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT id, kind, status, progress, message, error, owner, created_at, finished_at
+            FROM jobs ORDER BY id DESC LIMIT %s
+        """, (limit,))
+        rows = cur.fetchall()
+        cur.close()
+    return rows
@@ -0,0 +1,202 @@
+import hashlib
+import os
+import struct
+import tempfile
+import time
+
+import streamlit as st
+
+from image_pipeline import process_photos
+
+try:
+    import boto3
+    from botocore.exceptions import ClientError
+    BOTO3_AVAILABLE = True
+except ImportError:
+    BOTO3_AVAILABLE = False
+
+
+def image_dimensions(data):
+    """Read (width, height) from a PNG or JPEG header, or (None, None) if unknown"""
+    if data[:8] == b'\x89PNG\r\n\x1a\n' and len(data) >= 24:
+        return struct.unpack('>II', data[16:24])
+    if data[:2] == b'\xff\xd8':
+        pos = 2
+        while pos + 9 < len(data):
+            if data[pos] != 0xFF:
+                pos += 1
+                continue
+            marker = data[pos + 1]
+            if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+                pos += 2
+                continue
+            length = struct.unpack('>H', data[pos + 2:pos + 4])[0]
+            # SOF markers carry the frame size (C4, C8 and CC are not frames)
+            if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+                height, width = struct.unpack('>HH', data[pos + 5:pos + 9])
+                return width, height
+            pos += 2 + length
+    return None, None
+
+
+class LocalBlobStore:
+    """Content-addressed photo store on local disk, keyed by SHA-256"""
+
+    def __init__(self, root="photo_store"):
+        self.root = root
+        os.makedirs(self.root, exist_ok=True)
+
+    def path(self, digest):
+        # Two levels of fan-out keep directories small
+        return os.path.join(self.root, digest[:2], digest[2:4], digest)
+
+    def put(self, data):
+        """Store bytes and return their digest; identical content is written once"""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.path(digest)
+        try:
+            # A re-referenced blob restarts prune_unreferenced's grace period
+            os.utime(path)
+            return digest
+        except FileNotFoundError:
+            pass
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return digest
+
+    def get(self, digest):
+        with open(self.path(digest), 'rb') as f:
+            return f.read()
+
+    def open(self, digest):
+        """File object for streaming a blob"""
+        return open(self.path(digest), 'rb')
+
+    def exists(self, digest):
+        return os.path.exists(self.path(digest))
+
+    def delete(self, digest):
+        try:
+            os.remove(self.path(digest))
+        except FileNotFoundError:
+            pass
+
+    def digests(self):
+        """Yield (digest, modified timestamp) for every stored blob"""
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                if not filename.endswith('.tmp'):
+                    yield filename, os.path.getmtime(os.path.join(dirpath, filename))
+
+
+class S3BlobStore:
+    """Same interface as LocalBlobStore, backed by an S3-compatible bucket"""
+
+    def __init__(self, bucket, prefix="photos/", endpoint_url=None, **client_kwargs):
+        if not BOTO3_AVAILABLE:
+            raise ImportError("boto3 is not available. Please install with: pip install boto3")
+        self.bucket = bucket
+        self.prefix = prefix
+        self.client = boto3.client("s3", endpoint_url=endpoint_url, **client_kwargs)
+
+    def key(self, digest):
+        return f"{self.prefix}{digest[:2]}/{digest}"
+
+    def put(self, data):
+        digest = hashlib.sha256(data).hexdigest()
+        if self.exists(digest):
+            # Copying the object onto itself refreshes LastModified, restarting the prune grace period
+            self.client.copy_object(Bucket=self.bucket, Key=self.key(digest), MetadataDirective="REPLACE",
+                                    CopySource={"Bucket": self.bucket, "Key": self.key(digest)})
+        else:
+            self.client.put_object(Bucket=self.bucket, Key=self.key(digest), Body=data)
+        return digest
+
+    def get(self, digest):
+        return self.client.get_object(Bucket=self.bucket, Key=self.key(digest))["Body"].read()
+
+    def open(self, digest):
+        return self.client.get_object(Bucket=self.bucket, Key=self.key(digest))["Body"]
+
+    def exists(self, digest):
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self.key(digest))
+            return True
+        except ClientError:
+            return False
+
+    def delete(self, digest):
+        self.client.delete_object(Bucket=self.bucket, Key=self.key(digest))
+
+    def digests(self):
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self.prefix):
+            for obj in page.get("Contents", []):
+                yield obj["Key"].rsplit("/", 1)[-1], obj["LastModified"].timestamp()
+
+
+@st.cache_resource(show_spinner=False)
+def get_photo_store():
+    """Blob store configured by the [photos] secrets (local directory by default)"""
+    config = st.secrets.get("photos", {})
+    if config.get("store", "local") == "s3":
+        return S3BlobStore(
+            bucket=config["bucket"],
+            prefix=config.get("prefix", "photos/"),
+            endpoint_url=config.get("endpoint_url"),
+            aws_access_key_id=config.get("access_key_id"),
+            aws_secret_access_key=config.get("secret_access_key"),
+        )
+    return LocalBlobStore(config.get("path", "photo_store"))
+
+
+def store_photos(photos):
+    """Normalize a batch of photos and write their variants to the blob store.
+
+    Returns one (sha256, size, width, height, mime_type, thumb_sha256) tuple
+    per photo, in order.
+    """
+    store = get_photo_store()
+    stored = []
+    for original, variants in zip(photos, process_photos(photos)):
+        data, mime_type, width, height = variants["full"]
+        if width is None:
+            width, height = image_dimensions(data)
+        thumb_digest = store.put(variants["thumb"][0]) if variants["thumb"] else None
+        stored.append((store.put(data), len(data), width, height, mime_type, thumb_digest))
+    return stored
+
+
+def store_photo(data):
+    return store_photos([data])[0]
+
+
+def read_photo(digest):
+    return get_photo_store().get(digest)
+
+
+def prune_unreferenced(referenced_digests, grace_seconds=3600):
+    """Delete blobs no photo row points at any more; returns how many were removed.
+
+    Blobs are written before the saving transaction commits, so recent ones
+    are kept for grace_seconds even when nothing references them yet.
+    """
+    store = get_photo_store()
+    referenced = set(referenced_digests)
+    cutoff = time.time() - grace_seconds
+    removed = 0
+    for digest, modified in list(store.digests()):
+        if digest not in referenced and modified < cutoff:
+            store.delete(digest)
+            removed += 1
+    return removed
@@ -0,0 +1,53 @@
+import streamlit as st
+
+from db_pool import get_conn
+
+# How long building/inspector lists are served from cache before re-reading
+REFERENCE_TTL_SECONDS = 600
+
+
+@st.cache_data(ttl=REFERENCE_TTL_SECONDS, show_spinner=False)
+def get_buildings():
+    """Buildings that have inspections, from the building_lookup table"""
+    with get_conn() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT name FROM building_lookup ORDER BY name")
+        buildings = [row[0] for row in cur.fetchall() if row[0]]
+        cur.close()
+    return buildings
+
+
+@st.cache_data(ttl=REFERENCE_TTL_SECONDS, show_spinner=False)
+def get_inspectors():
+    """Inspectors that have inspections, from the inspector_lookup table"""
+    with get_conn() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT name FROM inspector_lookup ORDER BY name")
+        inspectors = [row[0] for row in cur.fetchall() if row[0]]
+        cur.close()
+    return inspectors
+
+
+def record_reference_data(cur, building, inspector):
+    """Add a saved inspection's building and inspector to the lookup tables.
+
+    Runs on the caller's cursor so it commits with the inspection. Returns
+    True when either value was new, meaning the caches need invalidating.
+    """
+    cur.execute("""
+        WITH new_building AS (
+            INSERT INTO building_lookup (name) SELECT %(building)s WHERE COALESCE(%(building)s, '') <> ''
+            ON CONFLICT DO NOTHING RETURNING 1
+        ), new_inspector AS (
+            INSERT INTO inspector_lookup (name) SELECT %(inspector)s WHERE COALESCE(%(inspector)s, '') <> ''
+            ON CONFLICT DO NOTHING RETURNING 1
+        )
+        SELECT (SELECT COUNT(*) FROM new_building) + (SELECT COUNT(*) FROM new_inspector)
+    """, {"building": building, "inspector": inspector})
+    return cur.fetchone()[0] > 0
+
+
+def invalidate_reference_data():
+    """Drop cached building and inspector lists for every session"""
+    get_buildings.clear()
+    get_inspectors.clear()
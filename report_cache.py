@@ -0,0 +1,95 @@
+import hashlib
+import json
+import threading
+
+from db_pool import get_conn
+
+_metrics_lock = threading.Lock()
+_metrics = {'hits': 0, 'misses': 0, 'stores': 0}
+
+
+def _photo_fingerprint(photo):
+    if isinstance(photo, int):
+        return f"id:{photo}"
+    if isinstance(photo, str):
+        # Photos parked in the blob store are already named by their SHA-256
+        return photo
+    data = photo.getvalue() if hasattr(photo, 'getvalue') else bytes(photo)
+    return hashlib.sha256(data).hexdigest()
+
+
+def findings_key(inspection_type, building, findings, model):
+    """Stable hash of everything that shapes an AI report.
+
+    Items nobody rated or commented on are dropped, notes are trimmed and
+    items are sorted, so reordering or resubmitting the same form maps to
+    the same key.
+    """
+    normalized = []
+    for finding in findings:
+        category, item, rating, notes = finding[:4]
+        photos = finding[4] if len(finding) > 4 else []
+        if not isinstance(photos, (list, tuple)):
+            photos = [photos] if photos else []
+        rating = rating if rating and rating != "Select" else ""
+        notes = (notes or "").strip()
+        if not rating and not notes and not photos:
+            continue
+        normalized.append([category or "", item, rating, notes, [_photo_fingerprint(p) for p in photos if p]])
+    normalized.sort()
+    payload = json.dumps({
+        "type": (inspection_type or "").lower(),
+        "building": building or "",
+        "model": model,
+        "findings": normalized,
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _count(name):
+    with _metrics_lock:
+        _metrics[name] += 1
+
+
+def lookup_report(key, record_hit=True):
+    """Cached report text for a findings key, or None"""
+    with get_conn() as conn:
+        cur = conn.cursor()
+        if record_hit:
+            cur.execute("""
+                UPDATE ai_report_cache SET hits = hits + 1, last_hit_at = now()
+                WHERE cache_key = %s RETURNING report
+            """, (key,))
+        else:
+            cur.execute("SELECT report FROM ai_report_cache WHERE cache_key = %s", (key,))
+        row = cur.fetchone()
+        cur.close()
+    if record_hit:
+        _count('hits' if row else 'misses')
+    return row[0] if row else None
+
+
+def store_report(key, inspection_type, model, report):
+    with get_conn() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            INSERT INTO ai_report_cache (cache_key, inspection_type, model, report)
+            VALUES (%s, %s, %s, %s)
+            ON CONFLICT (cache_key) DO UPDATE SET report = EXCLUDED.report, created_at = now()
+        """, (key, inspection_type, model, report))
+        cur.close()
+    _count('stores')
+
+
+def cache_metrics():
+    """Hit/miss counters for this process plus the persisted hit totals"""
+    with _metrics_lock:
+        metrics = dict(_metrics)
+    lookups = metrics['hits'] + metrics['misses']
+    metrics['hit_rate'] = metrics['hits'] / lookups if lookups else 0.0
+    with get_conn() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT COUNT(*), COALESCE(SUM(hits), 0) FROM ai_report_cache")
+        metrics['cached_reports'], metrics['lifetime_hits'] = cur.fetchone()
+        cur.close()
+    return metrics
@@ -1,19 +1,64 @@
+import glob
+import os
+import tempfile
+import time
+import zipfile
 import pandas as pd
 import streamlit as st
-from io import BytesIO
 from collections import defaultdict
+from concurrent.futures import as_completed
 from fpdf import FPDF
 
-def format_items_table(items_data):
-    # Group items by category, always include all items
-    grouped = defaultdict(list)
-    for cat, name, rating, notes in items_data:
-        grouped[cat].append((name if name is not None else "", rating if rating is not None else "", notes if notes is not None else ""))
-    # Render tables for each category
-    for cat, items in grouped.items():
-        st.markdown(f"**{cat}**")
-        df = pd.DataFrame(items, columns=["Item", "Rank", "Comments"])
-        st.table(df)
+from image_pipeline import get_ingest_pool
+
+try:
+    from pypdf import PdfWriter
+    PYPDF_AVAILABLE = True
+except ImportError:
+    PYPDF_AVAILABLE = False
+
+# Bump when the PDF layout changes so cached exports are re-rendered
+PDF_LAYOUT_VERSION = 2
+PDF_CACHE_DIR = "pdf_cache"
+BUNDLE_DIR = os.path.join(PDF_CACHE_DIR, "bundles")
+# Batch exports are rebuilt on demand, so old bundles are only kept long enough to download
+BUNDLE_KEEP_HOURS = 24
+# Share of the printable width given to each table column
+TABLE_COLUMNS = (("Item", 0.35), ("Rank", 0.12), ("Comments", 0.53))
+# Core PDF fonts only cover latin-1; map the usual typographic characters first
+LATIN1_SUBSTITUTIONS = {
+    "\u2018": "'", "\u2019": "'", "\u201c": '"', "\u201d": '"', "\u2013": "-", "\u2014": "-",
+    "\u2022": "-", "\u2026": "...", "\u00a0": " ",
+}
+
+def latin1(text):
+    """Text made safe for the core PDF fonts"""
+    text = "".join(LATIN1_SUBSTITUTIONS.get(ch, ch) for ch in str(text))
+    return text.encode("latin-1", "replace").decode("latin-1")
+
+ITEMS_TABLE_COLUMNS = ["Category", "Item", "Rank", "Comments"]
+
+def items_frame(items_data):
+    """One DataFrame for all items, grouped by category in first-seen order"""
+    df = pd.DataFrame(list(items_data), columns=ITEMS_TABLE_COLUMNS).fillna("")
+    order = pd.unique(df["Category"])
+    df["Category"] = pd.Categorical(df["Category"], categories=order, ordered=True)
+    return df.sort_values("Category", kind="stable").reset_index(drop=True)
+
+@st.cache_data(max_entries=256, show_spinner=False)
+def _cached_items_frame(version_key, _items_data):
+    # Keyed by (inspection id, version) so the items themselves are never hashed
+    return items_frame(_items_data)
+
+def format_items_table(items_data, version_key=None):
+    """Render items as a single grouped table.
+
+    version_key, typically (inspection id, version), memoizes the frame
+    across reruns; without it the frame is rebuilt each time.
+    """
+    df = _cached_items_frame(version_key, items_data) if version_key else items_frame(items_data)
+    st.dataframe(df, hide_index=True, use_container_width=True)
+    return df
 
 # PDF generation utility
 class PDF(FPDF):
@@ -25,29 +70,59 @@ class PDF(FPDF):
         self.set_font('Arial', 'B', 12)
         self.cell(0, 8, title, 0, 1, 'L')
         self.ln(2)
+    def _wrap(self, text, width):
+        """Split text into lines that fit a cell of the given width"""
+        usable = width - 2 * self.c_margin
+        lines = []
+        for paragraph in latin1(text).split("\n"):
+            line = ""
+            for word in paragraph.split(" "):
+                candidate = f"{line} {word}" if line else word
+                if self.get_string_width(candidate) <= usable:
+                    line = candidate
+                    continue
+                if line:
+                    lines.append(line)
+                # Break words longer than the cell
+                while self.get_string_width(word) > usable and len(word) > 1:
+                    cut = len(word)
+                    while cut > 1 and self.get_string_width(word[:cut]) > usable:
+                        cut -= 1
+                    lines.append(word[:cut])
+                    word = word[cut:]
+                line = word
+            lines.append(line)
+        return lines
+    def table_row(self, values, widths, line_height=6):
+        cells = [self._wrap(value, width) for value, width in zip(values, widths)]
+        height = line_height * max(len(lines) for lines in cells)
+        if self.get_y() + height > self.page_break_trigger:
+            self.add_page()
+        x, y = self.l_margin, self.get_y()
+        for lines, width in zip(cells, widths):
+            self.rect(x, y, width, height)
+            self.set_xy(x, y)
+            self.multi_cell(width, line_height, "\n".join(lines), 0, 'L')
+            x += width
+        self.set_xy(self.l_margin, y + height)
     def section_table(self, cat, items):
+        widths = [(self.w - self.l_margin - self.r_margin) * share for _, share in TABLE_COLUMNS]
         self.set_font('Arial', 'B', 11)
-        self.cell(0, 7, cat, 0, 1, 'L')
+        self.cell(0, 7, latin1(cat), 0, 1, 'L')
         self.set_font('Arial', '', 10)
-        self.cell(60, 6, 'Item', 1)
-        self.cell(20, 6, 'Rank', 1)
-        self.cell(90, 6, 'Comments', 1)
-        self.ln()
+        self.table_row([title for title, _ in TABLE_COLUMNS], widths)
         for name, rating, notes in items:
-            self.cell(60, 6, str(name), 1)
-            self.cell(20, 6, str(rating), 1)
-            self.cell(90, 6, str(notes), 1)
-            self.ln()
+            self.table_row([name or "", rating or "", notes or ""], widths)
         self.ln(2)
 
-def generate_pdf_report(building, inspection_date, inspector, inspection_type, items_data, ai_report=None):
+def build_pdf(building, inspection_date, inspector, inspection_type, items_data, ai_report=None):
     pdf = PDF()
     pdf.add_page()
     pdf.set_font('Arial', '', 12)
-    pdf.cell(0, 8, f"Building: {building}", 0, 1)
-    pdf.cell(0, 8, f"Inspection Type: {inspection_type}", 0, 1)
-    pdf.cell(0, 8, f"Date: {inspection_date}", 0, 1)
-    pdf.cell(0, 8, f"Inspector: {inspector}", 0, 1)
+    pdf.cell(0, 8, latin1(f"Building: {building}"), 0, 1)
+    pdf.cell(0, 8, latin1(f"Inspection Type: {inspection_type}"), 0, 1)
+    pdf.cell(0, 8, latin1(f"Date: {inspection_date}"), 0, 1)
+    pdf.cell(0, 8, latin1(f"Inspector: {inspector}"), 0, 1)
     pdf.ln(4)
     pdf.section_title('Ratings & Notes')
     grouped = defaultdict(list)
@@ -58,6 +133,99 @@ def generate_pdf_report(building, inspection_date, inspector, inspection_type, i
     if ai_report:
         pdf.section_title('AI Summary')
         pdf.set_font('Arial', '', 10)
-        pdf.multi_cell(0, 6, ai_report)
-    pdf_bytes = pdf.output(dest='S').encode('latin1')
-    return BytesIO(pdf_bytes)
+        pdf.multi_cell(0, 6, latin1(ai_report))
+    return pdf
+
+# Batch export
+def pdf_cache_path(inspection_id, version, cache_dir=PDF_CACHE_DIR):
+    return os.path.join(cache_dir, f"{inspection_id}-v{version}-l{PDF_LAYOUT_VERSION}.pdf")
+
+def render_pdf_file(inspection, path):
+    """Render one inspection dict straight to path, replacing it atomically"""
+    pdf = build_pdf(inspection["building"], inspection["inspection_date"], inspection["inspector"],
+                    inspection["inspection_type"], inspection["items"], inspection.get("ai_report"))
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    os.close(fd)
+    try:
+        pdf.output(tmp_path, 'F')
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return path
+
+def export_pdfs(inspections, cache_dir=PDF_CACHE_DIR, progress=None):
+    """Render PDFs for many inspections, reusing cached files; returns their paths in order.
+
+    Each inspection is a dict with id, version, building, inspection_date,
+    inspector, inspection_type, ai_report and items as (category, item,
+    rating, notes) tuples. Files are cached by id, version and layout, so
+    only new or edited inspections are rendered, spread over the shared
+    process pool. progress(done, total) is called as files become available.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    paths = [pdf_cache_path(i["id"], i["version"], cache_dir) for i in inspections]
+    pending = [(i, path) for i, path in zip(inspections, paths) if not os.path.exists(path)]
+    total, done = len(paths), len(paths) - len(pending)
+    if progress:
+        progress(done, total)
+    if not pending:
+        return paths
+    for inspection, path in pending:
+        # Older versions of an edited inspection are superseded
+        for stale in glob.glob(os.path.join(cache_dir, f"{inspection['id']}-v*.pdf")):
+            if stale != path:
+                os.remove(stale)
+    if len(pending) == 1:
+        render_pdf_file(*pending[0])
+    else:
+        pool = get_ingest_pool()
+        futures = [pool.submit(render_pdf_file, inspection, path) for inspection, path in pending]
+        for future in as_completed(futures):
+            future.result()
+            done += 1
+            if progress:
+                progress(done, total)
+    return paths
+
+def prune_bundles(bundle_dir=BUNDLE_DIR, keep_hours=BUNDLE_KEEP_HOURS):
+    """Delete bundles older than keep_hours; returns how many were removed"""
+    if not os.path.isdir(bundle_dir):
+        return 0
+    cutoff = time.time() - keep_hours * 3600
+    removed = 0
+    for entry in os.scandir(bundle_dir):
+        if entry.is_file() and entry.stat().st_mtime < cutoff:
+            try:
+                os.remove(entry.path)
+                removed += 1
+            except FileNotFoundError:
+                pass
+    return removed
+
+def bundle_pdfs(files, dest, merge=False):
+    """Write [(path, name)] PDFs into one zip (or one merged PDF with pypdf) at dest"""
+    os.makedirs(os.path.dirname(dest) or ".", exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(dest) or ".", suffix='.tmp')
+    os.close(fd)
+    try:
+        if merge:
+            if not PYPDF_AVAILABLE:
+                raise ImportError("pypdf is not available. Please install with: pip install pypdf")
+            writer = PdfWriter()
+            for path, _ in files:
+                writer.append(path)
+            with open(tmp_path, 'wb') as f:
+                writer.write(f)
+        else:
+            # PDFs are already compressed; storing them keeps bundling I/O-bound
+            with zipfile.ZipFile(tmp_path, 'w', zipfile.ZIP_STORED) as bundle:
+                for path, name in files:
+                    bundle.write(path, name)
+        os.replace(tmp_path, dest)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return dest
@@ -0,0 +1,129 @@
+import streamlit as st
+
+from checklists import seed_checklists
+from db_pool import get_conn
+from inspection_stats import SEED_SQL as STATS_SEED_SQL
+
+# Idempotent DDL applied once per process, in order; callables are given the cursor
+SCHEMA_STATEMENTS = [
+    # Set-based loaders filter items and photos by their parent id
+    "CREATE INDEX IF NOT EXISTS idx_inspection_items_inspection_id ON inspection_items (inspection_id)",
+    "CREATE INDEX IF NOT EXISTS idx_inspection_item_photos_item_id ON inspection_item_photos (inspection_item_id)",
+    # Reference data read by the building/inspector pickers instead of DISTINCT scans,
+    # seeded from existing inspections the first time
+    "CREATE TABLE IF NOT EXISTS building_lookup (name TEXT PRIMARY KEY)",
+    "CREATE TABLE IF NOT EXISTS inspector_lookup (name TEXT PRIMARY KEY)",
+    """INSERT INTO building_lookup (name)
+       SELECT DISTINCT building FROM inspections WHERE building IS NOT NULL AND building <> ''
+       AND NOT EXISTS (SELECT 1 FROM building_lookup)
+       ON CONFLICT DO NOTHING""",
+    """INSERT INTO inspector_lookup (name)
+       SELECT DISTINCT inspector FROM inspections WHERE inspector IS NOT NULL AND inspector <> ''
+       AND NOT EXISTS (SELECT 1 FROM inspector_lookup)
+       ON CONFLICT DO NOTHING""",
+    # Maintained counters read by the sidebar and dashboards instead of COUNT(*) scans
+    """CREATE TABLE IF NOT EXISTS inspection_counters (
+           scope TEXT NOT NULL,
+           name TEXT NOT NULL,
+           value BIGINT NOT NULL DEFAULT 0,
+           PRIMARY KEY (scope, name)
+       )""",
+    STATS_SEED_SQL,
+    # Keyset pagination seeks on (sort date, id), optionally behind an equality filter;
+    # the date expression must match inspection_search.SORT_DATE
+    "CREATE INDEX IF NOT EXISTS idx_inspections_seek ON inspections ((COALESCE(inspection_date, DATE '0001-01-01')) DESC, id DESC)",
+    "CREATE INDEX IF NOT EXISTS idx_inspections_building_seek ON inspections (building, (COALESCE(inspection_date, DATE '0001-01-01')) DESC, id DESC)",
+    "CREATE INDEX IF NOT EXISTS idx_inspections_type_seek ON inspections (inspection_type, (COALESCE(inspection_date, DATE '0001-01-01')) DESC, id DESC)",
+    "CREATE INDEX IF NOT EXISTS idx_inspections_inspector_seek ON inspections (lower(inspector), (COALESCE(inspection_date, DATE '0001-01-01')) DESC, id DESC)",
+    # Photo bytes live in the blob store (photo_store.py); rows keep the hash and metadata
+    """ALTER TABLE inspection_item_photos
+           ADD COLUMN IF NOT EXISTS sha256 TEXT,
+           ADD COLUMN IF NOT EXISTS size_bytes INTEGER,
+           ADD COLUMN IF NOT EXISTS width INTEGER,
+           ADD COLUMN IF NOT EXISTS height INTEGER,
+           ADD COLUMN IF NOT EXISTS mime_type TEXT,
+           ADD COLUMN IF NOT EXISTS thumb_sha256 TEXT""",
+    "ALTER TABLE inspection_item_photos ALTER COLUMN photo DROP NOT NULL",
+    "CREATE INDEX IF NOT EXISTS idx_inspection_item_photos_sha256 ON inspection_item_photos (sha256)",
+    "CREATE INDEX IF NOT EXISTS idx_inspection_item_photos_thumb_sha256 ON inspection_item_photos (thumb_sha256)",
+    # AI reports are saved with the inspection and cached by a hash of the findings (report_cache.py)
+    "ALTER TABLE inspections ADD COLUMN IF NOT EXISTS ai_report TEXT",
+    # Bumped on every edit; exported PDFs are cached per (id, version)
+    "ALTER TABLE inspections ADD COLUMN IF NOT EXISTS version INTEGER NOT NULL DEFAULT 1",
+    """CREATE TABLE IF NOT EXISTS ai_report_cache (
+           cache_key TEXT PRIMARY KEY,
+           inspection_type TEXT,
+           model TEXT NOT NULL,
+           report TEXT NOT NULL,
+           created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+           hits INTEGER NOT NULL DEFAULT 0,
+           last_hit_at TIMESTAMPTZ
+       )""",
+    # Durable queue for work run off the script thread (see jobs.py)
+    """CREATE TABLE IF NOT EXISTS jobs (
+           id BIGSERIAL PRIMARY KEY,
+           kind TEXT NOT NULL,
+           status TEXT NOT NULL DEFAULT 'queued',
+           params JSONB NOT NULL DEFAULT '{}',
+           owner TEXT,
+           progress REAL NOT NULL DEFAULT 0,
+           message TEXT,
+           output TEXT,
+           result JSONB,
+           result_file BYTEA,
+           error TEXT,
+           created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+           started_at TIMESTAMPTZ,
+           updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+           finished_at TIMESTAMPTZ
+       )""",
+    "CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status) WHERE status IN ('queued', 'running')",
+    # Versioned checklists: items get stable ids that survive across versions (see checklists.py)
+    """CREATE TABLE IF NOT EXISTS checklist_items (
+           id SERIAL PRIMARY KEY,
+           inspection_type TEXT NOT NULL,
+           category TEXT NOT NULL,
+           name TEXT NOT NULL,
+           UNIQUE (inspection_type, category, name)
+       )""",
+    """CREATE TABLE IF NOT EXISTS checklist_versions (
+           inspection_type TEXT NOT NULL,
+           version INTEGER NOT NULL,
+           item_ids INTEGER[] NOT NULL,
+           created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+           PRIMARY KEY (inspection_type, version)
+       )""",
+    seed_checklists,
+    "ALTER TABLE inspections ADD COLUMN IF NOT EXISTS checklist_version INTEGER",
+    "ALTER TABLE inspection_items ADD COLUMN IF NOT EXISTS checklist_item_id INTEGER REFERENCES checklist_items (id)",
+    "CREATE TABLE IF NOT EXISTS schema_migrations (name TEXT PRIMARY KEY, applied_at TIMESTAMPTZ NOT NULL DEFAULT now())",
+]
+
+# One-off data migrations, applied once per database (recorded in schema_migrations) after the DDL above
+MIGRATIONS = [
+    # Link items saved before checklists were versioned to their checklist item ids
+    ("backfill_checklist_item_ids", """
+        UPDATE inspection_items ii SET checklist_item_id = ci.id
+        FROM inspections i, checklist_items ci
+        WHERE ii.checklist_item_id IS NULL AND ii.inspection_id = i.id
+        AND ci.inspection_type = i.inspection_type AND ci.category = COALESCE(ii.category, '') AND ci.name = ii.item"""),
+]
+
+
+@st.cache_resource(show_spinner=False)
+def ensure_schema():
+    """Create the tables and indexes the app relies on if they don't exist"""
+    with get_conn() as conn:
+        cur = conn.cursor()
+        for statement in SCHEMA_STATEMENTS:
+            if callable(statement):
+                statement(cur)
+            else:
+                cur.execute(statement)
+        for name, statement in MIGRATIONS:
+            # The insert claims the migration; a concurrent process waits on it and then skips
+            cur.execute("INSERT INTO schema_migrations (name) VALUES (%s) ON CONFLICT DO NOTHING RETURNING name", (name,))
+            if cur.fetchone():
+                cur.execute(statement)
+        cur.close()
+    return True
@@ -0,0 +1,134 @@
+import math
+import os
+import sys
+import threading
+import types
+
+import pytest
+
+st = pytest.importorskip("streamlit")
+
+
+class FakeCursor:
+    """Stands in for a pyodbc cursor and records every call the bulk path makes"""
+
+    def __init__(self):
+        self.calls = []
+        self.input_sizes = []
+        self.fast_executemany = False
+        self._rows = []
+
+    def execute(self, sql, params=()):
+        self.calls.append(("execute", sql))
+        if "MERGE Inspections" in sql:
+            # Seven parameters per inspection; hand back ids in reverse to check the RowNum mapping
+            count = len(params) // 7
+            self._rows = [(row_num, 1000 + row_num) for row_num in reversed(range(count))]
+        return self
+
+    def executemany(self, sql, rows):
+        self.calls.append(("executemany", sql, len(rows)))
+
+    def setinputsizes(self, sizes):
+        self.input_sizes.append(sizes)
+
+    def fetchall(self):
+        return self._rows
+
+    def close(self):
+        pass
+
+
+class NoSecrets:
+    """st.secrets as it behaves without a secrets.toml"""
+
+    def get(self, *args):
+        raise FileNotFoundError("No secrets found")
+
+    __getitem__ = get
+
+
+class FakeConnection:
+    def __init__(self):
+        self.cursors = []
+        self.commits = 0
+        self.closed = False
+
+    def cursor(self):
+        self.cursors.append(FakeCursor())
+        return self.cursors[-1]
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def database(monkeypatch):
+    connections = []
+    fake = types.SimpleNamespace(
+        connect=lambda connection_string: connections.append(FakeConnection()) or connections[-1],
+        Error=Exception, SQL_INTEGER=4, SQL_VARCHAR=12, SQL_WVARCHAR=-9,
+    )
+    monkeypatch.syspath_prepend(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    monkeypatch.setitem(sys.modules, "pyodbc", fake)
+    monkeypatch.setattr(st, "secrets", NoSecrets())
+    monkeypatch.delitem(sys.modules, "database", raising=False)
+    import database
+    monkeypatch.setattr(database, "_pools", {})
+    return database.InspectionDatabase("fake"), connections
+
+
+def sample(count, items=30):
+    return [{
+        'type': 'custodial', 'building': 'Test Hall', 'date': '2025-01-01', 'inspector': 'tester',
+        'details': [{'category': 'C', 'item': f'Item {i}', 'rating': f'Level {i % 5 + 1}', 'notes': 'n' * 5000}
+                    for i in range(items)]
+    } for _ in range(count)]
+
+
+@pytest.mark.parametrize("count", [1, 10, 250, 600])
+def test_statements_per_chunk_are_constant(database, count):
+    db, connections = database
+    ok, ids = db.save_inspections(sample(count))
+    assert ok
+    chunks = math.ceil(count / 250)
+    cursor = connections[-1].cursors[-1]
+    assert db.last_save_stats['statements'] == len(cursor.calls) == 3 * chunks
+    assert [call[0] for call in cursor.calls] == ["execute", "executemany", "execute"] * chunks
+    # Every detail of a chunk goes through one array-bound executemany
+    assert sum(call[2] for call in cursor.calls if call[0] == "executemany") == count * 30
+    assert connections[-1].commits == 1
+
+
+def test_ids_follow_input_order_and_notes_are_bound_as_max(database):
+    db, connections = database
+    ok, ids = db.save_inspections(sample(3))
+    assert ok and ids == [1000, 1001, 1002]
+    cursor = connections[-1].cursors[-1]
+    assert cursor.fast_executemany
+    assert cursor.input_sizes and cursor.input_sizes[0][-1][1] == 0
+
+
+def test_pooled_connections_are_reused_across_threads(database):
+    db, connections = database
+    pooled = type(db)("fake", pooled=True, max_connections=2)
+
+    def save():
+        assert pooled.save_inspections(sample(1))[0]
+
+    # Streamlit runs every rerun on a new thread
+    for _ in range(5):
+        thread = threading.Thread(target=save)
+        thread.start()
+        thread.join()
+    assert len(connections) == 1
+    pooled.close()
+    assert connections[0].closed
+    save()
+    assert len(connections) == 2 and not connections[1].closed
@@ -0,0 +1,22 @@
+import streamlit as st
+
+# Session-state entry mapping a form instance to the widget keys it created
+REGISTRY_KEY = "_widget_registry"
+
+
+def widget_key(form, key):
+    """Record that a form instance created a widget (or state) key and return the key"""
+    st.session_state.setdefault(REGISTRY_KEY, {}).setdefault(form, set()).add(key)
+    return key
+
+
+def clear_form_state(*forms):
+    """Forget the state of every key recorded for the given form instances, or for all of them.
+
+    Only keys the forms actually created are touched, so the cost follows
+    what was rendered rather than the size of the checklists.
+    """
+    registry = st.session_state.get(REGISTRY_KEY, {})
+    for form in forms or list(registry):
+        for key in registry.pop(form, ()):
+            st.session_state.pop(key, None)